@@ -0,0 +1,1183 @@
+"""Performance benchmarks for the Live Demo playback and recording pipeline.
+
+Run from the Sublime Text Packages directory (package name is the name of
+directory the plugin is installed in):
+
+    python3 -m "Live Demo.benchmark" [benchmark_name ...]
+
+Without arguments all benchmarks are run.
+"""
+import copy
+import importlib
+import os.path
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from . import diff_match_patch, headless, ldml
+
+
+PLUGIN_DIR = os.path.dirname(__file__)
+EXAMPLE_RECORDING = os.path.join(PLUGIN_DIR, 'example_recording.ldml')
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+    BENCHMARKS.append(func)
+    return func
+
+
+def timeit(func, *args, **kwargs):
+    """Returns best time in seconds of running func a few times."""
+    repeat = kwargs.pop('repeat', 3)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def report(name, *columns):
+    print('  %-40s %s' % (name, '  '.join(columns)))
+
+
+def synthetic_source(size, seed=0):
+    """Generates code-like text of roughly given size in characters."""
+    rnd = random.Random(seed)
+    words = ['self', 'value', 'result', 'items', 'index', 'text', 'diff', 'step',
+             'return', 'None', 'for', 'in', 'if', 'else', 'len', 'append']
+    lines = []
+    length = 0
+    while length < size:
+        indent = ' ' * (4 * rnd.randint(0, 3))
+        line = indent + ' '.join(rnd.choice(words) for _ in range(rnd.randint(2, 10)))
+        lines.append(line)
+        length += len(line) + 1
+    return '\n'.join(lines) + '\n'
+
+
+def synthetic_change(text, edits, seed=0):
+    """Returns text with given number of scattered line edits applied."""
+    rnd = random.Random(seed)
+    lines = text.split('\n')
+    for _ in range(edits):
+        index = rnd.randrange(len(lines))
+        action = rnd.random()
+        if action < 0.4:
+            lines[index] = lines[index].replace('value', 'new_value')
+        elif action < 0.7:
+            lines.insert(index, '    # added line %d' % index)
+        else:
+            del lines[index]
+    return '\n'.join(lines)
+
+
+def synthetic_step(text, edits, filename='synthetic.py', seed=0):
+    new_text = synthetic_change(text, edits, seed)
+    return ldml.LDMLStep(filename, ldml.dmp.patch_make(text, new_text))
+
+
+def process_changes_rediff(step, init_text):
+    """Change computation used before the single pass path was added."""
+    dmp = ldml.dmp
+    final_text, _ = dmp.patch_apply(step.diffs, init_text)
+    perfect_patches = dmp.patch_make(init_text, final_text)
+    return list(dmp.patch_apply_perfect_replacements(perfect_patches, init_text))
+
+
+@benchmark
+def bench_process_changes():
+    cases = []
+    text = ''
+    for index, step in enumerate(ldml.parse(EXAMPLE_RECORDING).steps):
+        cases.append(('example step %d' % (index + 1), step, text))
+        text, _ = ldml.dmp.patch_apply(step.diffs, text)
+    text = synthetic_source(1024 * 1024)
+    cases.append(('synthetic 1MB, 200 edits', synthetic_step(text, 200), text))
+
+    for name, step, init_text in cases:
+        rediff = timeit(process_changes_rediff, step, init_text)
+        single_pass = timeit(lambda: list(step.process_changes(init_text)))
+        report(name, 'rediff %8.2f ms' % (rediff * 1000),
+               'single pass %8.2f ms' % (single_pass * 1000),
+               'speedup %6.1fx' % (rediff / single_pass))
+
+
+def synthetic_recording(file_path, steps, size, edits):
+    text = synthetic_source(size)
+    recording = ldml.LDML([
+        synthetic_step(text, edits, 'file%d.py' % index, seed=index) for index in range(steps)
+    ])
+    with open(file_path, 'w', encoding='utf-8') as f:
+        recording.write(f)
+
+
+@benchmark
+def bench_load():
+    directory = tempfile.mkdtemp()
+    try:
+        file_path = os.path.join(directory, 'recording.ldml')
+        synthetic_recording(file_path, steps=200, size=20 * 1024, edits=100)
+        eager = timeit(lambda: list(ldml.parse_xml(file_path).steps))
+        xml_scan = timeit(ldml.parse_xml, file_path)
+        first_load = timeit(ldml.parse, file_path, repeat=1)  # compiled file doesn't exist yet
+        ldml.COMPILING.submit(lambda: None).result()
+        compiled = timeit(ldml.parse, file_path)
+        os.unlink(ldml.compiled_filepath(file_path))
+        compile = timeit(ldml.compile_parsed, file_path, ldml.file_digest(file_path), repeat=1)
+        steps = ldml.parse(file_path).steps
+        xml_steps = ldml.parse_xml(file_path).steps
+        decode_compiled = timeit(steps.decode, 100)
+        decode_xml = timeit(xml_steps.decode, 100)
+        report('200 steps, %d KB' % (os.path.getsize(file_path) // 1024),
+               'eager %8.2f ms' % (eager * 1000), 'xml scan %6.2f ms' % (xml_scan * 1000),
+               'first load %6.2f ms' % (first_load * 1000), 'compiled %6.2f ms' % (compiled * 1000))
+        report('compile in background', '%8.2f ms' % (compile * 1000))
+        report('decode single step', 'xml %8.3f ms' % (decode_xml * 1000),
+               'compiled %8.3f ms' % (decode_compiled * 1000))
+    finally:
+        shutil.rmtree(directory)
+
+
+def patch_from_text_quadratic(textline):
+    """patch_fromText implementation consuming lines with del text[0]."""
+    dmp = ldml.dmp
+    patches = []
+    text = textline.split('\n')
+    while text:
+        m = re.match(r"^@@ -(\d+),?(\d*) \+(\d+),?(\d*) @@$", text[0])
+        patch = diff_match_patch.patch_obj()
+        patches.append(patch)
+        patch.start1, patch.start2 = int(m.group(1)), int(m.group(3))
+        del text[0]
+        while text:
+            sign = text[0][:1]
+            line = diff_match_patch.urllib_unquote(text[0][1:])
+            if sign == '@':
+                break
+            elif sign in ('+', '-', ' '):
+                patch.diffs.append(({'+': dmp.DIFF_INSERT, '-': dmp.DIFF_DELETE,
+                                     ' ': dmp.DIFF_EQUAL}[sign], line))
+            del text[0]
+    return patches
+
+
+@benchmark
+def bench_patch_from_text():
+    for chunks in (10, 100, 500):
+        patches_text = ''.join(
+            ldml.dmp.patch_toText(synthetic_step(synthetic_source(4096, seed=index), 20, seed=index).diffs)
+            for index in range(chunks)
+        )
+        lines = patches_text.count('\n')
+        quadratic = timeit(patch_from_text_quadratic, patches_text, repeat=1)
+        linear = timeit(ldml.dmp.patch_fromText, patches_text)
+        report('%d diff lines' % lines, 'del text[0] %8.2f ms' % (quadratic * 1000),
+               'indexed %8.2f ms' % (linear * 1000), 'speedup %6.1fx' % (quadratic / linear))
+
+
+class ReferenceBisect(diff_match_patch.diff_match_patch):
+    """diff_bisect implementation preceding the optimised one."""
+    def diff_bisect(self, text1, text2, deadline):
+        xrange = range
+        # Cache the text lengths to prevent multiple calls.
+        text1_length = len(text1)
+        text2_length = len(text2)
+        max_d = (text1_length + text2_length + 1) // 2
+        v_offset = max_d
+        v_length = 2 * max_d
+        v1 = [-1] * v_length
+        v1[v_offset + 1] = 0
+        v2 = v1[:]
+        delta = text1_length - text2_length
+        # If the total number of characters is odd, then the front path will
+        # collide with the reverse path.
+        front = (delta % 2 != 0)
+        # Offsets for start and end of k loop.
+        # Prevents mapping of space beyond the grid.
+        k1start = 0
+        k1end = 0
+        k2start = 0
+        k2end = 0
+        for d in xrange(max_d):
+            # Bail out if deadline is reached.
+            if time.time() > deadline:
+                break
+
+            # Walk the front path one step.
+            for k1 in xrange(-d + k1start, d + 1 - k1end, 2):
+                k1_offset = v_offset + k1
+                if k1 == -d or (k1 != d and
+                        v1[k1_offset - 1] < v1[k1_offset + 1]):
+                    x1 = v1[k1_offset + 1]
+                else:
+                    x1 = v1[k1_offset - 1] + 1
+                y1 = x1 - k1
+                while (x1 < text1_length and y1 < text2_length and
+                              text1[x1] == text2[y1]):
+                    x1 += 1
+                    y1 += 1
+                v1[k1_offset] = x1
+                if x1 > text1_length:
+                    # Ran off the right of the graph.
+                    k1end += 2
+                elif y1 > text2_length:
+                    # Ran off the bottom of the graph.
+                    k1start += 2
+                elif front:
+                    k2_offset = v_offset + delta - k1
+                    if k2_offset >= 0 and k2_offset < v_length and v2[k2_offset] != -1:
+                        # Mirror x2 onto top-left coordinate system.
+                        x2 = text1_length - v2[k2_offset]
+                        if x1 >= x2:
+                            # Overlap detected.
+                            return self.diff_bisectSplit(text1, text2, x1, y1, deadline)
+
+            # Walk the reverse path one step.
+            for k2 in xrange(-d + k2start, d + 1 - k2end, 2):
+                k2_offset = v_offset + k2
+                if k2 == -d or (k2 != d and
+                        v2[k2_offset - 1] < v2[k2_offset + 1]):
+                    x2 = v2[k2_offset + 1]
+                else:
+                    x2 = v2[k2_offset - 1] + 1
+                y2 = x2 - k2
+                while (x2 < text1_length and y2 < text2_length and
+                              text1[-x2 - 1] == text2[-y2 - 1]):
+                    x2 += 1
+                    y2 += 1
+                v2[k2_offset] = x2
+                if x2 > text1_length:
+                    # Ran off the left of the graph.
+                    k2end += 2
+                elif y2 > text2_length:
+                    # Ran off the top of the graph.
+                    k2start += 2
+                elif not front:
+                    k1_offset = v_offset + delta - k2
+                    if k1_offset >= 0 and k1_offset < v_length and v1[k1_offset] != -1:
+                        x1 = v1[k1_offset]
+                        y1 = v_offset + x1 - k1_offset
+                        # Mirror x2 onto top-left coordinate system.
+                        x2 = text1_length - x2
+                        if x1 >= x2:
+                            # Overlap detected.
+                            return self.diff_bisectSplit(text1, text2, x1, y1, deadline)
+
+        # Diff took too long and hit the deadline or
+        # number of diffs equals number of characters, no commonality at all.
+        return [(self.DIFF_DELETE, text1), (self.DIFF_INSERT, text2)]
+
+
+def diff_texts(dmp, text1, text2):
+    return dmp.diff_main(text1, text2, False)
+
+
+@benchmark
+def bench_diff_bisect():
+    # Only snakes are followed faster, so only the "few edits" case (long
+    # snakes) is expected to speed up, the others measure the same loop.
+    cases = [
+        ('testDiffBisect', 'cat', 'map'),
+        ('testDiffMain', '1ayb2', 'abxab'),
+        ('testDiffMain timeout input', '`Twas brillig, and the slithy toves\n' * 64,
+         'I am the very model of a modern major general,\n' * 64),
+    ]
+    for size in (2 * 1024, 16 * 1024):
+        text = synthetic_source(size)
+        cases.append(('synthetic %d KB, scattered edits' % (size // 1024), text, synthetic_change(text, size // 256)))
+    text = synthetic_source(64 * 1024)
+    cases.append(('synthetic 64 KB, few edits', text, synthetic_change(text, 4)))
+
+    reference = ReferenceBisect()
+    optimised = diff_match_patch.diff_match_patch()
+    for dmp in (reference, optimised):
+        dmp.Diff_Timeout = 0
+    for name, text1, text2 in cases:
+        assert diff_texts(reference, text1, text2) == diff_texts(optimised, text1, text2)
+        reference_time = timeit(diff_texts, reference, text1, text2)
+        optimised_time = timeit(diff_texts, optimised, text1, text2)
+        report(name, 'reference %9.2f ms' % (reference_time * 1000),
+               'optimised %9.2f ms' % (optimised_time * 1000),
+               'speedup %5.1fx' % (reference_time / optimised_time))
+
+
+def diff_peak_memory(dmp, text1, text2):
+    tracemalloc.start()
+    diff_texts(dmp, text1, text2)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+@benchmark
+def bench_diff_backends():
+    cases = []
+    for size in (16 * 1024, 256 * 1024):
+        text = synthetic_source(size)
+        cases.append(('%d KB, scattered edits' % (size // 1024), text, synthetic_change(text, 32)))
+    text = synthetic_source(4 * 1024)
+    cases.append(('4 KB, rewritten', text, synthetic_source(4 * 1024, seed=1)))
+
+    backends = sorted(diff_match_patch.DIFF_BACKENDS)
+    print('  backends: %s, auto: %s' % (', '.join(backends), diff_match_patch.get_diff_backend('auto').__class__.__name__))
+    for name, text1, text2 in cases:
+        expected = None
+        for backend in backends:
+            dmp = diff_match_patch.diff_match_patch()
+            dmp.Diff_Timeout = 0
+            dmp.Diff_Backend = backend
+            diffs = diff_texts(dmp, text1, text2)
+            if expected is None:
+                expected = diffs
+            assert diffs == expected
+            report('%s [%s]' % (name, backend),
+                   '%9.2f ms' % (timeit(diff_texts, dmp, text1, text2) * 1000),
+                   'peak %8.1f KB' % (diff_peak_memory(dmp, text1, text2) / 1024))
+
+
+def synthetic_long_lines(size, words_per_line, seed=0):
+    """Generates text of roughly given size made of long lines."""
+    words = synthetic_source(size, seed).split()
+    return '\n'.join(' '.join(words[i:i + words_per_line])
+                     for i in range(0, len(words), words_per_line)) + '\n'
+
+
+def synthetic_word_change(text, edits, seed=0):
+    """Returns text with given number of scattered word replacements."""
+    rnd = random.Random(seed)
+    words = text.split(' ')
+    for _ in range(edits):
+        index = rnd.randrange(len(words))
+        words[index] = rnd.choice(['new_value', 'count', 'self.items', words[index].upper()])
+    return ' '.join(words)
+
+
+def patch_make_in_mode(mode, text1, text2):
+    dmp = diff_match_patch.diff_match_patch()
+    dmp.Diff_Mode = mode
+    return dmp.patch_make(text1, text2)
+
+
+@benchmark
+def bench_diff_mode():
+    for size, words_per_line, edits in ((16 * 1024, 50, 40), (64 * 1024, 200, 200), (256 * 1024, 200, 800)):
+        text1 = synthetic_long_lines(size, words_per_line)
+        text2 = synthetic_word_change(text1, edits)
+        name = '%d KB, %d words per line' % (size // 1024, words_per_line)
+        for mode in ('line', 'word'):
+            patches = patch_make_in_mode(mode, text1, text2)
+            assert ldml.dmp.patch_apply(patches, text1)[0] == text2
+            changes = ldml.dmp.patch_apply_exact_replacements(patches, text1)
+            report('%s [%s]' % (name, mode),
+                   '%9.2f ms' % (timeit(patch_make_in_mode, mode, text1, text2) * 1000),
+                   '%6d edits' % len(changes),
+                   '%7d chars typed' % sum(len(replacement) for _, _, replacement in changes))
+
+
+def synthetic_functions(count, seed=0, name='function'):
+    """Generates code-like functions, separated by blank lines."""
+    rnd = random.Random(seed)
+    words = ['self', 'value', 'result', 'items', 'index', 'return', 'None', 'len']
+    functions = []
+    for i in range(count):
+        lines = ['def %s_%d(self, %s):' % (name, i, rnd.choice(words))]
+        for _ in range(rnd.randint(3, 12)):
+            lines.append('    ' + ' '.join(rnd.choice(words) for _ in range(rnd.randint(1, 5))))
+            if rnd.random() < 0.2:
+                lines.append('')
+        lines.append('    return result')
+        functions.append('\n'.join(lines) + '\n')
+    return functions
+
+
+def synthetic_refactor(functions, seed=0):
+    """Moves a fifth of the functions around and adds a fifth of new ones."""
+    rnd = random.Random(seed)
+    functions = list(functions)
+    for _ in range(len(functions) // 5):
+        function = functions.pop(rnd.randrange(len(functions)))
+        functions.insert(rnd.randrange(len(functions)), function)
+    for function in synthetic_functions(len(functions) // 5, seed + 1, name='helper'):
+        functions.insert(rnd.randrange(len(functions)), function)
+    return functions
+
+
+def patch_make_with_algorithm(algorithm, text1, text2):
+    dmp = diff_match_patch.diff_match_patch()
+    dmp.Diff_Algorithm = algorithm
+    return dmp.patch_make(text1, text2)
+
+
+@benchmark
+def bench_diff_algorithm():
+    engine = importlib.import_module('.engine', __package__)
+    # prepare_instructions only needs the instruction constants.
+    processor = engine.ExecutionProcessor.__new__(engine.ExecutionProcessor)
+    for count in (20, 100, 400):
+        functions = synthetic_functions(count)
+        text1 = '\n'.join(functions)
+        text2 = '\n'.join(synthetic_refactor(functions))
+        name = '%d functions, %d KB' % (count, len(text1) // 1024)
+        for algorithm in ('myers', 'patience'):
+            patches = patch_make_with_algorithm(algorithm, text1, text2)
+            step = ldml.LDMLStep('synthetic.py', patches)
+            changes = step.process_changes(text1)
+            instructions = processor.prepare_instructions(step, changes)
+            report('%s [%s]' % (name, algorithm),
+                   '%9.2f ms' % (timeit(patch_make_with_algorithm, algorithm, text1, text2) * 1000),
+                   '%5d hunks' % len(changes),
+                   '%7d instructions' % len(instructions))
+
+
+class ReferenceHalfMatch(diff_match_patch.diff_match_patch):
+    """diff_halfMatch slicing texts for every candidate, without cache."""
+    def diff_halfMatchCached(self, text1, text2, deadline):
+        return self.diff_halfMatch(text1, text2)
+
+    def diff_halfMatch(self, text1, text2):
+        if self.Diff_Timeout <= 0:
+            # Don't risk returning a non-optimal diff if we have unlimited time.
+            return None
+        if len(text1) > len(text2):
+            (longtext, shorttext) = (text1, text2)
+        else:
+            (shorttext, longtext) = (text1, text2)
+        if len(longtext) < 4 or len(shorttext) * 2 < len(longtext):
+            return None  # Pointless.
+
+        def diff_halfMatchI(longtext, shorttext, i):
+            """Does a substring of shorttext exist within longtext such that the
+            substring is at least half the length of longtext?
+            Closure, but does not reference any external variables.
+
+            Args:
+                longtext: Longer string.
+                shorttext: Shorter string.
+                i: Start index of quarter length substring within longtext.
+
+            Returns:
+                Five element Array, containing the prefix of longtext, the suffix of
+                longtext, the prefix of shorttext, the suffix of shorttext and the
+                common middle.  Or None if there was no match.
+            """
+            seed = longtext[i:i + len(longtext) // 4]
+            best_common = ''
+            j = shorttext.find(seed)
+            while j != -1:
+                prefixLength = self.diff_commonPrefix(longtext[i:], shorttext[j:])
+                suffixLength = self.diff_commonSuffix(longtext[:i], shorttext[:j])
+                if len(best_common) < suffixLength + prefixLength:
+                    best_common = (shorttext[j - suffixLength:j] +
+                            shorttext[j:j + prefixLength])
+                    best_longtext_a = longtext[:i - suffixLength]
+                    best_longtext_b = longtext[i + prefixLength:]
+                    best_shorttext_a = shorttext[:j - suffixLength]
+                    best_shorttext_b = shorttext[j + prefixLength:]
+                j = shorttext.find(seed, j + 1)
+
+            if len(best_common) * 2 >= len(longtext):
+                return (best_longtext_a, best_longtext_b,
+                                best_shorttext_a, best_shorttext_b, best_common)
+            else:
+                return None
+
+        # First check if the second quarter is the seed for a half-match.
+        hm1 = diff_halfMatchI(longtext, shorttext, (len(longtext) + 3) // 4)
+        # Check again based on the third quarter.
+        hm2 = diff_halfMatchI(longtext, shorttext, (len(longtext) + 1) // 2)
+        if not hm1 and not hm2:
+            return None
+        elif not hm2:
+            hm = hm1
+        elif not hm1:
+            hm = hm2
+        else:
+            # Both matched.  Select the longest.
+            if len(hm1[4]) > len(hm2[4]):
+                hm = hm1
+            else:
+                hm = hm2
+
+        # A half-match was found, sort out the return data.
+        if len(text1) > len(text2):
+            (text1_a, text1_b, text2_a, text2_b, mid_common) = hm
+        else:
+            (text2_a, text2_b, text1_a, text1_b, mid_common) = hm
+        return (text1_a, text1_b, text2_a, text2_b, mid_common)
+
+
+def synthetic_repetitive(lines, seed=0):
+    """Generates code repeating a few lines, and a change of it at both ends.
+    Every quarter of the text is found at each repetition of the lines."""
+    block = ''.join(line + '\n' for line in synthetic_source(200, seed).split('\n')[:4])
+    body = block * (lines // 4)
+    return 'def old():\n' + body + 'old()\n', 'def new():\n' + body + 'new()\n'
+
+
+def diff_peak_memory_main(dmp, text1, text2):
+    tracemalloc.start()
+    dmp.diff_main(text1, text2)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+@benchmark
+def bench_half_match():
+    for lines in (1000, 4000, 16000):
+        text1, text2 = synthetic_repetitive(lines)
+        name = '%d repetitive lines, %d KB' % (lines, len(text1) // 1024)
+        reference = ReferenceHalfMatch()
+        memoised = diff_match_patch.diff_match_patch()
+        for dmp in (reference, memoised):
+            dmp.Diff_Timeout = 3600
+        assert reference.diff_main(text1, text2) == memoised.diff_main(text1, text2)
+        for label, dmp in (('reference', reference), ('memoised', memoised)):
+            report('%s [%s]' % (name, label),
+                   '%9.2f ms' % (timeit(dmp.diff_main, text1, text2, repeat=1) * 1000),
+                   'peak %8.1f KB' % (diff_peak_memory_main(dmp, text1, text2) / 1024))
+
+
+class ReferenceBitap(diff_match_patch.diff_match_patch):
+    """match_bitap allocating bit arrays for every error level."""
+    def match_bitap(self, text, pattern, loc):
+        xrange = range
+        # Python doesn't have a maxint limit, so ignore this check.
+        #if self.Match_MaxBits != 0 and len(pattern) > self.Match_MaxBits:
+        #  raise ValueError("Pattern too long for this application.")
+
+        # Initialise the alphabet.
+        s = self.match_alphabet(pattern)
+
+        def match_bitapScore(e, x):
+            """Compute and return the score for a match with e errors and x location.
+            Accesses loc and pattern through being a closure.
+
+            Args:
+                e: Number of errors in match.
+                x: Location of match.
+
+            Returns:
+                Overall score for match (0.0 = good, 1.0 = bad).
+            """
+            accuracy = float(e) / len(pattern)
+            proximity = abs(loc - x)
+            if not self.Match_Distance:
+                # Dodge divide by zero error.
+                return proximity and 1.0 or accuracy
+            return accuracy + (proximity / float(self.Match_Distance))
+
+        # Highest score beyond which we give up.
+        score_threshold = self.Match_Threshold
+        # Is there a nearby exact match? (speedup)
+        best_loc = text.find(pattern, loc)
+        if best_loc != -1:
+            score_threshold = min(match_bitapScore(0, best_loc), score_threshold)
+            # What about in the other direction? (speedup)
+            best_loc = text.rfind(pattern, loc + len(pattern))
+            if best_loc != -1:
+                score_threshold = min(match_bitapScore(0, best_loc), score_threshold)
+
+        # Initialise the bit arrays.
+        matchmask = 1 << (len(pattern) - 1)
+        best_loc = -1
+
+        bin_max = len(pattern) + len(text)
+        # Empty initialization added to appease pychecker.
+        last_rd = None
+        for d in xrange(len(pattern)):
+            # Scan for the best match each iteration allows for one more error.
+            # Run a binary search to determine how far from 'loc' we can stray at
+            # this error level.
+            bin_min = 0
+            bin_mid = bin_max
+            while bin_min < bin_mid:
+                if match_bitapScore(d, loc + bin_mid) <= score_threshold:
+                    bin_min = bin_mid
+                else:
+                    bin_max = bin_mid
+                bin_mid = (bin_max - bin_min) // 2 + bin_min
+
+            # Use the result from this iteration as the maximum for the next.
+            bin_max = bin_mid
+            start = max(1, loc - bin_mid + 1)
+            finish = min(loc + bin_mid, len(text)) + len(pattern)
+
+            rd = [0] * (finish + 2)
+            rd[finish + 1] = (1 << d) - 1
+            for j in xrange(finish, start - 1, -1):
+                if len(text) <= j - 1:
+                    # Out of range.
+                    charMatch = 0
+                else:
+                    charMatch = s.get(text[j - 1], 0)
+                if d == 0:  # First pass: exact match.
+                    rd[j] = ((rd[j + 1] << 1) | 1) & charMatch
+                else:  # Subsequent passes: fuzzy match.
+                    rd[j] = (((rd[j + 1] << 1) | 1) & charMatch) | (
+                            ((last_rd[j + 1] | last_rd[j]) << 1) | 1) | last_rd[j + 1]
+                if rd[j] & matchmask:
+                    score = match_bitapScore(d, j - 1)
+                    # This match will almost certainly be better than any existing match.
+                    # But check anyway.
+                    if score <= score_threshold:
+                        # Told you so.
+                        score_threshold = score
+                        best_loc = j - 1
+                        if best_loc > loc:
+                            # When passing loc, don't exceed our current distance from loc.
+                            start = max(1, 2 * loc - best_loc)
+                        else:
+                            # Already passed loc, downhill from here on in.
+                            break
+            # No hope for a (better) match at greater error levels.
+            if match_bitapScore(d + 1, loc) > score_threshold:
+                break
+            last_rd = rd
+        return best_loc
+
+
+def synthetic_match_cases(count, size, seed=0):
+    """Generates (text, pattern, loc) of patterns with a few typos, searched
+    near but not at their location, as patch_apply does for moved context."""
+    rnd = random.Random(seed)
+    text = synthetic_source(size, seed)
+    cases = []
+    for _ in range(count):
+        length = rnd.randint(8, 32)
+        position = rnd.randrange(len(text) - length)
+        pattern = list(text[position:position + length])
+        for _ in range(rnd.randint(0, length // 8)):
+            pattern[rnd.randrange(length)] = rnd.choice('xyz_')
+        cases.append((text, ''.join(pattern), max(0, position + rnd.randint(-200, 200))))
+    return cases
+
+
+def match_all(dmp, cases):
+    return [dmp.match_bitap(text, pattern, loc) for text, pattern, loc in cases]
+
+
+@benchmark
+def bench_match_bitap():
+    for size in (4 * 1024, 64 * 1024):
+        cases = synthetic_match_cases(500, size)
+        reference = ReferenceBitap()
+        optimised = diff_match_patch.diff_match_patch()
+        assert match_all(reference, cases) == match_all(optimised, cases)
+        reference_time = timeit(match_all, reference, cases)
+        optimised_time = timeit(match_all, optimised, cases)
+        report('%d patterns in %d KB' % (len(cases), size // 1024),
+               'reference %8.0f matches/s' % (len(cases) / reference_time),
+               'optimised %8.0f matches/s' % (len(cases) / optimised_time),
+               'speedup %5.1fx' % (reference_time / optimised_time))
+
+
+def synthetic_identifiers_source(size, seed=0):
+    """Generates code-like text with many distinct identifiers."""
+    rnd = random.Random(seed)
+    lines = []
+    length = 0
+    while length < size:
+        line = '    %s_%d = %s_%d(%d)' % (rnd.choice(['value', 'result', 'items']), rnd.randrange(10 ** 5),
+                                         rnd.choice(['compute', 'load', 'parse']), rnd.randrange(10 ** 5),
+                                         rnd.randrange(100))
+        lines.append(line)
+        length += len(line) + 1
+    return '\n'.join(lines) + '\n'
+
+
+def synthetic_drift(text, lines, seed=0):
+    """Returns text with given number of lines inserted at random places."""
+    rnd = random.Random(seed)
+    text_lines = text.split('\n')
+    for i in range(lines):
+        text_lines.insert(rnd.randrange(len(text_lines)), '# drift %d' % i)
+    return '\n'.join(text_lines)
+
+
+def apply_replacements(dmp, patches, text):
+    return list(dmp.patch_apply_perfect_replacements(patches, text))
+
+
+@benchmark
+def bench_match_exact():
+    """Moved patches, with exact matches searched for around their expected
+    location only, against the original match_bitap searching the rest of
+    the text and always running Bitap."""
+    for size, edits in ((64 * 1024, 100), (1024 * 1024, 300), (1024 * 1024, 2000), (4 * 1024 * 1024, 600)):
+        text = synthetic_identifiers_source(size)
+        patches = ldml.dmp.patch_make(text, synthetic_change(text, edits))
+        drifted = synthetic_drift(text, 50)
+        reference = ReferenceBitap()
+        optimised = diff_match_patch.diff_match_patch()
+        assert apply_replacements(reference, patches, drifted) == apply_replacements(optimised, patches, drifted)
+        assert optimised.patch_apply(patches, drifted) == reference.patch_apply(patches, drifted)
+        reference_time = timeit(apply_replacements, reference, patches, drifted)
+        optimised_time = timeit(apply_replacements, optimised, patches, drifted)
+        report('%d KB, %d patches, drifted' % (size // 1024, len(patches)),
+               'reference %8.2f ms' % (reference_time * 1000),
+               'optimised %8.2f ms' % (optimised_time * 1000),
+               'speedup %5.1fx' % (reference_time / optimised_time))
+
+
+class StringSplicing(diff_match_patch.diff_match_patch):
+    """Patch application rebuilding the whole text string for every splice."""
+    def patch_apply(self, patches, text):
+        if not patches:
+            return (text, [])
+        patches = self.patch_deepCopy(patches)
+        nullPadding = self.patch_addPadding(patches)
+        text = nullPadding + text + nullPadding
+        self.patch_splitMax(patches)
+        delta = 0
+        results = []
+        for patch in patches:
+            expected_loc = patch.start2 + delta
+            text1 = self.diff_text1(patch.diffs)
+            end_loc = -1
+            if len(text1) > self.Match_MaxBits:
+                start_loc = self.match_main(text, text1[:self.Match_MaxBits], expected_loc)
+                if start_loc != -1:
+                    end_loc = self.match_main(text, text1[-self.Match_MaxBits:],
+                                              expected_loc + len(text1) - self.Match_MaxBits)
+                    if end_loc == -1 or start_loc >= end_loc:
+                        start_loc = -1
+            else:
+                start_loc = self.match_main(text, text1, expected_loc)
+            if start_loc == -1:
+                results.append(False)
+                delta -= patch.length2 - patch.length1
+            else:
+                results.append(True)
+                delta = start_loc - expected_loc
+                if end_loc == -1:
+                    text2 = text[start_loc:start_loc + len(text1)]
+                else:
+                    text2 = text[start_loc:end_loc + self.Match_MaxBits]
+                if text1 == text2:
+                    replacement = self.diff_text2(patch.diffs)
+                    text = text[:start_loc] + replacement + text[start_loc + len(text1):]
+                else:
+                    diffs = self.diff_main(text1, text2, False)
+                    if (len(text1) > self.Match_MaxBits and
+                            self.diff_levenshtein(diffs) / float(len(text1)) > self.Patch_DeleteThreshold):
+                        results[-1] = False
+                    else:
+                        self.diff_cleanupSemanticLossless(diffs)
+                        index1 = 0
+                        for (op, data) in patch.diffs:
+                            if op != self.DIFF_EQUAL:
+                                index2 = self.diff_xIndex(diffs, index1)
+                            if op == self.DIFF_INSERT:
+                                text = text[:start_loc + index2] + data + text[start_loc + index2:]
+                            elif op == self.DIFF_DELETE:
+                                index3 = self.diff_xIndex(diffs, index1 + len(data))
+                                text = text[:start_loc + index2] + text[start_loc + index3:]
+                            if op != self.DIFF_DELETE:
+                                index1 += len(data)
+        text = text[len(nullPadding):-len(nullPadding)]
+        return (text, results)
+
+
+@benchmark
+def bench_text_buffer():
+    """Time per hunk of patch_apply on a 2 MB file, as the number of hunks grows."""
+    text = synthetic_source(2 * 1024 * 1024)
+    for hunks in (25, 50, 100, 200, 400):
+        patches = ldml.dmp.patch_make(text, synthetic_change(text, hunks))
+        drifted = synthetic_drift(text, 20)
+        strings = StringSplicing()
+        buffered = diff_match_patch.diff_match_patch()
+        for name, old in (('in place', text), ('drifted', drifted)):
+            assert strings.patch_apply(patches, old) == buffered.patch_apply(patches, old)
+            strings_time = timeit(strings.patch_apply, patches, old)
+            buffered_time = timeit(buffered.patch_apply, patches, old)
+            report('2 MB, %d patches, %s' % (len(patches), name),
+                   'strings %7.3f ms/patch' % (strings_time * 1000 / len(patches)),
+                   'piece table %7.3f ms/patch' % (buffered_time * 1000 / len(patches)),
+                   'speedup %5.1fx' % (strings_time / buffered_time))
+
+
+@benchmark
+def bench_playback():
+    """Plays synthetic recordings through the commands in headless editor."""
+    for size in (10 * 1024, 100 * 1024, 1024 * 1024):
+        base_dir = tempfile.mkdtemp()
+        try:
+            text = synthetic_source(size)
+            step = synthetic_step(text, edits=50)
+            with open(os.path.join(base_dir, step.filename), 'w') as f:
+                f.write(text)
+            recording_path = os.path.join(base_dir, 'recording.ldml')
+            with open(recording_path, 'w', encoding='utf-8') as f:
+                ldml.LDML([step]).write(f)
+
+            editor = headless.install(base_dir)
+            engine = importlib.import_module('.engine', __package__)
+            importlib.import_module('.live_demo', __package__)
+            engine.STEP_CHANGES_CACHE = headless_cache = engine.FileCache(
+                'sublime-live-demo-benchmark-%d' % os.getpid(), max_entries=1)
+            engine.ExecutionProcessor.clock = staticmethod(editor.monotonic)
+
+            processor = engine.ExecutionProcessor(recording_path)
+            prepare = timeit(lambda: (processor.reset(), shutil.rmtree(headless_cache.directory, True),
+                                      processor.next_step()))
+            prepare_cached = timeit(lambda: (processor.reset(), processor.next_step()))
+            processor.reset()
+
+            view = editor.window.open_file(recording_path)
+            view.run_command('live_demo_load')
+            tracemalloc.start()
+            start = time.perf_counter()
+            view.run_command('live_demo_next_step')
+            editor.run()
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            instructions = engine.ExecutionProcessor.read().step_total_instructions
+            engine.ExecutionProcessor.read().stop()
+            shutil.rmtree(headless_cache.directory, True)
+
+            with open(os.path.join(base_dir, step.filename)) as f:
+                assert f.read() == step.apply(text), 'played text differs from recording'
+            report('%d KB file, %d instructions' % (size // 1024, instructions),
+                   'prepare %8.2f ms' % (prepare * 1000),
+                   'cached %6.2f ms' % (prepare_cached * 1000),
+                   '%9d instructions/s' % (instructions / elapsed),
+                   'peak %6.1f MB' % (peak / 1024.0 / 1024))
+        finally:
+            shutil.rmtree(base_dir)
+
+
+@benchmark
+def bench_step_preparation():
+    """Plays recordings of three steps changing one file, with a pause
+    between steps, and measures the longest the editor is blocked.  The file
+    differs from the recorded one, so patches have to be fuzzy matched."""
+    for size in (100 * 1024, 1024 * 1024):
+        base_dir = tempfile.mkdtemp()
+        try:
+            text = synthetic_source(size)
+            steps = []
+            for index in range(3):
+                steps.append(synthetic_step(text, edits=50, seed=index))
+                text = steps[-1].apply(text)
+            text = step_text = synthetic_drift(synthetic_source(size), 20)
+            for step in steps:
+                step_text = step.apply(step_text)
+            with open(os.path.join(base_dir, steps[0].filename), 'w') as f:
+                f.write(text)
+            recording_path = os.path.join(base_dir, 'recording.ldml')
+            with open(recording_path, 'w', encoding='utf-8') as f:
+                ldml.LDML(steps).write(f)
+
+            editor = headless.install(base_dir)
+            engine = importlib.import_module('.engine', __package__)
+            importlib.import_module('.live_demo', __package__)
+            engine.STEP_CHANGES_CACHE = headless_cache = engine.FileCache(
+                'sublime-live-demo-benchmark-%d' % os.getpid(), max_entries=8)
+            engine.ExecutionProcessor.clock = staticmethod(editor.monotonic)
+
+            # What the editor was blocked for when steps were prepared on the main thread.
+            processor = engine.ExecutionProcessor(recording_path)
+            synchronous = timeit(lambda: (processor.reset(), shutil.rmtree(headless_cache.directory, True),
+                                          processor.next_step()))
+            processor.stop()
+            shutil.rmtree(headless_cache.directory, True)
+
+            longest = [0]
+
+            def timed(callback):
+                def run():
+                    start = time.perf_counter()
+                    callback()
+                    longest[0] = max(longest[0], time.perf_counter() - start)
+                return run
+
+            headless.sublime.set_timeout = lambda callback, delay=0: editor.set_timeout(timed(callback), delay)
+            view = editor.window.open_file(recording_path)
+            view.run_command('live_demo_load')
+            step_times = []
+            for _ in steps:
+                start = time.perf_counter()
+                timed(lambda: view.run_command('live_demo_next_step'))()
+                editor.run()
+                step_times.append(time.perf_counter() - start)
+                # presenter talks about the step
+                time.sleep(2 * synchronous)
+            engine.ExecutionProcessor.read().stop()
+            shutil.rmtree(headless_cache.directory, True)
+
+            with open(os.path.join(base_dir, steps[0].filename)) as f:
+                assert f.read() == step_text, 'played text differs from recording'
+            report('%d KB file, 3 steps' % (size // 1024),
+                   'synchronous prepare %7.1f ms' % (synchronous * 1000),
+                   'longest block %6.1f ms' % (longest[0] * 1000),
+                   'step played in %s ms' % ', '.join('%.0f' % (t * 1000) for t in step_times))
+        finally:
+            shutil.rmtree(base_dir)
+
+
+@benchmark
+def bench_compile():
+    """Compiles recordings of three steps on each of several files, which
+    differ from the recorded ones, one by one and in worker processes."""
+    for files, size in ((4, 256 * 1024), (8, 256 * 1024)):
+        base_dir = tempfile.mkdtemp()
+        try:
+            steps = []
+            for file_index in range(files):
+                filename = 'synthetic_%d.py' % file_index
+                text = synthetic_source(size, seed=file_index)
+                for index in range(3):
+                    steps.append(synthetic_step(text, edits=50, filename=filename, seed=index))
+                    text = steps[-1].apply(text)
+                with open(os.path.join(base_dir, filename), 'w') as f:
+                    f.write(synthetic_drift(synthetic_source(size, seed=file_index), 20))
+            # steps of different files interleaved, as in a demo
+            steps = [steps[file_index * 3 + index] for index in range(3) for file_index in range(files)]
+            recording_path = os.path.join(base_dir, 'recording.ldml')
+            with open(recording_path, 'w', encoding='utf-8') as f:
+                ldml.LDML(steps).write(f)
+
+            headless.install(base_dir)
+            engine = importlib.import_module('.engine', __package__)
+            engine.STEP_CHANGES_CACHE = headless_cache = engine.FileCache(
+                'sublime-live-demo-benchmark-%d' % os.getpid(), max_entries=1)
+            processor = engine.ExecutionProcessor(recording_path)
+
+            def compile_recording(processes):
+                processor.start_compile(processes).result()
+                return processor.compile_ready()
+
+            serial = timeit(compile_recording, False, repeat=1)
+            serial_compiled = processor.compiled
+            parallel = timeit(compile_recording, True, repeat=1)
+            assert processor.compiled == serial_compiled
+
+            # compiling is dropped without waiting for it
+            processor.start_compile()
+            cancel = timeit(processor.reset, repeat=1)
+            assert processor.compiled == serial_compiled and processor.compile_ready() is None
+
+            shutil.rmtree(headless_cache.directory, True)
+            compiled = timeit(lambda: (processor.reset(), processor.next_step()))
+            processor.compiled = {}
+            uncompiled = timeit(lambda: (processor.reset(), shutil.rmtree(headless_cache.directory, True),
+                                         processor.next_step()))
+            processor.stop()
+            shutil.rmtree(headless_cache.directory, True)
+            report('%d files of %d KB, %d steps' % (files, size // 1024, len(steps)),
+                   'serial %7.0f ms' % (serial * 1000),
+                   'processes %7.0f ms' % (parallel * 1000),
+                   'speedup %4.1fx' % (serial / parallel),
+                   'first step %6.1f ms, compiled %5.1f ms' % (uncompiled * 1000, compiled * 1000),
+                   'reset while compiling %5.1f ms' % (cancel * 1000))
+        finally:
+            shutil.rmtree(base_dir)
+
+
+@benchmark
+def bench_patch_cache():
+    """Diffs of a recorded change made again, as when a step is cancelled
+    and recorded once more."""
+    base_dir = tempfile.mkdtemp()
+    try:
+        headless.install(base_dir)
+        recorder = importlib.import_module('.live_demo_recorder', __package__)
+        recorder.PATCHES_CACHE = cache = recorder.FileCache(
+            'sublime-live-demo-benchmark-%d' % os.getpid(), max_entries=4)
+        for size in (100 * 1024, 1024 * 1024):
+            text = synthetic_source(size)
+            new_text = synthetic_change(text, 200)
+            shutil.rmtree(cache.directory, True)
+            miss = timeit(lambda: (shutil.rmtree(cache.directory, True),
+                                   recorder.make_patches(text, new_text)))
+            hit = timeit(recorder.make_patches, text, new_text)
+            assert (ldml.dmp.patch_toText(recorder.make_patches(text, new_text)) ==
+                    ldml.dmp.patch_toText(ldml.dmp.patch_make(text, new_text)))
+            report('%d KB file, 200 edits' % (size // 1024),
+                   'diffed %8.2f ms' % (miss * 1000),
+                   'cached %6.2f ms' % (hit * 1000),
+                   'speedup %6.1fx' % (miss / hit),
+                   cache.stats())
+        shutil.rmtree(cache.directory, True)
+    finally:
+        shutil.rmtree(base_dir)
+
+
+@benchmark
+def bench_edit_capture():
+    """Records a step typed in a headless view: cost of capturing edits as
+    they're made and of making patches of them, against diffing the file
+    texts when recording stops."""
+    for size in (100 * 1024, 1024 * 1024):
+        base_dir = tempfile.mkdtemp()
+        try:
+            text = synthetic_source(size)
+            filepath = os.path.join(base_dir, 'synthetic.py')
+            with open(filepath, 'w') as f:
+                f.write(text)
+            editor = headless.install(base_dir)
+            recorder = importlib.import_module('.live_demo_recorder', __package__)
+            view = editor.window.open_file(filepath)
+            recorder.EDIT_CAPTURES[filepath] = capture = recorder.EditCapture(text)
+
+            # 20 places, at each a word typed, a typo fixed, a line deleted
+            rnd = random.Random(0)
+            keystrokes = 0
+            start = time.perf_counter()
+            for position in sorted(rnd.randrange(size) for _ in range(20)):
+                for character in 'renamed_value':
+                    # cursor moves after the typed character
+                    set_cursor(view, position)
+                    view.insert(None, position, character)
+                    position += 1
+                    keystrokes += 1
+                view.erase(None, headless.Region(position - 2, position))
+                view.insert(None, position - 2, 'ue')
+                line_end = view._text.find('\n', position)
+                set_cursor(view, line_end)
+                view.erase(None, headless.Region(line_end, view._text.find('\n', line_end + 1)))
+                keystrokes += 3
+            typing = time.perf_counter() - start
+            del recorder.EDIT_CAPTURES[filepath]
+            new_text = view._text
+            assert capture.matches(new_text)
+
+            dmp = ldml.dmp
+            captured = timeit(capture.patches, dmp)
+            diffed = timeit(dmp.patch_make, text, new_text)
+            assert dmp.patch_apply(capture.patches(dmp), text)[0] == new_text
+            report('%d KB file, %d keystrokes' % (size // 1024, keystrokes),
+                   'capture %6.3f ms/key' % (typing * 1000 / keystrokes),
+                   'stop: diff %8.2f ms' % (diffed * 1000),
+                   'captured %7.2f ms' % (captured * 1000),
+                   'speedup %5.1fx' % (diffed / captured))
+        finally:
+            shutil.rmtree(base_dir)
+
+    # A part of a long line replaced at once (pasted), with some of its words
+    # changed, diffed word by word.
+    rnd = random.Random(0)
+    words = ['%s_%d' % (rnd.choice(['value', 'result', 'items']), rnd.randrange(1000)) for _ in range(32 * 1024)]
+    text = ' '.join(words)
+    pasted = words[8 * 1024:24 * 1024]
+    for _ in range(200):
+        pasted[rnd.randrange(len(pasted))] = 'renamed_%d' % rnd.randrange(1000)
+    new_text = ' '.join(words[:8 * 1024] + pasted + words[24 * 1024:])
+    capture = recorder.EditCapture(text)
+    capture.update(len(new_text), 0, new_text)
+    dmp = copy.copy(ldml.dmp)
+    dmp.Diff_Mode = 'word'
+    captured = timeit(capture.patches, dmp, repeat=1)
+    diffed = timeit(dmp.patch_make, text, new_text, repeat=1)
+    changed = [sum(len(data) for patch in patches for op, data in patch.diffs if op != dmp.DIFF_EQUAL)
+               for patches in (dmp.patch_make(text, new_text), capture.patches(dmp))]
+    assert dmp.patch_apply(capture.patches(dmp), text)[0] == new_text
+    report('%d KB line, replaced in word mode' % (len(text) // 1024),
+           'stop: diff %8.2f ms' % (diffed * 1000), 'captured %7.2f ms' % (captured * 1000),
+           'changed chars %d / %d' % tuple(changed))
+
+
+def set_cursor(view, position):
+    view.sel().clear()
+    view.sel().add(headless.Region(position))
+
+
+@benchmark
+def bench_timeline():
+    """Plays a step with recorded timing while every frame runs a few ms
+    late, as on a busy editor, and measures how far playback drifts from
+    the recorded duration."""
+    for keystrokes in (500, 5000):
+        base_dir = tempfile.mkdtemp()
+        try:
+            text = synthetic_source(10 * 1024)
+            new_text = text + ''.join(random.Random(0).choice('abc \n') for _ in range(keystrokes))
+            step = ldml.LDMLStep('synthetic.py', ldml.dmp.patch_make(text, new_text),
+                                 timing=[random.Random(index).randint(40, 200) for index in range(keystrokes)])
+            recording_path = os.path.join(base_dir, 'recording.ldml')
+            with open(recording_path, 'w', encoding='utf-8') as f:
+                ldml.LDML([step]).write(f)
+
+            editor = headless.install(base_dir)
+            engine = importlib.import_module('.engine', __package__)
+            live_demo = importlib.import_module('.live_demo', __package__)
+            engine.ExecutionProcessor.clock = staticmethod(editor.monotonic)
+            jitter = random.Random(0)
+            headless.sublime.set_timeout = lambda callback, delay=0: editor.set_timeout(
+                callback, delay + jitter.randint(0, 8))
+
+            class LiveDemoPlaySubRelativeCommand(live_demo.LiveDemoPlaySubCommand):
+                """Frames chained by relative timeouts, as before the timeline."""
+                def run(self, edit):
+                    self.helper = live_demo.SublimeTextHelpers(edit)
+                    processor = engine.ExecutionProcessor.read()
+                    instruction = processor.next_instruction()
+                    if not instruction:
+                        return
+                    self.timed = True
+                    target_view = self.view
+                    frame_delay = 0
+                    self.pending_selection = 0
+                    self.pending_text = []
+                    while instruction:
+                        target_view = self.execute_instruction(target_view, instruction)
+                        following = processor.peek_instruction()
+                        if not following:
+                            break
+                        frame_delay += self.instruction_delay(following)
+                        if frame_delay >= self.FRAME_DURATION or instruction[0] in (engine.ExecutionProcessor.OPEN,
+                                                                                     engine.ExecutionProcessor.SAVE):
+                            break
+                        instruction = processor.next_instruction()
+                    self.flush_pending(target_view)
+                    headless.sublime.set_timeout(lambda: target_view.run_command('live_demo_play_sub_relative'),
+                                                 frame_delay)
+
+            view = editor.window.open_file(recording_path)
+            drifts = []
+            for command in ('live_demo_play_sub_relative', 'live_demo_play_sub'):
+                with open(os.path.join(base_dir, step.filename), 'w') as f:
+                    f.write(text)
+                processor = engine.ExecutionProcessor(recording_path)
+                processor.save()
+                processor.next_step()
+                duration = sum(processor.instructions[index][1] for index in range(len(processor.instructions)))
+                start = editor.clock
+                view.run_command(command)
+                editor.run()
+                drifts.append(editor.clock - start - duration)
+                processor.stop()
+                with open(os.path.join(base_dir, step.filename)) as f:
+                    assert f.read() == new_text, 'played text differs from recording'
+                # closes the played file
+                editor.window._views = [view]
+            report('%d recorded keystrokes, %.0f s' % (keystrokes, duration / 1000.0),
+                   'relative timeouts drift %7.0f ms' % drifts[0],
+                   'timeline drift %4.0f ms' % drifts[1])
+        finally:
+            shutil.rmtree(base_dir)
+
+
+def main(names):
+    for func in BENCHMARKS:
+        name = func.__name__[len('bench_'):]
+        if names and name not in names:
+            continue
+        print(name)
+        func()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -28,6 +28,8 @@ Applies the patch onto another text, allowing for errors.
 
 __author__ = 'fraser@google.com (Neil Fraser)'
 
+import array
+import bisect
 import math
 import re
 import sys
@@ -48,6 +50,9 @@ else:
   urllib_quote = urllib.quote
   urllib_unquote = lambda x: urllib.unquote(x).decode("utf-8")
 
+# Header of a patch in its textual representation: @@ -382,8 +481,9 @@
+PATCH_HEADER_RE = re.compile(r"^@@ -(\d+),?(\d*) \+(\d+),?(\d*) @@$")
+
 
 class diff_match_patch:
   """Class containing the diff, match and patch methods.
@@ -62,6 +67,18 @@ class diff_match_patch:
 
     # Number of seconds to map a diff before giving up (0 for infinity).
     self.Diff_Timeout = 1.0
+    # Name of the implementation of the diff primitives, see DIFF_BACKENDS.
+    # 'auto' picks the fastest one available.
+    self.Diff_Backend = 'auto'
+    # How diff_main(checklines=True) speeds up diffs of long texts: 'line'
+    # diffs lines first and rediffs replaced lines character by character,
+    # 'word' rediffs replaced lines word by word and only then replaced words
+    # character by character.
+    self.Diff_Mode = 'line'
+    # Algorithm of the line-level diff of diff_main(checklines=True): 'myers'
+    # or 'patience', which anchors the diff on lines unique in both texts and
+    # gives fewer, larger hunks on source code.
+    self.Diff_Algorithm = 'myers'
     # Cost of an empty edit operation in terms of edit characters.
     self.Diff_EditCost = 4
     # At what point is no match declared (0.0 = perfection, 1.0 = very loose).
@@ -84,6 +101,10 @@ class diff_match_patch:
     # Multiple short patches (using native ints) are much faster than long ones.
     self.Match_MaxBits = 32
 
+    # Results of diff_halfMatch during the current diff, see
+    # diff_halfMatchCached.
+    self._halfMatchCache = None
+
   #  DIFF FUNCTIONS
 
   # The data structure representing a diff is an array of tuples:
@@ -110,7 +131,8 @@ class diff_match_patch:
       Array of changes.
     """
     # Set a deadline by which time the diff must be complete.
-    if deadline == None:
+    toplevel = deadline == None
+    if toplevel:
       # Unlike in most languages, Python counts time in seconds.
       if self.Diff_Timeout <= 0:
         deadline = MAXINT
@@ -151,8 +173,18 @@ class diff_match_patch:
     if commonsuffix:
       diffs.append((self.DIFF_EQUAL, commonsuffix))
     self.diff_cleanupMerge(diffs)
+    if toplevel:
+      self._halfMatchCache = None
     return diffs
 
+  def diff_backend(self):
+    """Find the implementation of the diff primitives to be used.
+
+    Returns:
+      diff_backend instance selected by Diff_Backend.
+    """
+    return get_diff_backend(self.Diff_Backend)
+
   def diff_compute(self, text1, text2, checklines, deadline):
     """Find the differences between two texts.  Assumes that the texts do not
       have any common prefix or suffix.
@@ -197,7 +229,7 @@ class diff_match_patch:
       return [(self.DIFF_DELETE, text1), (self.DIFF_INSERT, text2)]
 
     # Check to see if the problem can be split in two.
-    hm = self.diff_halfMatch(text1, text2)
+    hm = self.diff_halfMatchCached(text1, text2, deadline)
     if hm:
       # A half-match was found, sort out the return data.
       (text1_a, text1_b, text2_a, text2_b, mid_common) = hm
@@ -208,6 +240,8 @@ class diff_match_patch:
       return diffs_a + [(self.DIFF_EQUAL, mid_common)] + diffs_b
 
     if checklines and len(text1) > 100 and len(text2) > 100:
+      if self.Diff_Mode == 'word':
+        return self.diff_wordMode(text1, text2, deadline)
       return self.diff_lineMode(text1, text2, deadline)
 
     return self.diff_bisect(text1, text2, deadline)
@@ -229,14 +263,183 @@ class diff_match_patch:
     # Scan the text on a line-by-line basis first.
     (text1, text2, linearray) = self.diff_linesToChars(text1, text2)
 
-    diffs = self.diff_main(text1, text2, False, deadline)
+    diffs = self.diff_lineHashes(text1, text2, deadline)
 
     # Convert the diff back to original text.
     self.diff_charsToLines(diffs, linearray)
     # Eliminate freak matches (e.g. blank lines)
-    self.diff_cleanupSemantic(diffs)
+    self.diff_cleanupLineHashes(diffs)
 
     # Rediff any replacement blocks, this time character-by-character.
+    self.diff_rediffReplacements(diffs,
+        lambda text1, text2: self.diff_main(text1, text2, False, deadline))
+    return diffs
+
+  def diff_wordMode(self, text1, text2, deadline):
+    """Do a quick line-level diff on both strings, then rediff the replaced
+      lines word by word and the replaced words character by character.
+      Long lines with scattered changes are diffed much faster than by
+      diff_lineMode and the changes are more likely to be whole words.
+      This speedup can produce non-minimal diffs.
+
+    Args:
+      text1: Old string to be diffed.
+      text2: New string to be diffed.
+      deadline: Time when the diff should be complete by.
+
+    Returns:
+      Array of changes.
+    """
+    (text1, text2, linearray) = self.diff_linesToChars(text1, text2)
+    diffs = self.diff_lineHashes(text1, text2, deadline)
+    self.diff_charsToLines(diffs, linearray)
+    self.diff_cleanupLineHashes(diffs)
+
+    def diff_words(text1, text2):
+      (text1, text2, wordarray) = self.diff_tokensToChars(
+          text1, text2, self.diff_wordTokens)
+      diffs = self.diff_main(text1, text2, False, deadline)
+      self.diff_charsToLines(diffs, wordarray)
+      self.diff_cleanupSemantic(diffs)
+      self.diff_rediffReplacements(diffs, diff_chars)
+      return diffs
+
+    def diff_chars(text1, text2):
+      diffs = self.diff_main(text1, text2, False, deadline)
+      # Replace dissimilar words as a whole.
+      self.diff_cleanupSemantic(diffs)
+      return diffs
+
+    self.diff_rediffReplacements(diffs, diff_words)
+    return diffs
+
+  def diff_lineHashes(self, text1, text2, deadline):
+    """Diff two texts of line hashes with the algorithm set by Diff_Algorithm.
+
+    Args:
+      text1: Old string of line hashes.
+      text2: New string of line hashes.
+      deadline: Time when the diff should be complete by.
+
+    Returns:
+      Array of changes.
+    """
+    if self.Diff_Algorithm == 'patience':
+      return self.diff_patience(text1, text2, deadline)
+    return self.diff_main(text1, text2, False, deadline)
+
+  def diff_cleanupLineHashes(self, diffs):
+    """Eliminate freak matches (e.g. blank lines) of a line-level diff.
+    Patience diff does not match freak lines between its anchors, and merging
+    its hunks would only leave larger blocks to be rediffed.
+
+    Args:
+      diffs: Array of diff tuples.
+    """
+    if self.Diff_Algorithm != 'patience':
+      self.diff_cleanupSemantic(diffs)
+
+  def diff_patience(self, text1, text2, deadline):
+    """Find the differences between two texts using the patience algorithm.
+      Characters occurring exactly once in both texts are matched in their
+      longest common order and the gaps between them are diffed recursively.
+      Gaps without such characters are diffed by diff_main.
+      Meant for texts of line hashes, see diff_linesToChars.
+
+    Args:
+      text1: Old string to be diffed.
+      text2: New string to be diffed.
+      deadline: Time when the diff should be complete by.
+
+    Returns:
+      Array of changes.
+    """
+    # Trim off common prefix and suffix, they may hold anchors of the gap.
+    commonlength = self.diff_commonPrefix(text1, text2)
+    commonprefix = text1[:commonlength]
+    text1 = text1[commonlength:]
+    text2 = text2[commonlength:]
+    commonlength = self.diff_commonSuffix(text1, text2)
+    commonsuffix = text1[len(text1) - commonlength:]
+    text1 = text1[:len(text1) - commonlength]
+    text2 = text2[:len(text2) - commonlength]
+
+    anchors = self.diff_patienceAnchors(text1, text2)
+    if not anchors or time.time() > deadline:
+      diffs = self.diff_main(text1, text2, False, deadline)
+    else:
+      diffs = []
+      x = 0
+      y = 0
+      for (anchor_x, anchor_y) in anchors:
+        diffs += self.diff_patience(text1[x:anchor_x], text2[y:anchor_y],
+                                    deadline)
+        diffs.append((self.DIFF_EQUAL, text1[anchor_x]))
+        x = anchor_x + 1
+        y = anchor_y + 1
+      diffs += self.diff_patience(text1[x:], text2[y:], deadline)
+
+    if commonprefix:
+      diffs[:0] = [(self.DIFF_EQUAL, commonprefix)]
+    if commonsuffix:
+      diffs.append((self.DIFF_EQUAL, commonsuffix))
+    self.diff_cleanupMerge(diffs)
+    return diffs
+
+  def diff_patienceAnchors(self, text1, text2):
+    """Find the longest sequence of characters occurring exactly once in both
+    texts, in the same order in both.
+
+    Args:
+      text1: Old string.
+      text2: New string.
+
+    Returns:
+      Array of (index in text1, index in text2) tuples, ordered.
+    """
+    # Index of each character unique in a text, None if it repeats.
+    unique1 = {}
+    for (x, char) in enumerate(text1):
+      unique1[char] = None if char in unique1 else x
+    unique2 = {}
+    for (y, char) in enumerate(text2):
+      unique2[char] = None if char in unique2 else y
+    pairs = []
+    for (x, char) in enumerate(text1):
+      if unique1[char] is not None and unique2.get(char) is not None:
+        pairs.append((x, unique2[char]))
+
+    # Longest increasing subsequence of text2 indices, by patience sorting.
+    # tails[k] is the smallest text2 index ending a subsequence of length k+1.
+    tails = []
+    tailPairs = []
+    previous = []
+    for (i, (x, y)) in enumerate(pairs):
+      k = bisect.bisect_left(tails, y)
+      if k == len(tails):
+        tails.append(y)
+        tailPairs.append(i)
+      else:
+        tails[k] = y
+        tailPairs[k] = i
+      previous.append(tailPairs[k - 1] if k else -1)
+
+    anchors = []
+    i = tailPairs[-1] if tailPairs else -1
+    while i != -1:
+      anchors.append(pairs[i])
+      i = previous[i]
+    anchors.reverse()
+    return anchors
+
+  def diff_rediffReplacements(self, diffs, rediff):
+    """Replace every block of deletions and insertions between equalities by
+    a more detailed diff of the deleted and inserted texts.
+
+    Args:
+      diffs: Array of diff tuples, modified in place.
+      rediff: Function diffing the deleted and the inserted text.
+    """
     # Add a dummy entry at the end.
     diffs.append((self.DIFF_EQUAL, ''))
     pointer = 0
@@ -255,7 +458,7 @@ class diff_match_patch:
         # Upon reaching an equality, check for prior redundancies.
         if count_delete >= 1 and count_insert >= 1:
           # Delete the offending records and add the merged ones.
-          a = self.diff_main(text_delete, text_insert, False, deadline)
+          a = rediff(text_delete, text_insert)
           diffs[pointer - count_delete - count_insert : pointer] = a
           pointer = pointer - count_delete - count_insert + len(a)
         count_insert = 0
@@ -267,8 +470,6 @@ class diff_match_patch:
 
     diffs.pop()  # Remove the dummy entry at the end.
 
-    return diffs
-
   def diff_bisect(self, text1, text2, deadline):
     """Find the 'middle snake' of a diff, split the problem in two
       and return the recursively constructed diff.
@@ -283,93 +484,27 @@ class diff_match_patch:
       Array of diff tuples.
     """
 
-    # Cache the text lengths to prevent multiple calls.
-    text1_length = len(text1)
-    text2_length = len(text2)
-    max_d = (text1_length + text2_length + 1) // 2
-    v_offset = max_d
-    v_length = 2 * max_d
-    v1 = [-1] * v_length
-    v1[v_offset + 1] = 0
-    v2 = v1[:]
-    delta = text1_length - text2_length
-    # If the total number of characters is odd, then the front path will
-    # collide with the reverse path.
-    front = (delta % 2 != 0)
-    # Offsets for start and end of k loop.
-    # Prevents mapping of space beyond the grid.
-    k1start = 0
-    k1end = 0
-    k2start = 0
-    k2end = 0
-    for d in xrange(max_d):
-      # Bail out if deadline is reached.
-      if time.time() > deadline:
-        break
+    split = self.diff_backend().bisect(text1, text2, deadline)
+    if split is None:
+      # Diff took too long and hit the deadline or
+      # number of diffs equals number of characters, no commonality at all.
+      return [(self.DIFF_DELETE, text1), (self.DIFF_INSERT, text2)]
+    (x, y) = split
+    return self.diff_bisectSplit(text1, text2, x, y, deadline)
 
-      # Walk the front path one step.
-      for k1 in xrange(-d + k1start, d + 1 - k1end, 2):
-        k1_offset = v_offset + k1
-        if k1 == -d or (k1 != d and
-            v1[k1_offset - 1] < v1[k1_offset + 1]):
-          x1 = v1[k1_offset + 1]
-        else:
-          x1 = v1[k1_offset - 1] + 1
-        y1 = x1 - k1
-        while (x1 < text1_length and y1 < text2_length and
-               text1[x1] == text2[y1]):
-          x1 += 1
-          y1 += 1
-        v1[k1_offset] = x1
-        if x1 > text1_length:
-          # Ran off the right of the graph.
-          k1end += 2
-        elif y1 > text2_length:
-          # Ran off the bottom of the graph.
-          k1start += 2
-        elif front:
-          k2_offset = v_offset + delta - k1
-          if k2_offset >= 0 and k2_offset < v_length and v2[k2_offset] != -1:
-            # Mirror x2 onto top-left coordinate system.
-            x2 = text1_length - v2[k2_offset]
-            if x1 >= x2:
-              # Overlap detected.
-              return self.diff_bisectSplit(text1, text2, x1, y1, deadline)
+  def diff_bisectSnake(self, text1, text2, x, y):
+    """Follow a snake (run of equal characters) of the edit graph.
 
-      # Walk the reverse path one step.
-      for k2 in xrange(-d + k2start, d + 1 - k2end, 2):
-        k2_offset = v_offset + k2
-        if k2 == -d or (k2 != d and
-            v2[k2_offset - 1] < v2[k2_offset + 1]):
-          x2 = v2[k2_offset + 1]
-        else:
-          x2 = v2[k2_offset - 1] + 1
-        y2 = x2 - k2
-        while (x2 < text1_length and y2 < text2_length and
-               text1[-x2 - 1] == text2[-y2 - 1]):
-          x2 += 1
-          y2 += 1
-        v2[k2_offset] = x2
-        if x2 > text1_length:
-          # Ran off the left of the graph.
-          k2end += 2
-        elif y2 > text2_length:
-          # Ran off the top of the graph.
-          k2start += 2
-        elif not front:
-          k1_offset = v_offset + delta - k2
-          if k1_offset >= 0 and k1_offset < v_length and v1[k1_offset] != -1:
-            x1 = v1[k1_offset]
-            y1 = v_offset + x1 - k1_offset
-            # Mirror x2 onto top-left coordinate system.
-            x2 = text1_length - x2
-            if x1 >= x2:
-              # Overlap detected.
-              return self.diff_bisectSplit(text1, text2, x1, y1, deadline)
+    Args:
+      text1: Old string.
+      text2: New string.
+      x: Index in text1 the snake continues from.
+      y: Index in text2 the snake continues from.
 
-    # Diff took too long and hit the deadline or
-    # number of diffs equals number of characters, no commonality at all.
-    return [(self.DIFF_DELETE, text1), (self.DIFF_INSERT, text2)]
+    Returns:
+      Index in text1 where the snake ends.
+    """
+    return self.diff_backend().bisectSnake(text1, text2, x, y)
 
   def diff_bisectSplit(self, text1, text2, x, y, deadline):
     """Given the location of the 'middle snake', split the diff in two parts
@@ -409,17 +544,34 @@ class diff_match_patch:
       the array of unique strings.  The zeroth element of the array of unique
       strings is intentionally blank.
     """
-    lineArray = []  # e.g. lineArray[4] == "Hello\n"
-    lineHash = {}   # e.g. lineHash["Hello\n"] == 4
+    return self.diff_tokensToChars(text1, text2, self.diff_lineTokens)
+
+  def diff_tokensToChars(self, text1, text2, tokenize):
+    """Split two texts into an array of tokens.  Reduce the texts to a string
+    of hashes where each Unicode character represents one token.
+
+    Args:
+      text1: First string.
+      text2: Second string.
+      tokenize: Function splitting a text into an iterable of tokens, which
+        joined together give the text again.
+
+    Returns:
+      Three element tuple, containing the encoded text1, the encoded text2 and
+      the array of unique tokens.  The zeroth element of the array of unique
+      tokens is intentionally blank.
+    """
+    tokenArray = []  # e.g. tokenArray[4] == "Hello\n"
+    tokenHash = {}   # e.g. tokenHash["Hello\n"] == 4
 
     # "\x00" is a valid character, but various debuggers don't like it.
     # So we'll insert a junk entry to avoid generating a null character.
-    lineArray.append('')
+    tokenArray.append('')
 
-    def diff_linesToCharsMunge(text):
-      """Split a text into an array of strings.  Reduce the texts to a string
-      of hashes where each Unicode character represents one line.
-      Modifies linearray and linehash through being a closure.
+    def diff_tokensToCharsMunge(text):
+      """Reduce a text to a string of hashes where each Unicode character
+      represents one token.
+      Modifies tokenArray and tokenHash through being a closure.
 
       Args:
         text: String to encode.
@@ -428,29 +580,53 @@ class diff_match_patch:
         Encoded string.
       """
       chars = []
-      # Walk the text, pulling out a substring for each line.
-      # text.split('\n') would would temporarily double our memory footprint.
-      # Modifying text would create many large strings to garbage collect.
-      lineStart = 0
-      lineEnd = -1
-      while lineEnd < len(text) - 1:
-        lineEnd = text.find('\n', lineStart)
-        if lineEnd == -1:
-          lineEnd = len(text) - 1
-        line = text[lineStart:lineEnd + 1]
-        lineStart = lineEnd + 1
-
-        if line in lineHash:
-          chars.append(unichr(lineHash[line]))
+      for token in tokenize(text):
+        if token in tokenHash:
+          chars.append(unichr(tokenHash[token]))
         else:
-          lineArray.append(line)
-          lineHash[line] = len(lineArray) - 1
-          chars.append(unichr(len(lineArray) - 1))
+          tokenArray.append(token)
+          tokenHash[token] = len(tokenArray) - 1
+          chars.append(unichr(len(tokenArray) - 1))
       return "".join(chars)
 
-    chars1 = diff_linesToCharsMunge(text1)
-    chars2 = diff_linesToCharsMunge(text2)
-    return (chars1, chars2, lineArray)
+    chars1 = diff_tokensToCharsMunge(text1)
+    chars2 = diff_tokensToCharsMunge(text2)
+    return (chars1, chars2, tokenArray)
+
+  def diff_lineTokens(self, text):
+    """Split a text into lines, each including its trailing newline.
+
+    Args:
+      text: String to split.
+
+    Returns:
+      Generator of lines.
+    """
+    # Walk the text, pulling out a substring for each line.
+    # text.split('\n') would would temporarily double our memory footprint.
+    # Modifying text would create many large strings to garbage collect.
+    lineStart = 0
+    lineEnd = -1
+    while lineEnd < len(text) - 1:
+      lineEnd = text.find('\n', lineStart)
+      if lineEnd == -1:
+        lineEnd = len(text) - 1
+      yield text[lineStart:lineEnd + 1]
+      lineStart = lineEnd + 1
+
+  # Words, runs of whitespace and single other characters.
+  WORDTOKEN = re.compile(r"\w+|\s+|[^\w\s]", re.UNICODE)
+
+  def diff_wordTokens(self, text):
+    """Split a text into words, runs of whitespace and punctuation characters.
+
+    Args:
+      text: String to split.
+
+    Returns:
+      List of tokens.
+    """
+    return self.WORDTOKEN.findall(text)
 
   def diff_charsToLines(self, diffs, lineArray):
     """Rehydrate the text in a diff from a string of line hashes to real lines
@@ -476,23 +652,7 @@ class diff_match_patch:
     Returns:
       The number of characters common to the start of each string.
     """
-    # Quick check for common null cases.
-    if not text1 or not text2 or text1[0] != text2[0]:
-      return 0
-    # Binary search.
-    # Performance analysis: http://neil.fraser.name/news/2007/10/09/
-    pointermin = 0
-    pointermax = min(len(text1), len(text2))
-    pointermid = pointermax
-    pointerstart = 0
-    while pointermin < pointermid:
-      if text1[pointerstart:pointermid] == text2[pointerstart:pointermid]:
-        pointermin = pointermid
-        pointerstart = pointermin
-      else:
-        pointermax = pointermid
-      pointermid = (pointermax - pointermin) // 2 + pointermin
-    return pointermid
+    return self.diff_backend().commonPrefix(text1, text2)
 
   def diff_commonSuffix(self, text1, text2):
     """Determine the common suffix of two strings.
@@ -504,24 +664,37 @@ class diff_match_patch:
     Returns:
       The number of characters common to the end of each string.
     """
-    # Quick check for common null cases.
-    if not text1 or not text2 or text1[-1] != text2[-1]:
-      return 0
-    # Binary search.
-    # Performance analysis: http://neil.fraser.name/news/2007/10/09/
-    pointermin = 0
-    pointermax = min(len(text1), len(text2))
-    pointermid = pointermax
-    pointerend = 0
-    while pointermin < pointermid:
-      if (text1[-pointermid:len(text1) - pointerend] ==
-          text2[-pointermid:len(text2) - pointerend]):
-        pointermin = pointermid
-        pointerend = pointermin
-      else:
-        pointermax = pointermid
-      pointermid = (pointermax - pointermin) // 2 + pointermin
-    return pointermid
+    return self.diff_backend().commonSuffix(text1, text2)
+
+  def diff_commonPrefixAt(self, text1, x, text2, y):
+    """Determine the common prefix of two strings from given offsets, without
+    copying the strings.
+
+    Args:
+      text1: First string.
+      x: Offset in text1.
+      text2: Second string.
+      y: Offset in text2.
+
+    Returns:
+      The number of characters common to the start of text1[x:] and text2[y:].
+    """
+    return self.diff_backend().commonPrefixAt(text1, x, text2, y)
+
+  def diff_commonSuffixAt(self, text1, x, text2, y):
+    """Determine the common suffix of two strings up to given offsets, without
+    copying the strings.
+
+    Args:
+      text1: First string.
+      x: Offset in text1.
+      text2: Second string.
+      y: Offset in text2.
+
+    Returns:
+      The number of characters common to the end of text1[:x] and text2[:y].
+    """
+    return self.diff_backend().commonSuffixAt(text1, x, text2, y)
 
   def diff_commonOverlap(self, text1, text2):
     """Determine if the suffix of one string is the prefix of another.
@@ -604,24 +777,34 @@ class diff_match_patch:
         longtext, the prefix of shorttext, the suffix of shorttext and the
         common middle.  Or None if there was no match.
       """
-      seed = longtext[i:i + len(longtext) // 4]
-      best_common = ''
+      seed_length = len(longtext) // 4
+      seed = longtext[i:i + seed_length]
+      best_length = 0
+      # Texts are compared in place, only the best match is sliced.
       j = shorttext.find(seed)
       while j != -1:
-        prefixLength = self.diff_commonPrefix(longtext[i:], shorttext[j:])
-        suffixLength = self.diff_commonSuffix(longtext[:i], shorttext[:j])
-        if len(best_common) < suffixLength + prefixLength:
-          best_common = (shorttext[j - suffixLength:j] +
-              shorttext[j:j + prefixLength])
-          best_longtext_a = longtext[:i - suffixLength]
-          best_longtext_b = longtext[i + prefixLength:]
-          best_shorttext_a = shorttext[:j - suffixLength]
-          best_shorttext_b = shorttext[j + prefixLength:]
+        # Longest match possible at j, beyond the ends of the texts.
+        bound = (min(i, j) +
+            min(len(longtext) - i, len(shorttext) - j))
+        if bound <= best_length:
+          if j >= i:
+            # The bound only shrinks for the following occurrences.
+            break
+          j = shorttext.find(seed, j + 1)
+          continue
+        prefixLength = seed_length + self.diff_commonPrefixAt(
+            longtext, i + seed_length, shorttext, j + seed_length)
+        suffixLength = self.diff_commonSuffixAt(longtext, i, shorttext, j)
+        if best_length < suffixLength + prefixLength:
+          best_length = suffixLength + prefixLength
+          best_longtext = (i - suffixLength, i + prefixLength)
+          best_shorttext = (j - suffixLength, j + prefixLength)
         j = shorttext.find(seed, j + 1)
 
-      if len(best_common) * 2 >= len(longtext):
-        return (best_longtext_a, best_longtext_b,
-                best_shorttext_a, best_shorttext_b, best_common)
+      if best_length * 2 >= len(longtext):
+        return (longtext[:best_longtext[0]], longtext[best_longtext[1]:],
+                shorttext[:best_shorttext[0]], shorttext[best_shorttext[1]:],
+                shorttext[best_shorttext[0]:best_shorttext[1]])
       else:
         return None
 
@@ -649,6 +832,31 @@ class diff_match_patch:
       (text2_a, text2_b, text1_a, text1_b, mid_common) = hm
     return (text1_a, text1_b, text2_a, text2_b, mid_common)
 
+  def diff_halfMatchCached(self, text1, text2, deadline):
+    """diff_halfMatch memoised for the duration of one diff.  Repetitive texts
+    make the recursive diff_main calls split the same pairs of texts over and
+    over, e.g. identical replaced lines rediffed by diff_lineMode.
+
+    Args:
+      text1: First string.
+      text2: Second string.
+      deadline: Time when the diff should be complete by, identifies the diff.
+
+    Returns:
+      Result of diff_halfMatch.
+    """
+    if self.Diff_Timeout <= 0:
+      # No half-matches with unlimited time.
+      return None
+    cache = self._halfMatchCache
+    if cache is None or cache[0] != deadline:
+      cache = (deadline, {})
+      self._halfMatchCache = cache
+    key = (text1, text2)
+    if key not in cache[1]:
+      cache[1][key] = self.diff_halfMatch(text1, text2)
+    return cache[1][key]
+
   def diff_cleanupSemantic(self, diffs):
     """Reduce the number of edits by eliminating semantically trivial
     equalities.
@@ -1234,7 +1442,7 @@ class diff_match_patch:
     """Locate the best instance of 'pattern' in 'text' near 'loc'.
 
     Args:
-      text: The text to search.
+      text: The text to search, a string or a text_buffer.
       pattern: The pattern to search for.
       loc: The location to search around.
 
@@ -1265,7 +1473,7 @@ class diff_match_patch:
     Bitap algorithm.
 
     Args:
-      text: The text to search.
+      text: The text to search, a string or a text_buffer.
       pattern: The pattern to search for.
       loc: The location to search around.
 
@@ -1300,21 +1508,25 @@ class diff_match_patch:
     # Highest score beyond which we give up.
     score_threshold = self.Match_Threshold
     # Is there a nearby exact match? (speedup)
-    best_loc = text.find(pattern, loc)
+    best_loc = self.match_exact(text, pattern, loc)
     if best_loc != -1:
       score_threshold = min(match_bitapScore(0, best_loc), score_threshold)
-      # What about in the other direction? (speedup)
-      best_loc = text.rfind(pattern, loc + len(pattern))
-      if best_loc != -1:
-        score_threshold = min(match_bitapScore(0, best_loc), score_threshold)
+      if match_bitapScore(1, loc) > score_threshold:
+        # No match with errors can score better, Bitap would only find this
+        # one (it's the closest exact match).
+        return best_loc
 
     # Initialise the bit arrays.
     matchmask = 1 << (len(pattern) - 1)
     best_loc = -1
+    distance = float(self.Match_Distance)
 
     bin_max = len(pattern) + len(text)
-    # Empty initialization added to appease pychecker.
-    last_rd = None
+    # The window of text scanned at the first error level contains the windows
+    # of all the following ones.  Bit arrays of two consecutive levels are
+    # kept in two buffers spanning it and masks of its characters are looked
+    # up once.  window is the index of the first character in text.
+    window = None
     for d in xrange(len(pattern)):
       # Scan for the best match each iteration allows for one more error.
       # Run a binary search to determine how far from 'loc' we can stray at
@@ -1333,39 +1545,74 @@ class diff_match_patch:
       start = max(1, loc - bin_mid + 1)
       finish = min(loc + bin_mid, len(text)) + len(pattern)
 
-      rd = [0] * (finish + 2)
-      rd[finish + 1] = (1 << d) - 1
-      for j in xrange(finish, start - 1, -1):
-        if len(text) <= j - 1:
-          # Out of range.
-          charMatch = 0
-        else:
-          charMatch = s.get(text[j - 1], 0)
+      if window is None:
+        window = start - 1
+        # Characters past the end of text match nothing.
+        charMatches = [s.get(char, 0) for char in text[window:finish]]
+        charMatches.extend([0] * (finish + 1 - window - len(charMatches)))
+        rd = [0] * (finish + 2 - window)
+        last_rd = [0] * (finish + 2 - window)
+      else:
+        (rd, last_rd) = (last_rd, rd)
+
+      # Buffers are indexed by j - window, charMatches by j - 1 - window.
+      accuracy = float(d) / len(pattern)
+      rd[finish + 1 - window] = (1 << d) - 1
+      for i in xrange(finish - window, start - 1 - window, -1):
         if d == 0:  # First pass: exact match.
-          rd[j] = ((rd[j + 1] << 1) | 1) & charMatch
+          rd_j = ((rd[i + 1] << 1) | 1) & charMatches[i - 1]
         else:  # Subsequent passes: fuzzy match.
-          rd[j] = (((rd[j + 1] << 1) | 1) & charMatch) | (
-              ((last_rd[j + 1] | last_rd[j]) << 1) | 1) | last_rd[j + 1]
-        if rd[j] & matchmask:
-          score = match_bitapScore(d, j - 1)
+          rd_j = (((rd[i + 1] << 1) | 1) & charMatches[i - 1]) | (
+              ((last_rd[i + 1] | last_rd[i]) << 1) | 1) | last_rd[i + 1]
+        rd[i] = rd_j
+        if rd_j & matchmask:
+          j = i + window
+          # Inlined match_bitapScore(d, j - 1).
+          proximity = abs(loc - (j - 1))
+          if not distance:
+            score = proximity and 1.0 or accuracy
+          else:
+            score = accuracy + (proximity / distance)
           # This match will almost certainly be better than any existing match.
           # But check anyway.
           if score <= score_threshold:
             # Told you so.
             score_threshold = score
             best_loc = j - 1
-            if best_loc > loc:
-              # When passing loc, don't exceed our current distance from loc.
-              start = max(1, 2 * loc - best_loc)
-            else:
+            if best_loc <= loc:
               # Already passed loc, downhill from here on in.
+              # The buffer is reused, clear what was not scanned.
+              rd[start - window:i] = [0] * (i - start + window)
               break
       # No hope for a (better) match at greater error levels.
       if match_bitapScore(d + 1, loc) > score_threshold:
         break
-      last_rd = rd
     return best_loc
 
+  def match_exact(self, text, pattern, loc):
+    """Locate the exact instance of 'pattern' in 'text' closest to 'loc'.
+    Only instances scoring within Match_Threshold are looked for, so the
+    search is limited to the part of text around 'loc' they can be in.
+
+    Args:
+      text: The text to search, a string or a text_buffer.
+      pattern: The pattern to search for.
+      loc: The location to search around.
+
+    Returns:
+      Best match index or -1.  Of two equally close instances the one before
+      'loc' is returned, as match_bitap does.
+    """
+    if self.Match_Distance:
+      radius = int(self.Match_Threshold * self.Match_Distance)
+    else:
+      radius = 0
+    after = text.find(pattern, loc, loc + radius + len(pattern))
+    before = text.rfind(pattern, max(0, loc - radius), loc - 1 + len(pattern))
+    if before != -1 and (after == -1 or loc - before <= after - loc):
+      return before
+    return after
+
   def match_alphabet(self, pattern):
     """Initialise the alphabet for the Bitap algorithm.
 
@@ -1578,7 +1825,8 @@ class diff_match_patch:
     patches = self.patch_deepCopy(patches)
 
     nullPadding = self.patch_addPadding(patches)
-    text = nullPadding + text + nullPadding
+    # Replacements are spliced into a piece table, the text is copied once.
+    text = text_buffer(nullPadding + text + nullPadding)
     self.patch_splitMax(patches)
 
     # delta keeps track of the offset between the expected and actual location
@@ -1619,8 +1867,8 @@ class diff_match_patch:
           text2 = text[start_loc : end_loc + self.Match_MaxBits]
         if text1 == text2:
           # Perfect match, just shove the replacement text in.
-          text = (text[:start_loc] + self.diff_text2(patch.diffs) +
-                      text[start_loc + len(text1):])
+          replacement = self.diff_text2(patch.diffs)
+          text.splice(start_loc, start_loc + len(text1), replacement)
         else:
           # Imperfect match.
           # Run a diff to get a framework of equivalent indices.
@@ -1637,15 +1885,14 @@ class diff_match_patch:
               if op != self.DIFF_EQUAL:
                 index2 = self.diff_xIndex(diffs, index1)
               if op == self.DIFF_INSERT:  # Insertion
-                text = text[:start_loc + index2] + data + text[start_loc +
-                                                               index2:]
+                text.splice(start_loc + index2, start_loc + index2, data)
               elif op == self.DIFF_DELETE:  # Deletion
-                text = text[:start_loc + index2] + text[start_loc +
-                    self.diff_xIndex(diffs, index1 + len(data)):]
+                index3 = self.diff_xIndex(diffs, index1 + len(data))
+                text.splice(start_loc + index2, start_loc + index3, "")
               if op != self.DIFF_DELETE:
                 index1 += len(data)
     # Strip the padding off.
-    text = text[len(nullPadding):-len(nullPadding)]
+    text = text[len(nullPadding):len(text) - len(nullPadding)]
     return (text, results)
 
   def patch_apply_perfect_replacements(self, patches, text, use_Patch_Margin=None):
@@ -1667,7 +1914,8 @@ class diff_match_patch:
 
     nullPadding = self.patch_addPadding(patches)
     len_nullPadding = len(nullPadding)
-    text = nullPadding + text + nullPadding
+    # Replacements are spliced into a piece table, the text is copied once.
+    text = text_buffer(nullPadding + text + nullPadding)
     self.patch_splitMax(patches)
 
     if use_Patch_Margin is None:
@@ -1716,26 +1964,81 @@ class diff_match_patch:
           replacement = self.diff_text2(patch.diffs)[use_Patch_Margin:-use_Patch_Margin]
 
           yield (replacement_start - len_nullPadding, replacement_end - len_nullPadding, replacement)
-          text = text[:replacement_start] + replacement + text[replacement_end:]
+          text.splice(replacement_start, replacement_end, replacement)
 
-  def patch_addPadding(self, patches):
-    """Add some padding on text start and end so that edges can match
-    something.  Intended to be called only from within patch_apply.
+  def patch_apply_exact_replacements(self, patches, text):
+    """Turn patches directly into replacements, without matching or diffing,
+    if every patch applies exactly at its expected location.
+
+    Patches are padded and split as in patch_apply, so they're only taken
+    as they are if patch_apply would find all of them at those locations
+    too, near the ends of the text as well.
 
     Args:
       patches: Array of Patch objects.
+      text: Old text.
 
     Returns:
-      The padding string added to each side.
+      Array of (start, end, replacement) tuples, each one expressed in
+      coordinates of the text with all previous replacements applied.
+      Or None if any of the patches doesn't apply exactly.
     """
-    paddingLength = self.Patch_Margin
-    nullPadding = ""
-    for x in xrange(1, paddingLength + 1):
-      nullPadding += chr(x)
+    if not patches:
+      return []
 
-    # Bump all the patches forward.
-    for patch in patches:
-      patch.start1 += paddingLength
+    # Deep copy the patches so that no changes are made to originals.
+    patches = self.patch_deepCopy(patches)
+
+    nullPadding = self.patch_addPadding(patches)
+    len_nullPadding = len(nullPadding)
+    # Patched text is kept in a piece table, the text is copied once.
+    text = text_buffer(nullPadding + text + nullPadding)
+    self.patch_splitMax(patches)
+
+    replacements = []
+    for patch in patches:
+      loc = patch.start2
+      text1 = self.diff_text1(patch.diffs)
+      if loc < 0 or loc + len(text1) > len(text) or text[loc:loc + len(text1)] != text1:
+        return None
+
+      pointer = loc
+      deleted = 0
+      inserted = []
+      for (op, data) in patch.diffs + [(self.DIFF_EQUAL, '')]:
+        if op == self.DIFF_INSERT:
+          inserted.append(data)
+        elif op == self.DIFF_DELETE:
+          deleted += len(data)
+        else:
+          if deleted or inserted:
+            replacement = "".join(inserted)
+            replacements.append((pointer - len_nullPadding, pointer - len_nullPadding + deleted, replacement))
+            text.splice(pointer, pointer + deleted, replacement)
+            pointer += len(replacement)
+            deleted = 0
+            inserted = []
+          pointer += len(data)
+    return replacements
+
+  def patch_addPadding(self, patches):
+    """Add some padding on text start and end so that edges can match
+    something.  Intended to be called only from within patch_apply.
+
+    Args:
+      patches: Array of Patch objects.
+
+    Returns:
+      The padding string added to each side.
+    """
+    paddingLength = self.Patch_Margin
+    nullPadding = ""
+    for x in xrange(1, paddingLength + 1):
+      nullPadding += chr(x)
+
+    # Bump all the patches forward.
+    for patch in patches:
+      patch.start1 += paddingLength
       patch.start2 += paddingLength
 
     # Add some padding on start of first diff.
@@ -1899,10 +2202,12 @@ class diff_match_patch:
     if not textline:
       return patches
     text = textline.split('\n')
-    while len(text) != 0:
-      m = re.match("^@@ -(\d+),?(\d*) \+(\d+),?(\d*) @@$", text[0])
+    text_length = len(text)
+    pointer = 0
+    while pointer < text_length:
+      m = PATCH_HEADER_RE.match(text[pointer])
       if not m:
-        raise ValueError("Invalid patch string: " + text[0])
+        raise ValueError("Invalid patch string: " + text[pointer])
       patch = patch_obj()
       patches.append(patch)
       patch.start1 = int(m.group(1))
@@ -1925,33 +2230,38 @@ class diff_match_patch:
         patch.start2 -= 1
         patch.length2 = int(m.group(4))
 
-      del text[0]
+      pointer += 1
 
-      while len(text) != 0:
-        if text[0]:
-          sign = text[0][0]
+      diffs = patch.diffs
+      while pointer < text_length:
+        line = text[pointer]
+        if line:
+          sign = line[0]
         else:
           sign = ''
-        line = urllib_unquote(text[0][1:])
+        if sign == '@':
+          # Start of next patch.
+          break
+        line = line[1:]
+        if '%' in line:
+          # Most of lines don't contain escapes (speedup).
+          line = urllib_unquote(line)
         if sign == '+':
           # Insertion.
-          patch.diffs.append((self.DIFF_INSERT, line))
+          diffs.append((self.DIFF_INSERT, line))
         elif sign == '-':
           # Deletion.
-          patch.diffs.append((self.DIFF_DELETE, line))
+          diffs.append((self.DIFF_DELETE, line))
         elif sign == ' ':
           # Minor equality.
-          patch.diffs.append((self.DIFF_EQUAL, line))
-        elif sign == '@':
-          # Start of next patch.
-          break
+          diffs.append((self.DIFF_EQUAL, line))
         elif sign == '':
           # Blank line?  Whatever.
           pass
         else:
           # WTF?
           raise ValueError("Invalid patch mode: '%s'\n%s" % (sign, line))
-        del text[0]
+        pointer += 1
     return patches
 
 
@@ -2001,3 +2311,613 @@ class patch_obj:
       data = data.encode("utf-8")
       text.append(urllib_quote(data, "!~*'();/?:@&=+$,# ") + "\n")
     return "".join(text)
+
+
+class text_buffer:
+  """Piece table of a text being edited.
+
+  The text is a sequence of pieces, slices of the original text or of the
+  inserted texts, so splicing a replacement in copies none of the text.
+  Pieces are located by bisection on their positions in the text; a splice
+  shifts the positions of the pieces after it, which for patches applied
+  front to back are only a few.
+  """
+
+  def __init__(self, text):
+    """Initializes the buffer with the original text.
+
+    Args:
+      text: Original text.
+    """
+    self.original = text
+    # Pieces in order, as (source, start, end) tuples standing for
+    # source[start:end], and their positions in the text.
+    self.pieces = []
+    self.positions = []
+    if text:
+      self.pieces.append((text, 0, len(text)))
+      self.positions.append(0)
+    self.length = len(text)
+
+  def __len__(self):
+    return self.length
+
+  def __str__(self):
+    return self.substring(0, self.length)
+
+  def __eq__(self, other):
+    if isinstance(other, text_buffer):
+      other = str(other)
+    elif not isinstance(other, str):
+      return NotImplemented
+    return self.length == len(other) and str(self) == other
+
+  def __ne__(self, other):
+    equal = self.__eq__(other)
+    return equal if equal is NotImplemented else not equal
+
+  __hash__ = None
+
+  def __getitem__(self, key):
+    if not isinstance(key, slice):
+      if key < 0:
+        key += self.length
+      if not 0 <= key < self.length:
+        raise IndexError("text_buffer index out of range")
+      return self.substring(key, key + 1)
+    (start, end, step) = key.indices(self.length)
+    if step != 1:
+      return str(self)[key]
+    return self.substring(start, end)
+
+  def piece(self, position):
+    """Find the piece containing a position.
+
+    Args:
+      position: Index in text.
+
+    Returns:
+      Index of the last piece starting at or before position, or 0.
+    """
+    return max(0, bisect.bisect_right(self.positions, position) - 1)
+
+  def substring(self, start, end):
+    """Copy a part of the text.
+
+    Args:
+      start: Start of the part, 0 <= start.
+      end: End of the part, end <= len(text).
+
+    Returns:
+      The string text[start:end].
+    """
+    if start >= end:
+      return ""
+    pieces = self.pieces
+    positions = self.positions
+    parts = []
+    piece = self.piece(start)
+    while piece < len(pieces) and positions[piece] < end:
+      (source, pieceStart, pieceEnd) = pieces[piece]
+      position = positions[piece]
+      parts.append(source[pieceStart + max(0, start - position):
+                          min(pieceEnd, pieceStart + end - position)])
+      piece += 1
+    return parts[0] if len(parts) == 1 else "".join(parts)
+
+  def splice(self, start, end, text):
+    """Replace text[start:end] by a new text.
+
+    Args:
+      start: Start of the replaced part.
+      end: End of the replaced part.
+      text: Replacement.
+    """
+    if start == end and not text:
+      return
+    pieces = self.pieces
+    positions = self.positions
+    # Pieces starting before the one containing start end before it, those
+    # starting at or after end are just shifted.
+    first = self.piece(start)
+    last = bisect.bisect_left(positions, end, first)
+    spliced = []
+    if first < last and positions[first] < start:
+      (source, pieceStart, pieceEnd) = pieces[first]
+      # Part before the replaced text.
+      spliced.append((source, pieceStart, pieceStart + start - positions[first]))
+      position = positions[first]
+    else:
+      position = start
+    after = None
+    if first < last:
+      (source, pieceStart, pieceEnd) = pieces[last - 1]
+      skipped = max(0, end - positions[last - 1])
+      if pieceStart + skipped < pieceEnd:
+        # Part after the replaced text.
+        after = (source, pieceStart + skipped, pieceEnd)
+    if text:
+      spliced.append((text, 0, len(text)))
+    if after:
+      spliced.append(after)
+    delta = len(text) - (end - start)
+    splicedPositions = []
+    for (source, pieceStart, pieceEnd) in spliced:
+      splicedPositions.append(position)
+      position += pieceEnd - pieceStart
+    pieces[first:last] = spliced
+    positions[first:] = splicedPositions + [position + delta for position
+                                            in positions[last:]]
+    self.length += delta
+
+  def find(self, pattern, start=0, end=None):
+    """Same as str(text).find(pattern, start, end), for 0 <= start.
+
+    Args:
+      pattern: The pattern to search for.
+      start: Index in text where to start the search.
+      end: Index in text where to end the search.
+
+    Returns:
+      Index of the first occurrence or -1.
+    """
+    if end is None or end > self.length:
+      end = self.length
+    if not pattern:
+      return start if start <= end else -1
+    pieces = self.pieces
+    positions = self.positions
+    piece = self.piece(start)
+    while piece < len(pieces) and positions[piece] < end:
+      (source, pieceStart, pieceEnd) = pieces[piece]
+      position = positions[piece]
+      piecePosition = pieceStart - position
+      # Occurrences inside the piece come before the ones crossing its end.
+      found = source.find(pattern, max(start, position) + piecePosition,
+                          min(end, position + pieceEnd - pieceStart) +
+                          piecePosition)
+      if found != -1:
+        return found - piecePosition
+      found = self.junctionFind(pattern, start, end, piece, False)
+      if found != -1:
+        return found
+      piece += 1
+    return -1
+
+  def rfind(self, pattern, start=0, end=None):
+    """Same as str(text).rfind(pattern, start, end), for 0 <= start.
+
+    Args:
+      pattern: The pattern to search for.
+      start: Index in text where to start the search.
+      end: Index in text where to end the search.
+
+    Returns:
+      Index of the last occurrence or -1.
+    """
+    if end is None or end > self.length:
+      end = self.length
+    if not pattern:
+      return end if start <= end else -1
+    pieces = self.pieces
+    positions = self.positions
+    piece = self.piece(end - 1)
+    while piece >= 0 and start < end:
+      (source, pieceStart, pieceEnd) = pieces[piece]
+      position = positions[piece]
+      piecePosition = pieceStart - position
+      # Occurrences crossing the end of the piece come after the inside ones.
+      found = self.junctionFind(pattern, start, end, piece, True)
+      if found != -1:
+        return found
+      found = source.rfind(pattern, max(start, position) + piecePosition,
+                           min(end, position + pieceEnd - pieceStart) +
+                           piecePosition)
+      if found != -1:
+        return found - piecePosition
+      if position <= start:
+        break
+      piece -= 1
+    return -1
+
+  def junctionFind(self, pattern, start, end, piece, reverse):
+    """Search for occurrences of pattern crossing the end of a piece.
+
+    Args:
+      pattern: The pattern to search for.
+      start: Index in text where to start the search.
+      end: Index in text where to end the search.
+      piece: Index of the piece.
+      reverse: Find the last occurrence instead of the first one.
+
+    Returns:
+      Index of the occurrence or -1.
+    """
+    if piece + 1 >= len(self.pieces):
+      return -1
+    junction = self.positions[piece + 1]
+    low = max(start, junction - len(pattern) + 1)
+    high = min(end, junction + len(pattern) - 1)
+    if high - low < len(pattern):
+      return -1
+    window = self.substring(low, high)
+    found = window.rfind(pattern) if reverse else window.find(pattern)
+    return found if found == -1 else low + found
+
+
+class diff_backend:
+  """Pure Python implementation of the diff primitives: common prefix and
+  suffix, and the search for the 'middle snake' of diff_bisect.
+
+  Alternative implementations subclass it and are registered with
+  register_diff_backend().  diff_match_patch objects pick one by name with
+  their Diff_Backend setting.
+  """
+
+  def vector(self, length):
+    """Create the array of furthest reaching paths used by bisect.
+
+    Args:
+      length: Number of diagonals.
+
+    Returns:
+      Mutable sequence of integers, all set to -1.
+    """
+    return [-1] * length
+
+  def sequence(self, text):
+    """Represent text for the character by character comparisons of bisect.
+
+    Args:
+      text: String to be diffed.
+
+    Returns:
+      Indexable sequence with one item per character of text.
+    """
+    return text
+
+  def commonPrefix(self, text1, text2):
+    """Determine the common prefix of two strings.
+
+    Args:
+      text1: First string.
+      text2: Second string.
+
+    Returns:
+      The number of characters common to the start of each string.
+    """
+    # Quick check for common null cases.
+    if not text1 or not text2 or text1[0] != text2[0]:
+      return 0
+    # Binary search.
+    # Performance analysis: http://neil.fraser.name/news/2007/10/09/
+    pointermin = 0
+    pointermax = min(len(text1), len(text2))
+    pointermid = pointermax
+    pointerstart = 0
+    while pointermin < pointermid:
+      if text1[pointerstart:pointermid] == text2[pointerstart:pointermid]:
+        pointermin = pointermid
+        pointerstart = pointermin
+      else:
+        pointermax = pointermid
+      pointermid = (pointermax - pointermin) // 2 + pointermin
+    return pointermid
+
+  def commonSuffix(self, text1, text2):
+    """Determine the common suffix of two strings.
+
+    Args:
+      text1: First string.
+      text2: Second string.
+
+    Returns:
+      The number of characters common to the end of each string.
+    """
+    # Quick check for common null cases.
+    if not text1 or not text2 or text1[-1] != text2[-1]:
+      return 0
+    # Binary search.
+    # Performance analysis: http://neil.fraser.name/news/2007/10/09/
+    pointermin = 0
+    pointermax = min(len(text1), len(text2))
+    pointermid = pointermax
+    pointerend = 0
+    while pointermin < pointermid:
+      if (text1[-pointermid:len(text1) - pointerend] ==
+          text2[-pointermid:len(text2) - pointerend]):
+        pointermin = pointermid
+        pointerend = pointermin
+      else:
+        pointermax = pointermid
+      pointermid = (pointermax - pointermin) // 2 + pointermin
+    return pointermid
+
+  def commonPrefixAt(self, text1, x, text2, y):
+    """Determine the common prefix of text1[x:] and text2[y:].
+
+    Args:
+      text1: First string.
+      x: Offset in text1.
+      text2: Second string.
+      y: Offset in text2.
+
+    Returns:
+      The number of common characters.
+    """
+    return self.bisectSnake(text1, text2, x, y) - x
+
+  def commonSuffixAt(self, text1, x, text2, y):
+    """Determine the common suffix of text1[:x] and text2[:y].
+
+    Args:
+      text1: First string.
+      x: Offset in text1.
+      text2: Second string.
+      y: Offset in text2.
+
+    Returns:
+      The number of common characters.
+    """
+    end = min(x, y)
+    # Compare chunks of growing length, like bisectSnake backwards.
+    length = 0
+    chunk = 1
+    while length < end:
+      chunk = min(chunk, end - length)
+      if text1[x - length - chunk:x - length] != text2[y - length - chunk:y - length]:
+        break
+      length += chunk
+      chunk *= 2
+    else:
+      return length
+    # Binary search for the start of the suffix within the last chunk.
+    low = 0
+    high = chunk
+    while high - low > 1:
+      middle = (low + high) // 2
+      if (text1[x - length - middle:x - length - low] ==
+          text2[y - length - middle:y - length - low]):
+        low = middle
+      else:
+        high = middle
+    return length + low
+
+  def bisect(self, text1, text2, deadline):
+    """Find the 'middle snake' of a diff.
+      See Myers 1986 paper: An O(ND) Difference Algorithm and Its Variations.
+
+    Only following snakes is faster than in the original implementation
+    (long runs of equal characters are compared a chunk at a time, see
+    bisectSnake).  The walk over the diagonals is the same O(ND) loop, so
+    texts with little in common or with many scattered edits take as long
+    as before.
+
+    Args:
+      text1: Old string to be diffed.
+      text2: New string to be diffed.
+      deadline: Time at which to bail if not yet complete.
+
+    Returns:
+      Tuple of indices in text1 and text2 where the diff should be split, or
+      None if the deadline was reached or the texts have nothing in common.
+    """
+    # Cache the text lengths to prevent multiple calls.
+    text1_length = len(text1)
+    text2_length = len(text2)
+    max_d = (text1_length + text2_length + 1) // 2
+    v_offset = max_d
+    v_length = 2 * max_d
+    v1 = self.vector(v_length)
+    v1[v_offset + 1] = 0
+    v2 = self.vector(v_length)
+    v2[v_offset + 1] = 0
+    delta = text1_length - text2_length
+    # If the total number of characters is odd, then the front path will
+    # collide with the reverse path.
+    front = (delta % 2 != 0)
+    # Offsets for start and end of k loop.
+    # Prevents mapping of space beyond the grid.
+    k1start = 0
+    k1end = 0
+    k2start = 0
+    k2end = 0
+    # The reverse path walks reversed texts, so snakes of both paths can be
+    # followed with diff_bisectSnake.
+    text1_reversed = text1[::-1]
+    text2_reversed = text2[::-1]
+    chars1 = self.sequence(text1)
+    chars2 = self.sequence(text2)
+    chars1_reversed = self.sequence(text1_reversed)
+    chars2_reversed = self.sequence(text2_reversed)
+    snake = self.bisectSnake
+    for d in xrange(max_d):
+      # Bail out if deadline is reached.
+      # Clock is checked only every few iterations, it's a system call.
+      if d & 0xf == 0 and time.time() > deadline:
+        break
+
+      # Walk the front path one step.
+      for k1 in xrange(-d + k1start, d + 1 - k1end, 2):
+        k1_offset = v_offset + k1
+        if k1 == -d or (k1 != d and
+            v1[k1_offset - 1] < v1[k1_offset + 1]):
+          x1 = v1[k1_offset + 1]
+        else:
+          x1 = v1[k1_offset - 1] + 1
+        y1 = x1 - k1
+        if (x1 < text1_length and y1 < text2_length and
+            chars1[x1] == chars2[y1]):
+          x1 = snake(text1, text2, x1 + 1, y1 + 1)
+          y1 = x1 - k1
+        v1[k1_offset] = x1
+        if x1 > text1_length:
+          # Ran off the right of the graph.
+          k1end += 2
+        elif y1 > text2_length:
+          # Ran off the bottom of the graph.
+          k1start += 2
+        elif front:
+          k2_offset = v_offset + delta - k1
+          if k2_offset >= 0 and k2_offset < v_length and v2[k2_offset] != -1:
+            # Mirror x2 onto top-left coordinate system.
+            x2 = text1_length - v2[k2_offset]
+            if x1 >= x2:
+              # Overlap detected.
+              return (x1, y1)
+
+      # Walk the reverse path one step.
+      for k2 in xrange(-d + k2start, d + 1 - k2end, 2):
+        k2_offset = v_offset + k2
+        if k2 == -d or (k2 != d and
+            v2[k2_offset - 1] < v2[k2_offset + 1]):
+          x2 = v2[k2_offset + 1]
+        else:
+          x2 = v2[k2_offset - 1] + 1
+        y2 = x2 - k2
+        if (x2 < text1_length and y2 < text2_length and
+            chars1_reversed[x2] == chars2_reversed[y2]):
+          x2 = snake(text1_reversed, text2_reversed, x2 + 1, y2 + 1)
+          y2 = x2 - k2
+        v2[k2_offset] = x2
+        if x2 > text1_length:
+          # Ran off the left of the graph.
+          k2end += 2
+        elif y2 > text2_length:
+          # Ran off the top of the graph.
+          k2start += 2
+        elif not front:
+          k1_offset = v_offset + delta - k2
+          if k1_offset >= 0 and k1_offset < v_length and v1[k1_offset] != -1:
+            x1 = v1[k1_offset]
+            y1 = v_offset + x1 - k1_offset
+            # Mirror x2 onto top-left coordinate system.
+            x2 = text1_length - x2
+            if x1 >= x2:
+              # Overlap detected.
+              return (x1, y1)
+
+    return None
+
+  def bisectSnake(self, text1, text2, x, y):
+    """Follow a snake (run of equal characters) of the edit graph.
+
+    Args:
+      text1: Old string.
+      text2: New string.
+      x: Index in text1 the snake continues from.
+      y: Index in text2 the snake continues from.
+
+    Returns:
+      Index in text1 where the snake ends.
+    """
+    end = x + min(len(text1) - x, len(text2) - y)
+    # Most snakes are short, compare character by character first.
+    short_end = min(end, x + 8)
+    while x < short_end and text1[x] == text2[y]:
+      x += 1
+      y += 1
+    if x < short_end or x == end:
+      return x
+    # Then compare chunks of growing length.
+    length = 8
+    while True:
+      length = min(length, end - x)
+      if not length:
+        return x
+      if text1[x:x + length] != text2[y:y + length]:
+        break
+      x += length
+      y += length
+      length *= 2
+    # Binary search for the end of snake within the last chunk.
+    low = 0
+    high = length
+    while high - low > 1:
+      middle = (low + high) // 2
+      if text1[x + low:x + middle] == text2[y + low:y + middle]:
+        low = middle
+      else:
+        high = middle
+    return x + low
+
+
+class diff_backend_array(diff_backend):
+  """Diff primitives working on typed arrays instead of lists and strings.
+
+  Paths are stored in machine integers, which keeps memory of large diffs
+  proportional to their length instead of allocating an int object for every
+  diagonal, and characters are compared as integer code units (Latin-1 or
+  UTF-32).  This is also
+  the memory layout expected by compiled backends.
+  """
+
+  def vector(self, length):
+    vector = array.array('l', [-1])
+    return vector * length
+
+  def sequence(self, text):
+    try:
+      # One byte per character if possible.
+      return memoryview(text.encode('latin-1'))
+    except UnicodeEncodeError:
+      return memoryview(text.encode('utf-32-le')).cast('I')
+
+
+class diff_backend_compiled(diff_backend):
+  """Diff primitives of a compiled extension module.
+
+  The module has to provide bisect(text1, text2, deadline) with the same
+  semantics as diff_backend.bisect, and may provide any of the other
+  primitives.  Missing ones fall back to the pure Python implementation.
+  """
+
+  def __init__(self, module):
+    self.bisect = module.bisect
+    for name in ('commonPrefix', 'commonSuffix', 'commonPrefixAt',
+                 'commonSuffixAt', 'bisectSnake'):
+      if hasattr(module, name):
+        setattr(self, name, getattr(module, name))
+
+
+# Registered diff backends by name.
+DIFF_BACKENDS = {}
+# Backends tried, in order, for Diff_Backend 'auto'.
+DIFF_BACKENDS_AUTO = ('compiled', 'python')
+
+
+def register_diff_backend(name, backend):
+  """Make a diff backend available to the Diff_Backend setting.
+
+  Args:
+    name: Name of the backend.
+    backend: diff_backend instance.
+  """
+  DIFF_BACKENDS[name] = backend
+
+
+def get_diff_backend(name):
+  """Find the diff backend to be used for a Diff_Backend setting.
+
+  Args:
+    name: Name of a registered backend or 'auto'.  Unknown backends, e.g. a
+      compiled one which is not installed, fall back to 'auto'.
+
+  Returns:
+    diff_backend instance.
+  """
+  if name in DIFF_BACKENDS:
+    return DIFF_BACKENDS[name]
+  for name in DIFF_BACKENDS_AUTO:
+    if name in DIFF_BACKENDS:
+      return DIFF_BACKENDS[name]
+
+
+register_diff_backend('python', diff_backend())
+register_diff_backend('array', diff_backend_array())
+try:
+  import diff_match_patch_accel
+except ImportError:
+  pass
+else:
+  register_diff_backend('compiled', diff_backend_compiled(diff_match_patch_accel))
@@ -19,6 +19,7 @@ limitations under the License.
 """
 
 import imp
+import random
 import sys
 import time
 import unittest
@@ -121,6 +122,34 @@ class DiffTest(DiffMatchPatchTest):
     self.dmp.Diff_Timeout = 0
     self.assertEqual(None, self.dmp.diff_halfMatch("qHilloHelloHew", "xHelloHeHulloy"))
 
+  def testDiffCommonAt(self):
+    # Common prefix and suffix from offsets.
+    self.assertEqual(0, self.dmp.diff_commonPrefixAt("abc", 1, "xyz", 0))
+
+    self.assertEqual(4, self.dmp.diff_commonPrefixAt("xx1234abc", 2, "12345", 0))
+
+    self.assertEqual(2, self.dmp.diff_commonPrefixAt("abcd", 2, "cd", 0))
+
+    self.assertEqual(0, self.dmp.diff_commonSuffixAt("abc", 3, "xyz", 3))
+
+    self.assertEqual(4, self.dmp.diff_commonSuffixAt("abcdef1234xx", 10, "xyz1234", 7))
+
+    self.assertEqual(2, self.dmp.diff_commonSuffixAt("ab", 2, "xxab", 4))
+
+    self.assertEqual(0, self.dmp.diff_commonSuffixAt("ab", 0, "ab", 2))
+
+  def testDiffHalfMatchCached(self):
+    # Half-matches are cached during a single diff.
+    self.dmp.Diff_Timeout = 1
+    hm = self.dmp.diff_halfMatchCached("1234567890", "a345678z", 1)
+    self.assertEqual(("12", "90", "a", "z", "345678"), hm)
+    self.assertIs(hm, self.dmp.diff_halfMatchCached("1234567890", "a345678z", 1))
+    self.assertEqual(None, self.dmp.diff_halfMatchCached("1234567890", "abcdef", 1))
+
+    # Cache is dropped after the diff.
+    self.dmp.diff_main("1234567890", "a345678z")
+    self.assertEqual(None, self.dmp._halfMatchCache)
+
   def testDiffLinesToChars(self):
     # Convert lines down to characters.
     self.assertEqual(("\x01\x02\x01", "\x02\x01\x02", ["", "alpha\n", "beta\n"]), self.dmp.diff_linesToChars("alpha\nbeta\nalpha\n", "beta\nalpha\nbeta\n"))
@@ -143,6 +172,12 @@ class DiffTest(DiffMatchPatchTest):
     lineList.insert(0, "")
     self.assertEqual((chars, "", lineList), self.dmp.diff_linesToChars(lines, ""))
 
+  def testDiffTokensToChars(self):
+    # Convert words down to characters.
+    self.assertEqual(("\x01\x02\x03", "\x03\x04\x02\x01", ["", "a", " ", "b", ","]), self.dmp.diff_tokensToChars("a b", "b, a", self.dmp.diff_wordTokens))
+
+    self.assertEqual(["if", " ", "x", "[", "0", "]", ":", "\n  ", "new_value", " ", "=", "=", " ", "1"], self.dmp.diff_wordTokens("if x[0]:\n  new_value == 1"))
+
   def testDiffCharsToLines(self):
     # Convert chars up to lines.
     diffs = [(self.dmp.DIFF_EQUAL, "\x01\x02\x01"), (self.dmp.DIFF_INSERT, "\x02\x01\x02")]
@@ -459,6 +494,55 @@ class DiffTest(DiffMatchPatchTest):
     # Timeout.
     self.assertEqual([(self.dmp.DIFF_DELETE, "cat"), (self.dmp.DIFF_INSERT, "map")], self.dmp.diff_bisect(a, b, 0))
 
+    # Long snakes.
+    a = "x" + "abcdefghij" * 10 + "y" + "0123456789" * 5
+    b = "abcdefghij" * 10 + "z" + "0123456789" * 5 + "w"
+    self.assertEqual([(self.dmp.DIFF_DELETE, "x"), (self.dmp.DIFF_EQUAL, "abcdefghij" * 10), (self.dmp.DIFF_DELETE, "y"), (self.dmp.DIFF_INSERT, "z"), (self.dmp.DIFF_EQUAL, "0123456789" * 5), (self.dmp.DIFF_INSERT, "w")], self.dmp.diff_bisect(a, b, sys.maxsize))
+
+  def testDiffBisectSnake(self):
+    # No common characters.
+    self.assertEqual(0, self.dmp.diff_bisectSnake("abc", "xyz", 0, 0))
+
+    # Short snake.
+    self.assertEqual(4, self.dmp.diff_bisectSnake("xabc", "abcd", 1, 0))
+
+    # Long snake ending within a compared chunk.
+    a = "1" * 100 + "a"
+    b = "-" + "1" * 100 + "b"
+    for x in range(100):
+      self.assertEqual(100, self.dmp.diff_bisectSnake(a, b, x, x + 1))
+
+    # Snake reaching end of the shorter text.
+    self.assertEqual(51, self.dmp.diff_bisectSnake("1" * 51, "1" * 70, 0, 0))
+    self.assertEqual(70, self.dmp.diff_bisectSnake("1" * 90, "1" * 70, 0, 0))
+
+  def testDiffPatience(self):
+    # Unique characters in the same order in both texts.
+    self.assertEqual([(1, 0), (3, 1), (4, 4)], self.dmp.diff_patienceAnchors("abcXd", "bXacd"))
+
+    # Nothing unique.
+    self.assertEqual([], self.dmp.diff_patienceAnchors("aabb", "bbaa"))
+
+    # Gaps between anchors.
+    self.assertEqual([(self.dmp.DIFF_DELETE, "\x01"), (self.dmp.DIFF_INSERT, "\x03"), (self.dmp.DIFF_EQUAL, "\x02"), (self.dmp.DIFF_DELETE, "\x03"), (self.dmp.DIFF_EQUAL, "\x04"), (self.dmp.DIFF_DELETE, "\x03"), (self.dmp.DIFF_EQUAL, "\x05"), (self.dmp.DIFF_INSERT, "\x06")], self.dmp.diff_patience("\x01\x02\x03\x04\x03\x05", "\x03\x02\x04\x05\x06", sys.maxsize))
+
+    # Line-level diff anchored on unique lines.
+    self.dmp.Diff_Algorithm = "patience"
+    a = "".join("def f%d():\n    return %d\n\n" % (x, x) for x in range(10))
+    b = "".join("def f%d():\n    return %d\n\n" % (x, x) for x in (1, 2, 3, 0, 4, 5, 6, 7, 9, 8))
+    diffs = self.dmp.diff_main(a, b, True)
+    self.assertEqual((a, b), self.diff_rebuildtexts(diffs))
+    self.assertEqual([(self.dmp.DIFF_DELETE, "def f0():\n    return 0\n\n"), (self.dmp.DIFF_EQUAL, "def f1():\n    return 1\n\ndef f2():\n    return 2\n\ndef f3():\n    return 3\n\n"), (self.dmp.DIFF_INSERT, "def f0():\n    return 0\n\n")], diffs[:3])
+
+  def testDiffBackend(self):
+    # Unknown backend falls back to the automatically selected one.
+    self.dmp.Diff_Backend = "missing"
+    self.assertIs(dmp_module.get_diff_backend("auto"), self.dmp.diff_backend())
+
+    # Characters outside of Latin-1.
+    self.dmp.Diff_Backend = "array"
+    self.assertEqual([(self.dmp.DIFF_DELETE, "cڀ"), (self.dmp.DIFF_INSERT, "m"), (self.dmp.DIFF_EQUAL, "a"), (self.dmp.DIFF_DELETE, "t"), (self.dmp.DIFF_INSERT, "p\U0001f600")], self.dmp.diff_bisect("cڀat", "map\U0001f600", sys.maxsize))
+
   def testDiffMain(self):
     # Perform a trivial diff.
     # Null case.
@@ -537,6 +621,17 @@ class DiffTest(DiffMatchPatchTest):
     texts_textmode = self.diff_rebuildtexts(self.dmp.diff_main(a, b, False))
     self.assertEqual(texts_textmode, texts_linemode)
 
+    # Word-mode.
+    self.dmp.Diff_Mode = "word"
+    texts_wordmode = self.diff_rebuildtexts(self.dmp.diff_main(a, b, True))
+    self.assertEqual(texts_textmode, texts_wordmode)
+
+    # Similar words are rediffed, dissimilar ones replaced.
+    a = "result = compute(value, items)\n" * 5 + "return result\n"
+    b = "result = compute(new_value, items, index)\n" + "result = compute(value, items)\n" * 4 + "return None\n"
+    self.assertEqual([(self.dmp.DIFF_EQUAL, "result = compute("), (self.dmp.DIFF_INSERT, "new_"), (self.dmp.DIFF_EQUAL, "value, items"), (self.dmp.DIFF_INSERT, ", index"), (self.dmp.DIFF_EQUAL, ")\n" + "result = compute(value, items)\n" * 4 + "return "), (self.dmp.DIFF_DELETE, "result"), (self.dmp.DIFF_INSERT, "None"), (self.dmp.DIFF_EQUAL, "\n")], self.dmp.diff_main(a, b, True))
+    self.dmp.Diff_Mode = "line"
+
     # Test null inputs.
     try:
       self.dmp.diff_main(None, None)
@@ -633,6 +728,57 @@ class MatchTest(DiffMatchPatchTest):
       # Exception expected.
       pass
 
+  def testTextBuffer(self):
+    text = "abcdefghij" * 3
+    buffer = dmp_module.text_buffer(text)
+    self.assertEqual(text, str(buffer))
+    self.assertEqual(30, len(buffer))
+
+    # Replacements, insertions and deletions, across and at piece ends.
+    for (start, end, replacement) in ((5, 8, "XY"), (0, 0, "<"), (7, 7, "Z"),
+                                      (4, 12, ""), (19, 22, ">>"),
+                                      (6, 6, "defgh")):
+      text = text[:start] + replacement + text[end:]
+      buffer.splice(start, end, replacement)
+      self.assertEqual(text, str(buffer))
+      self.assertEqual(len(text), len(buffer))
+    self.assertEqual(text[3:17], buffer[3:17])
+    self.assertEqual(text[-5:], buffer[-5:])
+    self.assertEqual(text[9], buffer[9])
+    self.assertTrue(buffer == text)
+    self.assertFalse(buffer != text)
+
+    # Searches inside pieces and across their ends.
+    for pattern in ("ab", "defgh", "jab", "hdef", "<abc", "i>>", "x"):
+      for start in (0, 4, 9, 20):
+        self.assertEqual(text.find(pattern, start), buffer.find(pattern, start))
+        self.assertEqual(text.rfind(pattern, start), buffer.rfind(pattern, start))
+        self.assertEqual(text.find(pattern, start, 15), buffer.find(pattern, start, 15))
+        self.assertEqual(text.rfind(pattern, start, 15), buffer.rfind(pattern, start, 15))
+
+    # Empty text.
+    buffer = dmp_module.text_buffer("")
+    self.assertEqual(-1, buffer.find("a"))
+    buffer.splice(0, 0, "abc")
+    self.assertEqual("abc", str(buffer))
+
+  def testMatchExact(self):
+    # Closest exact match, within the distance it can score under the threshold.
+    self.dmp.Match_Distance = 100
+    self.dmp.Match_Threshold = 0.5
+    text = "abcdefghij" * 10
+    self.assertEqual(20, self.dmp.match_exact(text, "abc", 24))
+    self.assertEqual(30, self.dmp.match_exact(text, "abc", 26))
+    # Equally close matches, the one before loc.
+    self.assertEqual(20, self.dmp.match_exact(text, "abc", 25))
+    self.assertEqual(90, self.dmp.match_exact(text, "abc", 100))
+    self.assertEqual(-1, self.dmp.match_exact(text, "abx", 25))
+    self.assertEqual(-1, self.dmp.match_exact("abc" + "-" * 200, "abc", 100))
+    self.assertEqual(0, self.dmp.match_exact("abc" + "-" * 200, "abc", 50))
+    self.assertEqual(0, self.dmp.match_exact(dmp_module.text_buffer(text), "abc", 4))
+
+    # Bitap isn't run when no match with errors can be closer.
+    self.assertEqual(22, self.dmp.match_bitap(text, "cdefghijabcde", 21))
 
 class PatchTest(DiffMatchPatchTest):
   """PATCH TEST FUNCTIONS"""
@@ -660,6 +806,12 @@ class PatchTest(DiffMatchPatchTest):
 
     self.assertEqual("@@ -0,0 +1,3 @@\n+abc\n", str(self.dmp.patch_fromText("@@ -0,0 +1,3 @@\n+abc\n")[0]))
 
+    # Many patches, with and without escaped characters.
+    text1 = "".join("%d: 100%% [ok]\n" % x for x in range(300))
+    text2 = text1.replace("1: ", "one: ").replace("[ok]", "ok")
+    strp = self.dmp.patch_toText(self.dmp.patch_make(text1, text2))
+    self.assertEqual(strp, self.dmp.patch_toText(self.dmp.patch_fromText(strp)))
+
     # Generates error.
     try:
       self.dmp.patch_fromText("Bad\nPatch\n")
@@ -867,6 +1019,53 @@ class PatchTest(DiffMatchPatchTest):
     results = self.dmp.patch_apply(patches, "x")
     self.assertEqual(("x123", [True]), results)
 
+  def testPatchApplyExactReplacements(self):
+    def apply_replacements(replacements, text):
+      for start, end, replacement in replacements:
+        text = text[:start] + replacement + text[end:]
+      return text
+
+    # Null case.
+    self.assertEqual([], self.dmp.patch_apply_exact_replacements([], "Hello world."))
+
+    # Exact match.
+    text1 = "The quick brown fox jumps over the lazy dog."
+    text2 = "That quick brown fox jumped over a lazy dog."
+    patches = self.dmp.patch_make(text1, text2)
+    replacements = self.dmp.patch_apply_exact_replacements(patches, text1)
+    self.assertEqual([(2, 3, "at"), (25, 26, "ed"), (33, 36, "a")], replacements)
+    self.assertEqual(text2, apply_replacements(replacements, text1))
+
+    # Edge exact match.
+    patches = self.dmp.patch_make("", "test")
+    self.assertEqual([(0, 0, "test")], self.dmp.patch_apply_exact_replacements(patches, ""))
+
+    # Moved text requires fuzzy match.
+    patches = self.dmp.patch_make(text1, text2)
+    self.assertEqual(None, self.dmp.patch_apply_exact_replacements(patches, "Oh! " + text1))
+
+    # Same result as patch_apply.
+    text1 = "\n".join("line %d: %s" % (x, "abc" * (x % 7)) for x in range(200))
+    text2 = text1.replace("line 1", "row 1").replace("abcabc", "a-b-c")
+    patches = self.dmp.patch_make(text1, text2)
+    replacements = self.dmp.patch_apply_exact_replacements(patches, text1)
+    self.assertEqual(self.dmp.patch_apply(patches, text1)[0], apply_replacements(replacements, text1))
+
+    # Patch without context isn't matched at its location by patch_apply.
+    patches = self.dmp.patch_fromText("@@ -0,0 +1,5 @@\n+c%0Ac%0A%0A\n")
+    self.assertEqual(None, self.dmp.patch_apply_exact_replacements(patches, "b"))
+
+    # Same result as patch_apply near the ends of the text.
+    generator = random.Random(1)
+    for x in range(2000):
+      text1, text2, text3 = ["".join(generator.choice("abeg\n ") for y in range(generator.randint(0, 10)))
+                             for z in range(3)]
+      patches = self.dmp.patch_make(text1, text2)
+      for text in (text1, text1 + " ", text1[1:], text3):
+        replacements = self.dmp.patch_apply_exact_replacements(patches, text)
+        if replacements is not None:
+          self.assertEqual(self.dmp.patch_apply(patches, text)[0], apply_replacements(replacements, text))
+
   def testCodeUpdateGen(self):
     text1 = '''
 import sys
@@ -937,5 +1136,24 @@ class DiffMatchPatchTest(unittest.TestCase):
 
 
 
+def DiffBackendTest(test_case, backend_name):
+  """Runs the tests of test_case with the given diff backend."""
+  class BackendTest(test_case):
+
+    def setUp(self):
+      test_case.setUp(self)
+      self.dmp.Diff_Backend = backend_name
+
+  BackendTest.__name__ = "%s_%s" % (test_case.__name__, backend_name)
+  return BackendTest
+
+# Every diff backend has to pass the whole suite.
+for backend_name in sorted(dmp_module.DIFF_BACKENDS):
+  for test_case in (DiffTest, MatchTest, PatchTest):
+    backend_test = DiffBackendTest(test_case, backend_name)
+    globals()[backend_test.__name__] = backend_test
+del backend_test, test_case
+
+
 if __name__ == "__main__":
   unittest.main()
@@ -0,0 +1,526 @@
+import binascii
+import hashlib
+import multiprocessing
+import os
+import os.path
+import sys
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from . import ldml
+from .diff_match_patch import text_buffer
+from .state import FileCache, StatefulProcessor
+
+
+# Changes computed for steps, keyed by recording, step and initial file text.
+STEP_CHANGES_CACHE = FileCache('sublime-live-demo-steps', max_entries=64)
+
+# Steps are prepared off the main thread, one at a time, so the step being
+# played isn't slowed down by several of them.
+STEP_PREPARATION = ThreadPoolExecutor(max_workers=1)
+
+# Recordings are compiled in a thread of their own, so steps don't wait for
+# a compile to be prepared, even for one that's been cancelled and is
+# still finishing its current step.
+COMPILATION = ThreadPoolExecutor(max_workers=1)
+
+
+def text_hash(text):
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+def apply_changes(text, changes):
+    """Returns text after replacements made by a step."""
+    buffer = text_buffer(text)
+    for start, end, replacement in changes:
+        buffer.splice(start, end, replacement)
+    return str(buffer)
+
+
+def compile_chain(init_text, chain, cancelled=None):
+    """Computes changes of steps changing one file, each of them made to the
+    text left by the previous one. Runs in a worker process, or in the
+    compiling thread, where it stops once cancelled (threading.Event) is set.
+
+    Returns list of (step index, initial text hash, changes).
+    """
+    compiled = []
+    text = init_text
+    for step_index, step in chain:
+        if cancelled is not None and cancelled.is_set():
+            break
+        if step.clear:
+            text = ''
+        changes = list(step.process_changes(text))
+        compiled.append((step_index, text_hash(text), changes))
+        text = apply_changes(text, changes)
+    return compiled
+
+
+def compile_executor():
+    """Returns pool of worker processes for compiling recordings, or None if
+    they can't be started from the plugin host.
+
+    Only forked workers work, spawned ones would run the plugin host binary.
+    Forking the multithreaded plugin host can deadlock in the child on locks
+    held by other threads, and isn't safe on macOS at all (it's not done
+    there), so the pool is used only if enabled in the settings.
+    """
+    if sys.platform == 'darwin':
+        return None
+    try:
+        forking = multiprocessing.get_start_method() == 'fork'
+    except AttributeError:  # Python 3.3 forks everywhere but on Windows
+        forking = sys.platform != 'win32'
+    if not forking:
+        return None
+    try:
+        return ProcessPoolExecutor()
+    except (NotImplementedError, OSError):
+        return None
+
+
+class InstructionStream(object):
+    """Run-length encoded sequence of playback instructions.
+
+    Instructions are kept as segments and expanded to tuples only when read,
+    so memory used by a step doesn't depend on the amount of text it changes.
+    Delay of an instruction is waited before it's played. Delays of timed
+    streams are recorded ones, not to be randomized.
+    """
+    timed = False
+
+    def __init__(self):
+        self.segments = []  # (command, delay, args, count, spread)
+        self.offsets = []   # index of the first instruction of each segment
+        self.total = 0
+        self.position = 0
+
+    def _add_segment(self, command, delay, args, count, spread):
+        if count <= 0:
+            return
+        self.segments.append((command, delay, args, count, spread))
+        self.offsets.append(self.total)
+        self.total += count
+
+    def append(self, command, delay, *args):
+        self._add_segment(command, delay, args, 1, False)
+
+    def repeat(self, count, command, delay, *args):
+        self._add_segment(command, delay, args, count, False)
+
+    def spread(self, command, delay, text):
+        """Adds one instruction per character of text.
+
+        delay is either the same for all of them or a sequence of delays,
+        one per character.
+        """
+        self._add_segment(command, delay, text, len(text), True)
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.total
+        if not 0 <= index < self.total:
+            raise IndexError('instruction index out of range')
+        segment_index = bisect_right(self.offsets, index) - 1
+        command, delay, args, _, spread = self.segments[segment_index]
+        if spread:
+            offset = index - self.offsets[segment_index]
+            if not isinstance(delay, (int, float)):
+                delay = delay[offset]
+            return (command, delay, args[offset])
+        return (command, delay) + args
+
+    def peek(self):
+        if self.position >= self.total:
+            return
+        return self[self.position]
+
+    def next(self):
+        instruction = self.peek()
+        if instruction is not None:
+            self.position += 1
+        return instruction
+
+
+class ExecutionProcessor(StatefulProcessor):
+    __VERSION__ = 2
+    STATE_FILE_KEY = 'sublime-live-demo-execution'
+
+    OPEN = 1    # open tabe file with give path, args: delay, filename
+    MOVE = 2    # move cursor to position, args: delay, position
+    SAVE = 3    # save file, args: delay
+    SELECT = 4  # selects next character, args: delay
+    DELETE = 5  # delete next character, or selection, args: delay
+    INSERT = 6  # insert character, args: delay, character
+
+    DEFAULT_DELAY = 70
+
+    clock = staticmethod(time.monotonic)  # seconds, timeline of playback
+
+    def __init__(self, filename):
+        digest = ldml.file_digest(filename)
+        recording = ldml.parse(filename, digest)
+        self.filename = filename
+        self.recording = recording
+        self.recording_hash = binascii.hexlify(digest).decode('ascii')
+        self.current_step = None
+        self.instructions = None
+        self.changes = None
+        self.total_steps = len(recording.steps)
+        self.step_completed_instructions = None
+        self.step_total_instructions = None
+        self.preparing = None   # future of the current step's instructions
+        self.prefetched = None  # (step index, text hash, future) of the next one
+        self.compiling = None   # future of compile_chains()
+        self.compile_cancelled = None  # event stopping compile_chains()
+        self.compiled = {}      # changes by step index and initial text hash
+        self.timeline_start = None  # monotonic time the step started playing at
+        self.timeline_due = 0       # ms from the start the next instruction is due at
+
+    def __getstate__(self):
+        # Live session is kept in memory, state file holds only the cursor.
+        return {
+            '__VERSION__': self.__VERSION__,
+            'filename': self.filename,
+            'recording_hash': self.recording_hash,
+            'current_step': self.current_step,
+            'total_steps': self.total_steps,
+            'step_completed_instructions': self.step_completed_instructions,
+            'step_total_instructions': self.step_total_instructions,
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.recording = ldml.parse(self.filename)
+        # Instructions of the interrupted step can't be restored, because
+        # file has been already partially changed. Step has to be played again.
+        self.instructions = None
+        self.changes = None
+        self.preparing = None
+        self.prefetched = None
+        self.compiling = None
+        self.compile_cancelled = None
+        self.compiled = {}
+        self.timeline_start = None
+        self.timeline_due = 0
+
+    def next_step(self):
+        """Starts the next step and waits until it's prepared."""
+        self.start_next_step()
+        wait([self.preparing])
+        self.step_ready()
+
+    def start_next_step(self):
+        """Starts the next step, its instructions are prepared in background.
+
+        The step can be played once step_ready() returns True.
+        """
+        if self.current_step is None:
+            self.current_step = 0
+        else:
+            self.current_step = self.current_step + 1
+        step = self.recording.steps[self.current_step]
+
+        filepath = os.path.join(ExecutionProcessor.get_base_dir(), step.filename)
+        basedir = os.path.dirname(filepath)
+        if not os.path.exists(basedir):
+            os.makedirs(basedir)
+
+        if step.clear:
+            with open(filepath, 'w'):
+                pass
+            init_text = ''
+        else:
+            with open(filepath, 'r') as f:
+                init_text = f.read()
+        self.instructions = None
+        self.preparing = self.prepare_step(self.current_step, step, init_text)
+
+    def step_ready(self):
+        """Takes instructions of the started step once they are prepared.
+
+        Returns True if the step can be played, errors of the preparation
+        are raised here. The step after it starts being prepared right away.
+        """
+        if self.preparing is None:
+            return True
+        if not self.preparing.done():
+            return False
+        future, self.preparing = self.preparing, None
+        self.instructions, final_text = future.result()
+        self.timeline_start = None
+        self.timeline_due = 0
+        self.step_completed_instructions = 0
+        self.step_total_instructions = len(self.instructions)
+        self.prefetch(final_text)
+        return True
+
+    def prefetch(self, text):
+        """Starts preparing the step after the current one.
+
+        Its file is expected to be as the current step leaves it (text), or
+        as it is now if the current step doesn't change it.
+        """
+        step_index = self.current_step + 1
+        if step_index >= self.total_steps:
+            return
+        step = self.recording.steps[step_index]
+        if step.clear:
+            init_text = ''
+        elif step.filename == self.recording.steps[self.current_step].filename:
+            init_text = text
+        else:
+            filepath = os.path.join(ExecutionProcessor.get_base_dir(), step.filename)
+            if not os.path.exists(filepath):
+                return
+            with open(filepath, 'r') as f:
+                init_text = f.read()
+        init_hash = text_hash(init_text)
+        future = STEP_PREPARATION.submit(self.prepare, step_index, step, init_text, init_hash)
+        self.prefetched = (step_index, init_hash, future)
+
+    def prepare_step(self, step_index, step, init_text):
+        """Returns future of the step's instructions and the text it leaves.
+
+        The prefetched one is used if it was prepared for the same text.
+        """
+        init_hash = text_hash(init_text)
+        if self.prefetched is not None:
+            prefetched_index, prefetched_hash, future = self.prefetched
+            self.prefetched = None
+            if (prefetched_index, prefetched_hash) == (step_index, init_hash):
+                return future
+            future.cancel()
+        return STEP_PREPARATION.submit(self.prepare, step_index, step, init_text, init_hash)
+
+    def cancel_preparation(self):
+        """Drops steps being prepared and compiling.
+
+        The one already running isn't waited for, its result is ignored, as
+        the preparation only computes results and changes no state. Running
+        compile stops after the step it's computing.
+        """
+        futures = [future for future in (self.preparing, self.compiling) if future is not None]
+        if self.prefetched is not None:
+            futures.append(self.prefetched[2])
+        for future in futures:
+            future.cancel()
+        if self.compile_cancelled is not None:
+            self.compile_cancelled.set()
+        self.preparing = None
+        self.prefetched = None
+        self.compiling = None
+        self.compile_cancelled = None
+
+    def start_compile(self, processes=False):
+        """Starts computing changes of all the remaining steps in background,
+        in worker processes if processes is True (see compile_executor).
+
+        Compiled changes are taken by compile_ready(), steps are then
+        prepared from them if their files are as expected.
+        """
+        self.cancel_preparation()
+        self.compile_cancelled = threading.Event()
+        self.compiling = COMPILATION.submit(self.compile_chains, self.step_chains(), processes,
+                                            self.compile_cancelled)
+        return self.compiling
+
+    def step_chains(self):
+        """Splits the remaining steps into chains of steps changing one file.
+
+        Returns list of (initial text of the file, [(step index, step), ...]).
+        """
+        base_dir = ExecutionProcessor.get_base_dir()
+        chains = OrderedDict()
+        for index in range(self.next_step_index(), self.total_steps):
+            step = self.recording.steps[index]
+            if step.filename not in chains:
+                filepath = os.path.join(base_dir, step.filename)
+                init_text = ''
+                if not step.clear and os.path.exists(filepath):
+                    with open(filepath, 'r') as f:
+                        init_text = f.read()
+                chains[step.filename] = (init_text, [])
+            chains[step.filename][1].append((index, step))
+        return list(chains.values())
+
+    def compile_chains(self, chains, processes=False, cancelled=None):
+        # Runs in the compiling thread, chains are independent, so they can
+        # be computed by worker processes, otherwise they're computed one by
+        # one, until cancelled is set.
+        # Returns changes by step index and initial text hash.
+        results = None
+        executor = compile_executor() if processes and len(chains) > 1 else None
+        if executor is not None:
+            with executor:
+                try:
+                    results = list(executor.map(compile_chain, *zip(*chains)))
+                except BrokenProcessPool:
+                    pass
+        if results is None:
+            results = [compile_chain(init_text, chain, cancelled) for init_text, chain in chains]
+        compiled = {}
+        for chain in results:
+            for step_index, init_hash, changes in chain:
+                compiled[(step_index, init_hash)] = changes
+        return compiled
+
+    def compile_ready(self):
+        """Returns number of compiled steps once compiling is done, otherwise
+        None. Errors of compiling are raised here."""
+        if self.compiling is None or not self.compiling.done():
+            return
+        future, self.compiling = self.compiling, None
+        self.compiled = future.result()
+        return len(self.compiled)
+
+    def prepare(self, step_index, step, init_text, init_hash):
+        # Runs in the preparation thread, the step is passed in decoded, as
+        # lazily loaded steps read from a file shared with the main thread.
+        changes = self.prepare_changes(step_index, step, init_text, init_hash)
+        return self.prepare_instructions(step, changes), apply_changes(init_text, changes)
+
+    def prepare_changes(self, step_index, step, init_text, init_hash):
+        changes = self.compiled.get((step_index, init_hash))
+        if changes is not None:
+            return changes
+        key = STEP_CHANGES_CACHE.make_key(self.recording_hash, step_index, init_hash)
+        changes = STEP_CHANGES_CACHE.get(key)
+        if changes is None:
+            changes = list(step.process_changes(init_text))
+            STEP_CHANGES_CACHE.put(key, changes)
+        return changes
+
+    def prepare_instructions(self, step, changes):
+        """Returns instructions playing the changes, each with the delay
+        waited before it.
+
+        Recorded delays (step.timing) are waited before deletions and typed
+        characters, in order of the changes, as long as there are any. It's
+        an approximation: delays are recorded one per edit, in the order the
+        edits were made, while changes are made front to back and can't be
+        matched with the edits. Delays of edits not making one deletion or
+        character (backspaces, pastes, auto-inserted pairs), or made out of
+        order, shift the following delays to other characters, so the rhythm
+        of typing is kept rather than the exact times.
+        """
+        instructions = InstructionStream()
+        instructions.timed = step.timing is not None
+        delays = iter(step.timing or ())
+        instructions.append(self.OPEN, 0, step.filename)
+
+        for start, end, replacement in changes:
+            instructions.append(self.MOVE, self.DEFAULT_DELAY, start)
+            if end > start:
+                instructions.append(self.SELECT, self.DEFAULT_DELAY)
+                instructions.repeat(end - start - 1, self.SELECT, self.DEFAULT_DELAY / 2)
+                # hold selection before removal
+                instructions.append(self.DELETE, next(delays, self.DEFAULT_DELAY * 10))
+            if step.method == ldml.LDMLStep.PASTE:
+                instructions.append(self.INSERT, next(delays, self.DEFAULT_DELAY), replacement)
+            else:
+                recorded = tuple(islice(delays, len(replacement)))
+                instructions.spread(self.INSERT, recorded, replacement[:len(recorded)])
+                instructions.spread(self.INSERT, self.DEFAULT_DELAY, replacement[len(recorded):])
+        instructions.append(self.SAVE, self.DEFAULT_DELAY)
+        return instructions
+
+    def timeline_now(self):
+        """Returns milliseconds since the current step started playing.
+
+        Instructions are scheduled at times counted from the start, so delays
+        of late frames don't add up over a step.
+        """
+        if self.timeline_start is None:
+            self.timeline_start = self.clock()
+        return (self.clock() - self.timeline_start) * 1000
+
+    def peek_instruction(self):
+        """Returns the next instruction without playing it."""
+        if self.instructions is None:
+            return
+        return self.instructions.peek()
+
+    def next_instruction(self):
+        if self.instructions is None:
+            return
+        try:
+            return self.instructions.next()
+        finally:
+            self.step_completed_instructions = self.step_completed_instructions + 1
+            self.flush()
+
+    def next_step_index(self):
+        if self.current_step is None:
+            return 0
+        return self.current_step + 1
+
+    def is_playing(self):
+        if self.preparing is not None or self.compiling is not None:
+            return True
+        return self.instructions is not None and self.instructions.position < len(self.instructions)
+
+    def fast_forward(self, step_index):
+        """Applies all steps preceding step_index instantly.
+
+        Steps are applied in memory and every changed file is written once,
+        step_index becomes the next step to play.
+        """
+        first_step_index = self.next_step_index()
+        if not first_step_index <= step_index <= self.total_steps:
+            raise ValueError('Step number should be between %d and %d.' % (
+                first_step_index + 1, self.total_steps))
+        self.cancel_preparation()
+
+        base_dir = ExecutionProcessor.get_base_dir()
+        contents = {}
+        for index in range(first_step_index, step_index):
+            step = self.recording.steps[index]
+            filepath = os.path.join(base_dir, step.filename)
+            if step.clear:
+                init_text = ''
+            elif filepath in contents:
+                init_text = contents[filepath]
+            elif os.path.exists(filepath):
+                with open(filepath, 'r') as f:
+                    init_text = f.read()
+            else:
+                init_text = ''
+            contents[filepath] = step.apply(init_text)
+
+        for filepath, text in contents.items():
+            basedir = os.path.dirname(filepath)
+            if not os.path.exists(basedir):
+                os.makedirs(basedir)
+            with open(filepath, 'w') as f:
+                f.write(text)
+
+        self.current_step = step_index - 1 if step_index else None
+        self.instructions = None
+        self.save()
+
+    def step_progress(self):
+        return float(self.step_completed_instructions) / self.step_total_instructions
+
+    def has_more_steps(self):
+        if self.current_step is None:
+            return True
+        return self.current_step + 1 < len(self.recording.steps)
+
+    def reset(self):
+        self.cancel_preparation()
+        self.current_step = None
+        self.save()
+
+    def stop(self):
+        self.cancel_preparation()
+        self.delete()
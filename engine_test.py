@@ -0,0 +1,522 @@
+"""Tests of playing and recording steps, in the headless editor.
+
+Run from the Sublime Text Packages directory:
+
+    python3 -m unittest "Live Demo.engine_test"
+
+or as a script from the plugin directory.
+"""
+import importlib
+import os.path
+import pickle
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+# Plugin modules import each other relatively, so when the tests are run
+# as a script (or by pytest) from the plugin directory, they're imported
+# from the package the directory is.
+PACKAGE = __package__
+if not PACKAGE:
+    PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+    PACKAGE = os.path.basename(PLUGIN_DIR)
+
+engine = importlib.import_module('.engine', PACKAGE)
+headless = importlib.import_module('.headless', PACKAGE)
+ldml = importlib.import_module('.ldml', PACKAGE)
+ExecutionProcessor = engine.ExecutionProcessor
+
+
+EXAMPLE_RECORDING = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'example_recording.ldml')
+
+
+class InstructionStreamTest(unittest.TestCase):
+    def testSegments(self):
+        instructions = engine.InstructionStream()
+        instructions.append(ExecutionProcessor.OPEN, 0, 'a.py')
+        instructions.repeat(0, ExecutionProcessor.SELECT, 35)
+        instructions.repeat(2, ExecutionProcessor.SELECT, 35)
+        instructions.spread(ExecutionProcessor.INSERT, (10, 20), 'ab')
+        instructions.spread(ExecutionProcessor.INSERT, 70, 'cd')
+        self.assertEqual(7, len(instructions))
+        self.assertEqual([
+            (ExecutionProcessor.OPEN, 0, 'a.py'),
+            (ExecutionProcessor.SELECT, 35),
+            (ExecutionProcessor.SELECT, 35),
+            (ExecutionProcessor.INSERT, 10, 'a'),
+            (ExecutionProcessor.INSERT, 20, 'b'),
+            (ExecutionProcessor.INSERT, 70, 'c'),
+            (ExecutionProcessor.INSERT, 70, 'd'),
+        ], [instructions[index] for index in range(len(instructions))])
+        self.assertEqual((ExecutionProcessor.INSERT, 70, 'd'), instructions[-1])
+        with self.assertRaises(IndexError):
+            instructions[7]
+
+    def testNext(self):
+        instructions = engine.InstructionStream()
+        instructions.spread(ExecutionProcessor.INSERT, 70, 'ab')
+        self.assertEqual((ExecutionProcessor.INSERT, 70, 'a'), instructions.peek())
+        self.assertEqual((ExecutionProcessor.INSERT, 70, 'a'), instructions.next())
+        self.assertEqual((ExecutionProcessor.INSERT, 70, 'b'), instructions.next())
+        self.assertIsNone(instructions.peek())
+        self.assertIsNone(instructions.next())
+        self.assertEqual(2, instructions.position)
+
+
+class HeadlessTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.editor = headless.install(self.directory)
+        # plugin modules import sublime, so they're imported once it's installed
+        self.live_demo = importlib.import_module('.live_demo', PACKAGE)
+        self.recorder = importlib.import_module('.live_demo_recorder', PACKAGE)
+        self.steps_cache = engine.STEP_CHANGES_CACHE
+        engine.STEP_CHANGES_CACHE = engine.FileCache(
+            'sublime-live-demo-test-%d' % os.getpid(), max_entries=8)
+        ExecutionProcessor.clock = staticmethod(self.editor.monotonic)
+
+    def tearDown(self):
+        processor = ExecutionProcessor.read()
+        if processor is not None:
+            processor.stop()
+        del ExecutionProcessor.clock
+        shutil.rmtree(engine.STEP_CHANGES_CACHE.directory, True)
+        engine.STEP_CHANGES_CACHE = self.steps_cache
+        # compiled recording files are written one at a time, in order
+        ldml.COMPILING.submit(lambda: None).result()
+        shutil.rmtree(self.directory)
+
+    def path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def read(self, filename):
+        with open(self.path(filename)) as f:
+            return f.read()
+
+    def write(self, filename, text):
+        with open(self.path(filename), 'w') as f:
+            f.write(text)
+
+    def writeRecording(self, steps):
+        with open(self.path('recording.ldml'), 'w', encoding='utf-8') as f:
+            ldml.LDML(steps).write(f)
+        return self.path('recording.ldml')
+
+
+class PlaybackTest(HeadlessTestCase):
+    def testPlayRecording(self):
+        shutil.copy(EXAMPLE_RECORDING, self.path('recording.ldml'))
+        steps = list(ldml.parse(EXAMPLE_RECORDING).steps)
+        view = self.editor.window.open_file(self.path('recording.ldml'))
+        view.run_command('live_demo_load')
+
+        played = []
+        for _ in steps:
+            view.run_command('live_demo_next_step')
+            self.editor.run()
+            played.append(self.read(steps[0].filename))
+        self.assertFalse(ExecutionProcessor.read().has_more_steps())
+
+        expected = ''
+        for step, text in zip(steps, played):
+            expected = step.apply('' if step.clear else expected)
+            self.assertEqual(expected, text)
+
+    def testTimedStep(self):
+        # Delays are waited before their instructions.
+        self.write('a.py', 'x\n')
+        step = ldml.LDMLStep('a.py', ldml.dmp.patch_make('x\n', 'xy\n'), timing=[1000])
+        processor = ExecutionProcessor(self.writeRecording([step]))
+        processor.save()
+        processor.next_step()
+        self.assertEqual([
+            (ExecutionProcessor.OPEN, 0, 'a.py'),
+            (ExecutionProcessor.MOVE, ExecutionProcessor.DEFAULT_DELAY, 1),
+            (ExecutionProcessor.INSERT, 1000, 'y'),
+            (ExecutionProcessor.SAVE, ExecutionProcessor.DEFAULT_DELAY),
+        ], [processor.instructions[index] for index in range(len(processor.instructions))])
+
+        view = self.editor.window.open_file(self.path('recording.ldml'))
+        view.run_command('live_demo_play_sub')
+        played_view = self.editor.window.open_file(self.path('a.py'))
+        typed_at = None
+        while self.editor.run(limit=1):
+            if typed_at is None and played_view.substr(headless.Region(0, 3)) == 'xy\n':
+                typed_at = self.editor.clock
+        self.assertEqual(ExecutionProcessor.DEFAULT_DELAY + 1000, typed_at)
+        self.assertEqual('xy\n', self.read('a.py'))
+
+    def testFrameBatching(self):
+        self.write('a.py', '')
+        step = ldml.LDMLStep('a.py', ldml.dmp.patch_make('', 'xy' * 250), timing=[2] * 500)
+        processor = ExecutionProcessor(self.writeRecording([step]))
+        processor.save()
+        processor.next_step()
+        total = len(processor.instructions)
+
+        view = self.editor.window.open_file(self.path('recording.ldml'))
+        view.run_command('live_demo_play_sub')
+        self.editor.run()
+        self.assertEqual('xy' * 250, self.read('a.py'))
+        self.assertEqual(total, processor.instructions.position)
+        # characters typed within a frame are played by one command
+        frame = self.live_demo.LiveDemoPlaySubCommand.FRAME_DURATION
+        self.assertLess(self.editor.commands_run, 2 * 500 * 2 / frame)
+
+
+class PreparationTest(HeadlessTestCase):
+    def testPrefetch(self):
+        shutil.copy(EXAMPLE_RECORDING, self.path('recording.ldml'))
+        steps = list(ldml.parse(EXAMPLE_RECORDING).steps)
+        filename = steps[0].filename
+        view = self.editor.window.open_file(self.path('recording.ldml'))
+        processor = ExecutionProcessor(self.path('recording.ldml'))
+        processor.save()
+        processor.next_step()
+        step_index, _, prefetched = processor.prefetched
+        self.assertEqual(1, step_index)
+
+        # Prefetched step is used when the file is as the played step leaves it.
+        first_text = steps[0].apply('')
+        self.write(filename, first_text)
+        processor.start_next_step()
+        self.assertIs(prefetched, processor.preparing)
+        self.assertIsNone(processor.prefetched)
+        engine.wait([prefetched])
+        self.assertTrue(processor.step_ready())
+        view.run_command('live_demo_play_sub')
+        self.editor.run()
+        self.assertEqual(steps[1].apply(first_text), self.read(filename))
+
+        # Otherwise the step is prepared for the file as it is.
+        processor.reset()
+        processor.next_step()
+        _, _, prefetched = processor.prefetched
+        changed_text = first_text.replace('import time', 'import time, os')
+        self.write(filename, changed_text)
+        # closes the played file, so it's opened as changed
+        self.editor.window._views = [view]
+        processor.start_next_step()
+        self.assertIsNot(prefetched, processor.preparing)
+        engine.wait([processor.preparing])
+        self.assertTrue(processor.step_ready())
+        view.run_command('live_demo_play_sub')
+        self.editor.run()
+        self.assertEqual(steps[1].apply(changed_text), self.read(filename))
+
+    def testCancelledCompileDoesntBlockSteps(self):
+        shutil.copy(EXAMPLE_RECORDING, self.path('recording.ldml'))
+        processor = ExecutionProcessor(self.path('recording.ldml'))
+        processor.save()
+        running = threading.Event()
+        release = threading.Event()
+
+        def compile_chains(chains, processes=False, cancelled=None):
+            running.set()
+            release.wait(10)
+            return {}
+        processor.compile_chains = compile_chains
+        processor.start_compile()
+        running.wait(10)
+        processor.reset()
+        try:
+            processor.start_next_step()
+            done, _ = engine.wait([processor.preparing], timeout=5)
+            self.assertTrue(done)
+            self.assertTrue(processor.step_ready())
+        finally:
+            release.set()
+
+    def testCompileCancelled(self):
+        shutil.copy(EXAMPLE_RECORDING, self.path('recording.ldml'))
+        processor = ExecutionProcessor(self.path('recording.ldml'))
+        processor.save()
+        processor.start_compile()
+        cancelled = processor.compile_cancelled
+        processor.reset()
+        self.assertTrue(cancelled.is_set())
+        self.assertIsNone(processor.compiling)
+        # compile stops before the next step
+        self.assertEqual({}, processor.compile_chains(processor.step_chains(), cancelled=cancelled))
+
+
+class CompileTest(HeadlessTestCase):
+    def setUp(self):
+        super(CompileTest, self).setUp()
+        shutil.copy(EXAMPLE_RECORDING, self.path('recording.ldml'))
+        self.steps = list(ldml.parse(EXAMPLE_RECORDING).steps)
+        self.view = self.editor.window.open_file(self.path('recording.ldml'))
+        self.view.run_command('live_demo_load')
+
+    def testCompile(self):
+        self.view.run_command('live_demo_compile')
+        self.editor.run()
+        self.assertTrue(self.editor.messages[-1].startswith('Compiled 2 steps.'))
+        self.assertEqual('', self.view.status['live_demo'])
+
+        # steps are prepared from the compiled changes
+        for _ in self.steps:
+            self.view.run_command('live_demo_next_step')
+            self.editor.run()
+        self.assertEqual(0, engine.STEP_CHANGES_CACHE.misses)
+        self.assertEqual(self.steps[1].apply(self.steps[0].apply('')), self.read(self.steps[0].filename))
+
+    def testCompileInProcesses(self):
+        self.write('b.py', 'x = 1\n')
+        steps = self.steps + [ldml.LDMLStep('b.py', ldml.dmp.patch_make('x = 1\n', 'x = 2\n'))]
+        processor = ExecutionProcessor(self.writeRecording(steps))
+        chains = processor.step_chains()
+        self.assertEqual(2, len(chains))
+        compiled = processor.compile_chains(chains)
+        self.assertEqual(3, len(compiled))
+        self.assertEqual(compiled, processor.compile_chains(chains, processes=True))
+
+    def testResetWhileCompiling(self):
+        release = threading.Event()
+        processor = ExecutionProcessor.read()
+        processor.compile_chains = lambda chains, processes=False, cancelled=None: release.wait(10) and {}
+        self.view.run_command('live_demo_compile')
+        try:
+            self.editor.run(limit=3)
+            self.assertTrue(self.view.status['live_demo'].startswith('Compiling recording'))
+            self.view.run_command('live_demo_reset')
+            # polling stops once the compile is dropped
+            self.assertEqual(1, self.editor.run(limit=100))
+            self.assertEqual('', self.view.status['live_demo'])
+        finally:
+            release.set()
+
+
+class FastForwardTest(HeadlessTestCase):
+    def setUp(self):
+        super(FastForwardTest, self).setUp()
+        shutil.copy(EXAMPLE_RECORDING, self.path('recording.ldml'))
+        self.steps = list(ldml.parse(EXAMPLE_RECORDING).steps)
+        self.filename = self.steps[0].filename
+        self.view = self.editor.window.open_file(self.path('recording.ldml'))
+        self.view.run_command('live_demo_load')
+
+    def testFastForward(self):
+        processor = ExecutionProcessor.read()
+        processor.fast_forward(1)
+        first_text = self.steps[0].apply('')
+        self.assertEqual(first_text, self.read(self.filename))
+        self.assertEqual(1, processor.next_step_index())
+
+        # the next step is played from there
+        self.view.run_command('live_demo_next_step')
+        self.editor.run()
+        self.assertEqual(self.steps[1].apply(first_text), self.read(self.filename))
+
+        with self.assertRaises(ValueError):
+            processor.fast_forward(1)
+
+    def testJumpPastLastStep(self):
+        self.view.run_command('live_demo_jump_to_step', {'step': len(self.steps) + 1})
+        self.assertEqual(self.steps[1].apply(self.steps[0].apply('')), self.read(self.filename))
+        self.assertFalse(ExecutionProcessor.read().has_more_steps())
+        self.assertIn('recording is finished', self.editor.messages[-1])
+
+        self.view.run_command('live_demo_reset')
+        self.view.run_command('live_demo_jump_to_step', {'step': len(self.steps) + 2})
+        self.assertIn('Step number should be between 1 and %d.' % len(self.steps), self.editor.messages[-1])
+
+
+class SessionTest(HeadlessTestCase):
+    def load(self):
+        shutil.copy(EXAMPLE_RECORDING, self.path('recording.ldml'))
+        processor = ExecutionProcessor(self.path('recording.ldml'))
+        processor.save()
+        return processor
+
+    def readStateFile(self):
+        with open(ExecutionProcessor.state_filepath(), 'rb') as f:
+            return pickle.load(f)
+
+    def testSessionKeptInMemory(self):
+        processor = self.load()
+        self.assertIs(processor, ExecutionProcessor.read())
+        processor.next_step()
+        processor.save()
+
+        # State file holds only the cursor, the step is played again.
+        del ExecutionProcessor._sessions[ExecutionProcessor.state_filepath()]
+        restored = ExecutionProcessor.read()
+        self.assertIsNot(processor, restored)
+        self.assertEqual(0, restored.current_step)
+        self.assertEqual(processor.total_steps, restored.total_steps)
+        self.assertIsNone(restored.instructions)
+        self.assertIs(restored, ExecutionProcessor.read())
+
+    def testFlush(self):
+        processor = self.load()
+        processor.next_step()
+        processor.save()
+        for _ in range(10):
+            processor.next_instruction()
+        # played instructions aren't written on every one
+        self.assertEqual(0, self.readStateFile().step_completed_instructions)
+        processor._flushed_at -= ExecutionProcessor.FLUSH_INTERVAL + 1
+        processor.next_instruction()
+        self.assertEqual(11, self.readStateFile().step_completed_instructions)
+
+        processor.stop()
+        self.assertIsNone(ExecutionProcessor.read())
+        self.assertFalse(os.path.exists(ExecutionProcessor.state_filepath()))
+
+
+class FileCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = engine.FileCache('sublime-live-demo-test-cache-%d' % os.getpid(), max_entries=2)
+
+    def tearDown(self):
+        if os.path.isdir(self.cache.directory):
+            os.chmod(self.cache.directory, 0o700)
+        shutil.rmtree(self.cache.directory, True)
+
+    def testLeastRecentlyUsedEvicted(self):
+        keys = [self.cache.make_key('recording', index) for index in range(3)]
+        self.cache.put(keys[0], 'first')
+        self.cache.put(keys[1], 'second')
+        os.utime(self.cache.entry_filepath(keys[0]), (1000, 1000))
+        os.utime(self.cache.entry_filepath(keys[1]), (2000, 2000))
+        self.assertEqual('first', self.cache.get(keys[0]))
+        self.cache.put(keys[2], 'third')
+        self.assertEqual(['first', None, 'third'], [self.cache.get(key) for key in keys])
+        self.assertEqual((3, 1), (self.cache.hits, self.cache.misses))
+
+    @unittest.skipUnless(hasattr(os, 'getuid'), 'cache directory is private on POSIX only')
+    def testSharedDirectoryNotUsed(self):
+        key = self.cache.make_key('recording')
+        self.cache.put(key, 'value')
+        self.assertTrue(self.cache.is_private())
+        self.assertEqual(0o700, os.stat(self.cache.directory).st_mode & 0o777)
+        os.chmod(self.cache.directory, 0o777)
+        self.assertFalse(self.cache.is_private())
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(self.cache.make_key('other'), 'value')
+        self.assertEqual([key], os.listdir(self.cache.directory))
+
+
+class StepCacheTest(HeadlessTestCase):
+    def testChangesCached(self):
+        text = 'x = 1\n'
+        self.write('a.py', text)
+        step = ldml.LDMLStep('a.py', ldml.dmp.patch_make(text, 'x = 2\n'))
+        processor = ExecutionProcessor(self.writeRecording([step]))
+        processor.save()
+        processor.next_step()
+        self.assertEqual((0, 1), (engine.STEP_CHANGES_CACHE.hits, engine.STEP_CHANGES_CACHE.misses))
+
+        # Played again from the same text, the step isn't diffed again.
+        processor.reset()
+        processor.next_step()
+        self.assertEqual((1, 1), (engine.STEP_CHANGES_CACHE.hits, engine.STEP_CHANGES_CACHE.misses))
+
+        self.write('a.py', 'y = 0\n' + text)
+        processor.reset()
+        processor.next_step()
+        self.assertEqual((1, 2), (engine.STEP_CHANGES_CACHE.hits, engine.STEP_CHANGES_CACHE.misses))
+
+
+class PatchesCacheTest(HeadlessTestCase):
+    def setUp(self):
+        super(PatchesCacheTest, self).setUp()
+        self.patches_cache = self.recorder.PATCHES_CACHE
+        self.recorder.PATCHES_CACHE = engine.FileCache(
+            'sublime-live-demo-test-patches-%d' % os.getpid(), max_entries=8)
+
+    def tearDown(self):
+        shutil.rmtree(self.recorder.PATCHES_CACHE.directory, True)
+        self.recorder.PATCHES_CACHE = self.patches_cache
+        super(PatchesCacheTest, self).tearDown()
+
+    def testPatchesCached(self):
+        cache = self.recorder.PATCHES_CACHE
+        old = 'def f(x):\n    return x\n'
+        new = 'def f(x, y):\n    return x + y\n'
+        patches = self.recorder.make_patches(old, new)
+        self.assertEqual(ldml.dmp.patch_toText(ldml.dmp.patch_make(old, new)), ldml.dmp.patch_toText(patches))
+        self.assertEqual((0, 1), (cache.hits, cache.misses))
+        self.assertEqual(ldml.dmp.patch_toText(patches), ldml.dmp.patch_toText(self.recorder.make_patches(old, new)))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+        # patches made with other diff settings aren't reused
+        self.editor.load_settings('Live Demo.sublime-settings').set('diff_mode', 'word')
+        self.recorder.make_patches(old, new)
+        self.assertEqual((1, 2), (cache.hits, cache.misses))
+        self.recorder.make_patches(old, new + '\n')
+        self.assertEqual((1, 3), (cache.hits, cache.misses))
+
+
+class EditCaptureTest(HeadlessTestCase):
+    def setUp(self):
+        super(EditCaptureTest, self).setUp()
+        self.text = ''.join('line %d of the recorded file\n' % index for index in range(200))
+        self.write('a.py', self.text)
+        self.view = self.editor.window.open_file(self.path('a.py'))
+        self.capture = self.recorder.EditCapture(self.text)
+        self.recorder.EDIT_CAPTURES[self.view.file_name()] = self.capture
+
+    def tearDown(self):
+        self.recorder.EDIT_CAPTURES.clear()
+        super(EditCaptureTest, self).tearDown()
+
+    def type(self, position, text):
+        self.view.sel().clear()
+        self.view.sel().add(headless.Region(position))
+        self.view.insert(None, position, text)
+
+    def erase(self, begin, end):
+        self.view.sel().clear()
+        self.view.sel().add(headless.Region(end))
+        self.view.erase(None, headless.Region(begin, end))
+
+    def text_of(self, view):
+        return view.substr(headless.Region(0, view.size()))
+
+    def assertReproduced(self):
+        text = self.text_of(self.view)
+        self.assertTrue(self.capture.matches(text))
+        self.assertEqual(len(self.capture.edits), len(self.capture.timing()))
+        patches = self.capture.patches(self.recorder.recording_dmp())
+        self.assertEqual(text, ldml.LDMLStep('a.py', patches).apply(self.text))
+        for start, end, new_start, new_end in reversed(self.capture.hunks()):
+            text = text[:new_start] + self.text[start:end] + text[new_end:]
+        self.assertEqual(self.text, text)
+
+    def testHunks(self):
+        self.type(100, 'abc')
+        self.type(103, 'd')
+        self.type(3000, 'far')
+        self.erase(98, 101)
+        self.type(98, 'x')
+        self.assertEqual(5, len(self.capture.edits))
+        # touching edits are merged, the one after them shifted
+        self.assertEqual([(98, 100, 98, 102), (2996, 2996, 2998, 3001)], self.capture.hunks())
+        self.assertReproduced()
+
+    def testRandomEdits(self):
+        generator = random.Random(0)
+        for _ in range(300):
+            position = generator.randint(0, self.view.size())
+            if generator.random() < 0.3:
+                self.erase(max(0, position - generator.randint(1, 5)), position)
+            else:
+                self.type(position, generator.choice(['x', 'if ', '\n', '()', 'word ']))
+        self.assertReproduced()
+
+    def testEditAwayFromCursor(self):
+        self.type(100, 'abc')
+        self.view.sel().clear()
+        self.view.sel().add(headless.Region(0))
+        self.view.insert(None, self.view.size(), 'tail')
+        self.assertFalse(self.capture.matches(self.text_of(self.view)))
+
+
+if __name__ == '__main__':
+    unittest.main()
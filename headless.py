@@ -0,0 +1,313 @@
+"""In-process stand-in for the parts of Sublime Text API used by the plugin.
+
+Allows running commands, and with them the whole playback pipeline, outside
+of the editor (tests, profiling, benchmarks):
+
+    editor = headless.install(base_dir)
+    from . import live_demo  # has to be imported after install()
+    view = editor.window.open_file(recording_path)
+    view.run_command('live_demo_load')
+    view.run_command('live_demo_next_step')
+    editor.run()
+
+Views are plain text buffers, timeouts are run in order of their due time
+on a virtual clock, so playing a step takes only as long as computing it.
+"""
+import heapq
+import itertools
+import os.path
+import re
+import sys
+import types
+
+
+class Region(object):
+    def __init__(self, a, b=None):
+        self.a = a
+        self.b = a if b is None else b
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return self.end() - self.begin()
+
+    def empty(self):
+        return self.a == self.b
+
+    def __eq__(self, other):
+        return (self.a, self.b) == (other.a, other.b)
+
+    def __repr__(self):
+        return 'Region(%d, %d)' % (self.a, self.b)
+
+
+class Selection(object):
+    def __init__(self):
+        self.regions = []
+
+    def clear(self):
+        self.regions = []
+
+    def add(self, region):
+        self.regions.append(region)
+
+    def shift(self, position, delta):
+        """Moves points placed after position, as after inserting or erasing text."""
+        for region in self.regions:
+            for attr in ('a', 'b'):
+                point = getattr(region, attr)
+                if delta > 0 and point >= position:
+                    setattr(region, attr, point + delta)
+                elif delta < 0 and point > position:
+                    setattr(region, attr, max(position, point + delta))
+
+    def __getitem__(self, index):
+        return self.regions[index]
+
+    def __len__(self):
+        return len(self.regions)
+
+
+class Settings(object):
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+
+class Edit(object):
+    pass
+
+
+class View(object):
+    _ids = itertools.count(1)
+
+    def __init__(self, window, file_name=None, text=''):
+        self._id = next(self._ids)
+        self._window = window
+        self._file_name = file_name
+        self._name = None
+        self._text = text
+        self._selection = Selection()
+        self._selection.add(Region(0))
+        self.status = {}
+        self.syntax = None
+
+    def id(self):
+        return self._id
+
+    def window(self):
+        return self._window
+
+    def file_name(self):
+        return self._file_name
+
+    def name(self):
+        return self._name
+
+    def set_name(self, name):
+        self._name = name
+
+    def set_syntax_file(self, syntax):
+        self.syntax = syntax
+
+    def size(self):
+        return len(self._text)
+
+    def substr(self, region):
+        return self._text[region.begin():region.end()]
+
+    def sel(self):
+        return self._selection
+
+    def insert(self, edit, position, text):
+        self._text = self._text[:position] + text + self._text[position:]
+        self._selection.shift(position, len(text))
+        self._window.editor.dispatch('on_modified', self)
+        return len(text)
+
+    def erase(self, edit, region):
+        begin, end = region.begin(), region.end()
+        self._text = self._text[:begin] + self._text[end:]
+        self._selection.shift(begin, begin - end)
+        self._window.editor.dispatch('on_modified', self)
+
+    def replace(self, edit, region, text):
+        self.erase(edit, region)
+        self.insert(edit, region.begin(), text)
+
+    def find(self, pattern, start_point, flags=0):
+        match = re.compile(pattern).search(self._text, start_point)
+        if match is None:
+            return Region(-1)
+        return Region(match.start(), match.end())
+
+    def set_status(self, key, value):
+        self.status[key] = value
+
+    def save(self):
+        with open(self._file_name, 'w') as f:
+            f.write(self._text)
+
+    def run_command(self, name, args=None):
+        self._window.editor.run_text_command(self, name, args or {})
+
+
+class Window(object):
+    def __init__(self, editor, folders):
+        self.editor = editor
+        self._folders = folders
+        self._views = []
+        self.active = None
+
+    def folders(self):
+        return self._folders
+
+    def views(self):
+        return list(self._views)
+
+    def active_view(self):
+        return self.active
+
+    def new_file(self):
+        return self._add_view(View(self))
+
+    def open_file(self, file_path):
+        file_path = os.path.abspath(file_path)
+        for view in self._views:
+            if view.file_name() == file_path:
+                self.active = view
+                return view
+        text = ''
+        if os.path.exists(file_path):
+            with open(file_path, 'r') as f:
+                text = f.read()
+        return self._add_view(View(self, file_path, text))
+
+    def _add_view(self, view):
+        self._views.append(view)
+        self.active = view
+        return view
+
+    def show_input_panel(self, caption, initial_text, on_done, on_change, on_cancel):
+        self.editor.input_panels.append((caption, initial_text, on_done))
+
+
+class Editor(object):
+    """Headless editor: the window, timeouts and command dispatching."""
+    def __init__(self, base_dir):
+        self.window = Window(self, [base_dir])
+        self.clock = 0
+        self.timeouts = []
+        self.timeouts_counter = itertools.count()
+        self.messages = []
+        self.input_panels = []
+        self.settings = {}
+        self.commands_run = 0
+        self.listeners = None
+
+    def monotonic(self):
+        """Virtual clock in seconds, a stand-in for time.monotonic()."""
+        return self.clock / 1000.0
+
+    def set_timeout(self, callback, delay=0):
+        due = self.clock + max(0, delay)
+        heapq.heappush(self.timeouts, (due, next(self.timeouts_counter), callback))
+
+    def run(self, limit=None):
+        """Runs scheduled timeouts until there are none left (or limit is reached)."""
+        executed = 0
+        while self.timeouts and (limit is None or executed < limit):
+            due, _, callback = heapq.heappop(self.timeouts)
+            self.clock = max(self.clock, due)
+            callback()
+            executed += 1
+        return executed
+
+    def run_text_command(self, view, name, args):
+        if name == 'save':
+            view.save()
+            return
+        command_class = self.find_command(name)
+        if command_class is None:
+            return
+        command = command_class(view)
+        if command.is_enabled(**args) is False:
+            return
+        self.commands_run += 1
+        command.run(Edit(), **args)
+
+    def dispatch(self, event, view):
+        """Calls the event handler of every event listener."""
+        if self.listeners is None:
+            self.listeners = [listener_class() for listener_class in sublime_plugin.EventListener.__subclasses__()]
+        for listener in self.listeners:
+            handler = getattr(listener, event, None)
+            if handler is not None:
+                handler(view)
+
+    def find_command(self, name):
+        classes = list(sublime_plugin.TextCommand.__subclasses__())
+        while classes:
+            command_class = classes.pop()
+            if command_name(command_class) == name:
+                return command_class
+            classes.extend(command_class.__subclasses__())
+
+    def load_settings(self, name):
+        if name not in self.settings:
+            self.settings[name] = Settings()
+        return self.settings[name]
+
+
+def command_name(command_class):
+    name = command_class.__name__
+    if name.endswith('Command'):
+        name = name[:-len('Command')]
+    return re.sub(r'(?<!^)(?=[A-Z])', '_', name).lower()
+
+
+class TextCommand(object):
+    def __init__(self, view):
+        self.view = view
+
+    def is_enabled(self, *args, **kwargs):
+        return True
+
+    def run(self, edit, **kwargs):
+        pass
+
+
+class EventListener(object):
+    pass
+
+
+sublime = types.ModuleType('sublime')
+sublime.Region = Region
+sublime_plugin = types.ModuleType('sublime_plugin')
+sublime_plugin.TextCommand = TextCommand
+sublime_plugin.EventListener = EventListener
+
+
+def install(base_dir):
+    """Registers fake sublime and sublime_plugin modules for a new editor.
+
+    Plugin modules have to be imported after the first install() call.
+    """
+    editor = Editor(base_dir)
+    sublime.active_window = lambda: editor.window
+    sublime.set_timeout = editor.set_timeout
+    sublime.load_settings = editor.load_settings
+    sublime.error_message = editor.messages.append
+    sublime.message_dialog = editor.messages.append
+    sys.modules['sublime'] = sublime
+    sys.modules['sublime_plugin'] = sublime_plugin
+    return editor
@@ -1,7 +1,4 @@
-import hashlib
 import os.path
-import pickle
-import tempfile
 
 import sublime
 
@@ -55,6 +52,14 @@ class SublimeTextHelpers(object):
             view.erase(self.edit, sublime.Region(0, view.size()))
         self.write(view, text)
 
+    def view_tail(self, view, length):
+        size = view.size()
+        return view.substr(sublime.Region(max(0, size - length), size))
+
+    def replace_tail(self, view, length, text):
+        size = view.size()
+        view.replace(self.edit, sublime.Region(size - length, size), text)
+
     def set_cursor(self, view, position):
         view.sel().clear()
         view.sel().add(sublime.Region(position))
@@ -72,40 +77,3 @@ class SublimeTextHelpers(object):
 
     def view_content(self, view):
         return view.substr(sublime.Region(0, view.size()))
-
-
-class StatefulProcessor(object):
-    __VERSION__ = None
-    STATE_FILE_KEY = None
-
-    @classmethod
-    def get_base_dir(cls):
-        return sublime.active_window().folders()[0]
-
-    @classmethod
-    def state_filepath(cls):
-        base_dir = cls.get_base_dir()
-        return os.path.join(tempfile.gettempdir(), cls.STATE_FILE_KEY) + hashlib.md5(base_dir.encode('utf-8')).hexdigest()
-
-    def save(self):
-        pickle.dump(self, open(self.state_filepath(), "wb"))
-
-    def delete(self):
-        try:
-            os.unlink(self.state_filepath())
-        except:
-            pass
-
-    def validate(self):
-        return True
-
-    @classmethod
-    def read(cls):
-        try:
-            obj = pickle.load(open(cls.state_filepath(), "rb"))
-            if obj.__VERSION__ != cls.__VERSION__:
-                raise Exception('Version mismatch')
-            if obj.validate():
-                return obj
-        except:
-            pass
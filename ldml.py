@@ -1,51 +1,101 @@
+import hashlib
+import io
+import mmap
+import os
+import re
+import struct
+import weakref
 import xml.etree.ElementTree as ET
-from xml.dom import minidom
+from concurrent.futures import ThreadPoolExecutor
+from xml.parsers import expat
+from xml.sax.saxutils import escape
 
-from .diff_match_patch import diff_match_patch
+from .diff_match_patch import diff_match_patch, patch_obj
 
 _NS = 'http://digit11.com/live_demo'
 NS = '{' + _NS + '}'
 
 dmp = diff_match_patch()
-ET.register_namespace('ld', _NS)
+
+# End of recording document: closing root tag, or whole root tag if empty.
+RECORDING_END_RE = re.compile(
+    r'(?:</(?P<prefix>[\w.-]+:)?recording\s*>'
+    r'|<(?P<empty_tag>(?P<empty_prefix>[\w.-]+:)?recording\b[^<>]*?)/>)\s*$'
+)
+RECORDING_END_MAX_LENGTH = 4096
+
+# Compiled recording files are written off the main thread, one at a time.
+COMPILING = ThreadPoolExecutor(max_workers=1)
+
+
+def strip_diffs(text):
+    """Strips indentation around patches text, keeping trailing spaces of its
+    last line (those are part of the patch)."""
+    text = text.lstrip()
+    end = text.rfind('\n')
+    if end != -1 and not text[end:].strip():
+        text = text[:end + 1]
+    return text
 
 
 class LDMLStep(object):
     PASTE = 'PASTE'
     TYPE = 'TYPE'
 
-    def __init__(self, filename, diffs, method=None, clear=False):
+    def __init__(self, filename, diffs, method=None, clear=False, timing=None):
         self.filename = filename
         self.diffs = diffs
         self.method = method or self.TYPE
         self.clear = False if clear is None else clear
+        # milliseconds between recorded edits, None if not recorded
+        self.timing = timing
 
-    def process_changes(self, init_text):
+    def apply(self, init_text):
         final_text, _ = dmp.patch_apply(self.diffs, init_text)
+        return final_text
+
+    def process_changes(self, init_text):
+        changes = dmp.patch_apply_exact_replacements(self.diffs, init_text)
+        if changes is not None:
+            return changes
+        # Patches had to be fuzzy matched, so they're recalculated for
+        # the actual text to get exact replacements.
+        final_text = self.apply(init_text)
         perfect_patches = dmp.patch_make(init_text, final_text)
         return dmp.patch_apply_perfect_replacements(perfect_patches, init_text)
 
-    def generate_etree(self):
-        element = ET.Element(NS + 'step')
-        subelement = ET.SubElement(element, NS + 'filename')
-        subelement.text = self.filename
-        subelement = ET.SubElement(element, NS + 'method')
-        subelement.text = self.method
-        subelement = ET.SubElement(element, NS + 'clear')
-        subelement.text = str(self.clear).lower()
-        subelement = ET.SubElement(element, NS + 'diffs')
-        subelement.text = '\n'.join(map(str, self.diffs))
-        return element
+    def dump(self, prefix='', indent='    '):
+        """Serializes step as indented XML with diffs in CDATA section.
+
+        prefix is the namespace prefix (with colon) used in the document.
+        """
+        diffs = dmp.patch_toText(self.diffs).replace(']]>', ']]]]><![CDATA[>')
+        timing = ''
+        if self.timing is not None:
+            timing = '{i}{i}<{p}timing>{timing}</{p}timing>\n'.format(
+                i=indent, p=prefix, timing=' '.join(map(str, self.timing)))
+        return (
+            '{i}<{p}step>\n'
+            '{i}{i}<{p}filename>{filename}</{p}filename>\n'
+            '{i}{i}<{p}method>{method}</{p}method>\n'
+            '{i}{i}<{p}clear>{clear}</{p}clear>\n'
+            '{i}{i}<{p}diffs><![CDATA[\n{diffs}{i}{i}]]></{p}diffs>\n'
+            '{timing}'
+            '{i}</{p}step>\n'
+        ).format(i=indent, p=prefix, filename=escape(self.filename), method=self.method,
+                 clear=str(self.clear).lower(), diffs=diffs, timing=timing)
 
     @classmethod
     def create_from_etree(cls, etree):
         method_element = etree.find(NS + 'method')
         clear_element = etree.find(NS + 'clear')
+        timing_element = etree.find(NS + 'timing')
         return cls(
             filename=etree.find(NS + 'filename').text.strip(),
-            diffs=dmp.patch_fromText(etree.find(NS + 'diffs').text.strip()),
+            diffs=dmp.patch_fromText(strip_diffs(etree.find(NS + 'diffs').text)),
             method=None if method_element is None else method_element.text.strip().upper(),
-            clear=None if clear_element is None else clear_element.text.lower() in ('true', '1', 'yes')
+            clear=None if clear_element is None else clear_element.text.lower() in ('true', '1', 'yes'),
+            timing=None if timing_element is None else [int(delay) for delay in (timing_element.text or '').split()]
         )
 
 
@@ -53,33 +103,365 @@ class LDML(object):
     def __init__(self, steps=None):
         self.steps = steps or []
 
-    def generate_etree(self):
-        element = ET.Element(NS + 'recording')
+    def write(self, f):
+        """Writes recording to text file object, one step at a time."""
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        f.write('<recording xmlns="%s">\n' % _NS)
         for step in self.steps:
-            subelement = step.generate_etree()
-            element.append(subelement)
-        return element
+            f.write(step.dump())
+        f.write('</recording>\n')
 
     def dump(self):
-        element = self.generate_etree()
-        output = ET.tostring(element).decode('utf-8')
-        output_minidom = minidom.parseString(output)
-        return output_minidom.toprettyxml()
+        output = io.StringIO()
+        self.write(output)
+        return output.getvalue()
 
-    def add_step(self, filename, diffs, method, clear):
+    def add_step(self, filename, diffs, method, clear, timing=None):
         self.steps.append(
-            LDMLStep(filename, diffs, method, clear)
+            LDMLStep(filename, diffs, method, clear, timing)
         )
 
+
+class LazySteps(object):
+    """Steps of a recording file, decoded from the file only when accessed.
+
+    Only the last accessed step is kept decoded, so memory used doesn't
+    depend on the size of recording. Steps added with append() are kept
+    in memory. Subclasses define how many steps are stored in the file
+    (stored_count) and how to decode them (decode).
+    """
+    stored_count = 0
+
+    def __init__(self):
+        self.added = []
+        self.decoded_index = None
+        self.decoded_step = None
+
+    def __len__(self):
+        return self.stored_count + len(self.added)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('step index out of range')
+        if index >= self.stored_count:
+            return self.added[index - self.stored_count]
+        if index != self.decoded_index:
+            self.decoded_step = self.decode(index)
+            self.decoded_index = index
+        return self.decoded_step
+
+    def append(self, step):
+        self.added.append(step)
+
+    def decode(self, index):
+        raise NotImplementedError
+
+
+class XMLSteps(LazySteps):
+    """Steps decoded from byte ranges of <step> elements in LDML file."""
+    def __init__(self, file_path, spans, namespaces):
+        super(XMLSteps, self).__init__()
+        self.file_path = file_path
+        self.spans = spans  # (start of step tag, start of step closing tag)
+        self.namespaces = namespaces
+        self.stored_count = len(spans)
+
+    def decode(self, index):
+        start, end = self.spans[index]
+        with open(self.file_path, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start)
+            closing_tag = f.read(256)
+        data += closing_tag[:closing_tag.index(b'>') + 1]
+        declarations = ''.join(
+            ' xmlns%s="%s"' % (':' + prefix if prefix else '', uri)
+            for prefix, uri in self.namespaces.items()
+        )
+        wrapper = '<recording%s>' % declarations
+        element = ET.fromstring(wrapper.encode('utf-8') + data + b'</recording>')
+        return LDMLStep.create_from_etree(element[0])
+
+
+class CompiledSteps(LazySteps):
+    """Steps decoded from compiled recording (.ldmlc) file mapped to memory.
+
+    File layout (little endian):
+      header: COMPILED_MAGIC, md5 digest of source LDML file, steps count
+      index: offset of every step record
+      step record: filename, method, clear, patches count and for every
+        patch start1, length1, start2, length2, diffs count and diffs
+        (operation and text), then timing: count of delays (COMPILED_NO_TIMING
+        if there's no timing) and the delays
+    Texts are stored as length prefixed UTF-8.
+
+    Files mapped by live instances are closed before the file is replaced
+    (Windows doesn't allow replacing mapped files), they're mapped again
+    when a step is decoded, if the file is still compiled from the same
+    source.
+    """
+    _instances = weakref.WeakSet()
+
+    def __init__(self, file_path):
+        super(CompiledSteps, self).__init__()
+        self.file_path = file_path
+        self.data = None
+        self.source_digest = None
+        self.open()
+
+    def open(self):
+        with open(self.file_path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _, source_digest, stored_count = COMPILED_HEADER.unpack_from(data, 0)
+        if self.source_digest is not None and source_digest != self.source_digest:
+            data.close()
+            raise ValueError('Recording file %s has changed.' % self.file_path)
+        self.data = data
+        self.source_digest = source_digest
+        self.stored_count = stored_count
+        self._instances.add(self)
+
     @classmethod
-    def create_from_etree(cls, etree):
-        return cls(steps=[
-            LDMLStep.create_from_etree(step_xml)
-            for step_xml in etree.findall(NS + 'step')
-        ])
+    def close_file(cls, file_path):
+        """Closes all instances mapping the file."""
+        file_path = os.path.abspath(file_path)
+        for steps in list(cls._instances):
+            if os.path.abspath(steps.file_path) == file_path:
+                steps.close()
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['data'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.open()
+
+    def decode(self, index):
+        if self.data is None:
+            self.open()
+        data = self.data
+        offset, = COMPILED_OFFSET.unpack_from(data, COMPILED_HEADER.size + index * COMPILED_OFFSET.size)
+        filename, offset = _unpack_text(data, offset)
+        method, offset = _unpack_text(data, offset)
+        clear, patches_count = COMPILED_STEP.unpack_from(data, offset)
+        offset += COMPILED_STEP.size
+        patches = []
+        for _ in range(patches_count):
+            patch = patch_obj()
+            (patch.start1, patch.length1, patch.start2, patch.length2,
+             diffs_count) = COMPILED_PATCH.unpack_from(data, offset)
+            offset += COMPILED_PATCH.size
+            for _ in range(diffs_count):
+                operation, = COMPILED_DIFF.unpack_from(data, offset)
+                text, offset = _unpack_text(data, offset + COMPILED_DIFF.size)
+                patch.diffs.append((operation, text))
+            patches.append(patch)
+        timing_count, = COMPILED_TIMING_COUNT.unpack_from(data, offset)
+        timing = None
+        if timing_count != COMPILED_NO_TIMING:
+            timing = list(struct.unpack_from('<%dH' % timing_count, data, offset + COMPILED_TIMING_COUNT.size))
+        return LDMLStep(filename, patches, method, bool(clear), timing)
+
+
+COMPILED_MAGIC = b'LDMLC\x02'
+COMPILED_HEADER = struct.Struct('<6s16sI')
+COMPILED_OFFSET = struct.Struct('<Q')
+COMPILED_TEXT_LENGTH = struct.Struct('<I')
+COMPILED_STEP = struct.Struct('<BI')
+COMPILED_PATCH = struct.Struct('<iiiiI')
+COMPILED_DIFF = struct.Struct('<b')
+COMPILED_TIMING_COUNT = struct.Struct('<I')
+COMPILED_NO_TIMING = 0xffffffff
+
+
+def _pack_text(text):
+    data = text.encode('utf-8')
+    return COMPILED_TEXT_LENGTH.pack(len(data)) + data
+
+
+def _unpack_text(data, offset):
+    length, = COMPILED_TEXT_LENGTH.unpack_from(data, offset)
+    offset += COMPILED_TEXT_LENGTH.size
+    return data[offset:offset + length].decode('utf-8'), offset + length
+
+
+def compiled_filepath(file_path):
+    return os.path.splitext(file_path)[0] + '.ldmlc'
+
+
+def compile_recording(steps, source_digest, file_path):
+    """Writes compiled recording file, decoding one step at a time."""
+    tmp_file_path = '%s.%d.tmp' % (file_path, os.getpid())
+    try:
+        _write_compiled(steps, source_digest, tmp_file_path)
+        CompiledSteps.close_file(file_path)
+        os.replace(tmp_file_path, file_path)
+    finally:
+        if os.path.exists(tmp_file_path):
+            os.unlink(tmp_file_path)
+
+
+def _write_compiled(steps, source_digest, file_path):
+    with open(file_path, 'wb') as f:
+        f.write(COMPILED_HEADER.pack(COMPILED_MAGIC, source_digest, len(steps)))
+        index_offset = f.tell()
+        f.write(COMPILED_OFFSET.pack(0) * len(steps))
+        offsets = []
+        for step in steps:
+            offsets.append(f.tell())
+            f.write(_pack_text(step.filename))
+            f.write(_pack_text(step.method))
+            f.write(COMPILED_STEP.pack(bool(step.clear), len(step.diffs)))
+            for patch in step.diffs:
+                f.write(COMPILED_PATCH.pack(patch.start1, patch.length1, patch.start2,
+                                            patch.length2, len(patch.diffs)))
+                for operation, text in patch.diffs:
+                    f.write(COMPILED_DIFF.pack(operation))
+                    f.write(_pack_text(text))
+            if step.timing is None:
+                f.write(COMPILED_TIMING_COUNT.pack(COMPILED_NO_TIMING))
+            else:
+                f.write(COMPILED_TIMING_COUNT.pack(len(step.timing)))
+                f.write(struct.pack('<%dH' % len(step.timing), *[min(delay, 0xffff) for delay in step.timing]))
+        f.seek(index_offset)
+        f.write(b''.join(COMPILED_OFFSET.pack(offset) for offset in offsets))
+
+
+def is_compiled(file_path, source_digest):
+    """Returns True if the file exists and has been compiled from source
+    with given digest."""
+    try:
+        with open(file_path, 'rb') as f:
+            header = f.read(COMPILED_HEADER.size)
+        magic, digest, _ = COMPILED_HEADER.unpack(header)
+    except (IOError, OSError, struct.error):
+        return False
+    return magic == COMPILED_MAGIC and digest == source_digest
+
+
+def read_compiled(file_path, source_digest):
+    """Returns compiled steps if the file exists and has been compiled from
+    source with given digest, None otherwise."""
+    if not is_compiled(file_path, source_digest):
+        return
+    return CompiledSteps(file_path)
+
+
+def file_digest(file_path):
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            md5.update(chunk)
+    return md5.digest()
+
+
+def parse_xml(file_path):
+    """Reads LDML file without decoding its steps, see XMLSteps."""
+    step_name = _NS + ' step'
+    namespaces = {}
+    spans = []
+    state = {'depth': 0, 'start': None}
+    parser = expat.ParserCreate(namespace_separator=' ')
+
+    def start_namespace(prefix, uri):
+        if state['depth'] == 0:
+            namespaces[prefix] = uri
+
+    def start_element(name, attrs):
+        state['depth'] += 1
+        if state['depth'] == 2 and name == step_name:
+            state['start'] = parser.CurrentByteIndex
+
+    def end_element(name):
+        if state['depth'] == 2 and name == step_name:
+            spans.append((state['start'], parser.CurrentByteIndex))
+        state['depth'] -= 1
+
+    parser.StartNamespaceDeclHandler = start_namespace
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    with open(file_path, 'rb') as f:
+        parser.ParseFile(f)
+    return LDML(steps=XMLSteps(file_path, spans, namespaces))
+
+
+def parse(file_path, digest=None):
+    """Reads recording file, steps are decoded only when accessed.
+
+    Steps are read from compiled recording file (.ldmlc) next to the LDML
+    file if it's been compiled from this version of the LDML file (digest
+    is its file_digest, computed if not given). Otherwise they're read from
+    the LDML file and the compiled file is written in background, to be
+    read the next time the recording is loaded.
+    """
+    if digest is None:
+        digest = file_digest(file_path)
+    steps = read_compiled(compiled_filepath(file_path), digest)
+    if steps is not None:
+        return LDML(steps=steps)
+    recording = parse_xml(file_path)
+    COMPILING.submit(compile_parsed, file_path, digest)
+    return recording
+
+
+def compile_parsed(file_path, digest):
+    """Writes compiled file of LDML file with given digest. Runs in the
+    compiling thread, steps are parsed again, not to share decoded ones."""
+    compiled_file_path = compiled_filepath(file_path)
+    if is_compiled(compiled_file_path, digest):
+        return
+    compile_recording(parse_xml(file_path).steps, digest, compiled_file_path)
+    if file_digest(file_path) != digest:
+        # changed while compiled, steps may come from the new version
+        CompiledSteps.close_file(compiled_file_path)
+        os.unlink(compiled_file_path)
+
+
+def append_step_text(tail, step):
+    """Computes change adding step to the end of recording document.
+
+    Args:
+      tail: Ending of the document, at least RECORDING_END_MAX_LENGTH long
+        (unless whole document is shorter).
+      step: LDMLStep to add.
+
+    Returns:
+      Number of characters at the end of document to be replaced
+      and the text replacing them.
+    """
+    match = RECORDING_END_RE.search(tail)
+    if match is None:
+        raise ValueError('Closing recording tag not found.')
+    if match.group('empty_tag'):
+        prefix = match.group('empty_prefix') or ''
+        text = '<%s>\n%s</%srecording>\n' % (match.group('empty_tag').rstrip(), step.dump(prefix), prefix)
+    else:
+        prefix = match.group('prefix') or ''
+        text = '%s</%srecording>\n' % (step.dump(prefix), prefix)
+    return len(tail) - match.start(), text
 
 
-def parse(file_path):
-    tree = ET.parse(file_path)
-    root = tree.getroot()
-    return LDML.create_from_etree(root)
+def append_step(file_path, step):
+    """Adds step to recording file in place, without rewriting the whole file."""
+    with open(file_path, 'r+b') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - RECORDING_END_MAX_LENGTH))
+        # replaced ending is plain ascii, so its length in bytes and characters is the same
+        tail = f.read().decode('utf-8', 'replace')
+        replaced_length, text = append_step_text(tail, step)
+        f.seek(size - replaced_length)
+        f.truncate()
+        f.write(text.encode('utf-8'))
@@ -0,0 +1,156 @@
+"""Tests of reading and writing LDML recordings.
+
+Run from the Sublime Text Packages directory:
+
+    python3 -m unittest "Live Demo.ldml_test"
+
+or as a script from the plugin directory.
+"""
+import importlib
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Plugin modules import each other relatively, so when the tests are run
+# as a script (or by pytest) from the plugin directory, they're imported
+# from the package the directory is.
+PACKAGE = __package__
+if not PACKAGE:
+    PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+    PACKAGE = os.path.basename(PLUGIN_DIR)
+
+ldml = importlib.import_module('.ldml', PACKAGE)
+
+
+EXAMPLE_RECORDING = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'example_recording.ldml')
+
+
+class LDMLTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.directory, 'recording.ldml')
+
+    def tearDown(self):
+        self.waitCompiled()
+        shutil.rmtree(self.directory)
+
+    def waitCompiled(self):
+        # compiled files are written one at a time, in order
+        ldml.COMPILING.submit(lambda: None).result()
+
+    def assertStepsEqual(self, expected, actual):
+        self.assertEqual(len(expected), len(actual))
+        for expected_step, step in zip(expected, actual):
+            self.assertEqual(expected_step.filename, step.filename)
+            self.assertEqual(expected_step.method, step.method)
+            self.assertEqual(expected_step.clear, step.clear)
+            self.assertEqual(expected_step.timing, step.timing)
+            self.assertEqual(ldml.dmp.patch_toText(expected_step.diffs), ldml.dmp.patch_toText(step.diffs))
+
+    def write(self, recording):
+        with open(self.file_path, 'w', encoding='utf-8') as f:
+            recording.write(f)
+
+    def testParse(self):
+        recording = ldml.parse(EXAMPLE_RECORDING)
+        self.assertEqual(2, len(recording.steps))
+        self.assertIsNone(recording.steps[0].timing)
+        self.assertEqual('mydir/my_tests.py', recording.steps[0].filename)
+        self.assertEqual(ldml.LDMLStep.PASTE, recording.steps[0].method)
+        self.assertTrue(recording.steps[0].clear)
+        self.assertEqual(ldml.LDMLStep.TYPE, recording.steps[1].method)
+        self.assertFalse(recording.steps[1].clear)
+        self.assertEqual(8, len(recording.steps[1].diffs))
+
+    def testRoundTrip(self):
+        recording = ldml.parse(EXAMPLE_RECORDING)
+        text1 = 'x = 1\nprint(x)  \n'
+        text2 = 'x = 2  \nprint(x, "]]>", \'<&>\')  \n'
+        steps = list(recording.steps) + [
+            ldml.LDMLStep('dir/a&b.py', ldml.dmp.patch_make(text1, text2), ldml.LDMLStep.PASTE, True),
+            ldml.LDMLStep('dir/c.py', ldml.dmp.patch_make(text1, text2), timing=[0, 120, 85, 1000]),
+            ldml.LDMLStep('dir/d.py', ldml.dmp.patch_make(text1, text2), timing=[]),
+        ]
+        self.write(ldml.LDML(steps))
+        self.assertStepsEqual(steps, ldml.parse(self.file_path).steps)
+
+    def testRoundTripEmpty(self):
+        self.write(ldml.LDML())
+        self.assertEqual(0, len(ldml.parse(self.file_path).steps))
+
+    def testAppendStep(self):
+        steps = list(ldml.parse(EXAMPLE_RECORDING).steps)
+        self.write(ldml.LDML(steps[:1]))
+        ldml.append_step(self.file_path, steps[1])
+        self.assertStepsEqual(steps, ldml.parse(self.file_path).steps)
+
+        # Prefixed, empty root element.
+        with open(self.file_path, 'w') as f:
+            f.write('<ld:recording xmlns:ld="%s" />\n' % ldml._NS)
+        for step in steps:
+            ldml.append_step(self.file_path, step)
+        self.assertStepsEqual(steps, ldml.parse(self.file_path).steps)
+
+    def testCompiledRecording(self):
+        steps = list(ldml.parse(EXAMPLE_RECORDING).steps)
+        steps.append(ldml.LDMLStep('a.py', steps[1].diffs, timing=[0, 70, 65535]))
+        self.write(ldml.LDML(steps))
+        compiled_file_path = ldml.compiled_filepath(self.file_path)
+
+        # Recording is read from LDML until it's compiled in background.
+        recording = ldml.parse(self.file_path)
+        self.assertIsInstance(recording.steps, ldml.XMLSteps)
+        self.assertStepsEqual(steps, recording.steps)
+        self.waitCompiled()
+        self.assertTrue(os.path.exists(compiled_file_path))
+        recording = ldml.parse(self.file_path)
+        self.assertIsInstance(recording.steps, ldml.CompiledSteps)
+        self.assertStepsEqual(steps, recording.steps)
+        recording.steps.close()
+
+        # Stale compiled file is replaced.
+        self.write(ldml.LDML(steps[1:]))
+        self.assertIsInstance(ldml.parse(self.file_path).steps, ldml.XMLSteps)
+        self.waitCompiled()
+        recording = ldml.parse(self.file_path, ldml.file_digest(self.file_path))
+        self.assertIsInstance(recording.steps, ldml.CompiledSteps)
+        self.assertStepsEqual(steps[1:], recording.steps)
+        recording.steps.close()
+
+    def testCompiledRecordingReplaced(self):
+        steps = list(ldml.parse(EXAMPLE_RECORDING).steps)
+        self.write(ldml.LDML(steps))
+        ldml.parse(self.file_path)
+        self.waitCompiled()
+        recording = ldml.parse(self.file_path)
+        self.assertStepsEqual(steps, recording.steps)
+
+        # File mapped by the live recording is closed before it's replaced,
+        # and can't be read once it's compiled from a different source.
+        self.write(ldml.LDML(steps[1:]))
+        self.assertStepsEqual(steps[1:], ldml.parse(self.file_path).steps)
+        self.waitCompiled()
+        self.assertIsNone(recording.steps.data)
+        with self.assertRaises(ValueError):
+            recording.steps.decode(0)
+
+    def testRecordingChangedWhileCompiled(self):
+        steps = list(ldml.parse(EXAMPLE_RECORDING).steps)
+        self.write(ldml.LDML(steps))
+        digest = ldml.file_digest(self.file_path)
+        self.write(ldml.LDML(steps[1:]))
+        ldml.compile_parsed(self.file_path, digest)
+        self.assertFalse(os.path.exists(ldml.compiled_filepath(self.file_path)))
+
+    def testCompileRecordingError(self):
+        compiled_file_path = ldml.compiled_filepath(self.file_path)
+        with self.assertRaises(AttributeError):
+            ldml.compile_recording([ldml.LDMLStep(None, [])], b'\0' * 16, compiled_file_path)
+        self.assertEqual([], os.listdir(self.directory))
+
+
+if __name__ == '__main__':
+    unittest.main()
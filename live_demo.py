@@ -2,13 +2,13 @@ import os
 import os.path
 import random
 from shutil import copyfile
-from collections import deque
 
 import sublime
 import sublime_plugin
 
 from . import ldml
-from .helpers import StatefulProcessor, SublimeTextHelpers
+from .engine import ExecutionProcessor
+from .helpers import SublimeTextHelpers
 
 
 PLUGIN_DIR = os.path.dirname(__file__)
@@ -27,8 +27,14 @@ def reload_menu():
     copyfile(menu_file_name, TARGET_MENU_FILE_PATH)
 
 
+def load_diff_backend():
+    s = sublime.load_settings("Live Demo.sublime-settings")
+    ldml.dmp.Diff_Backend = s.get('diff_backend', 'auto')
+
+
 def plugin_loaded():
     reload_menu()
+    load_diff_backend()
 
 
 class LiveDemoLoadCommand(sublime_plugin.TextCommand):
@@ -42,10 +48,51 @@ class LiveDemoLoadCommand(sublime_plugin.TextCommand):
             helper.error_message('Error loading recording file %s.\n\n%r' % (base_filename, e))
         else:
             processor.save()
+            s = sublime.load_settings("Live Demo.sublime-settings")
+            if s.get('compile_on_load', False):
+                self.view.run_command('live_demo_compile')
+                return
             msg = 'Loaded %d steps.\n\nRun "Play next step" command to start.'
             helper.message_dialog(msg % processor.total_steps)
 
 
+class LiveDemoCompileCommand(sublime_plugin.TextCommand):
+    POLL_INTERVAL = 100  # ms between checks if the recording is compiled
+
+    def run(self, edit):
+        helper = SublimeTextHelpers(edit)
+        processor = ExecutionProcessor.read()
+        s = sublime.load_settings("Live Demo.sublime-settings")
+        compiling = processor.start_compile(processes=s.get('compile_processes', False))
+        self.wait_for_compile(processor, compiling, helper)
+
+    def wait_for_compile(self, processor, compiling, helper, polls=0):
+        if ExecutionProcessor.read() is not processor or processor.compiling is not compiling:
+            # stopped, reset or jumped in the meantime
+            helper.set_status(self.view, '')
+            return
+        try:
+            compiled = processor.compile_ready()
+        except Exception as e:
+            helper.set_status(self.view, '')
+            helper.error_message('Error compiling recording.\n\n%r' % e)
+            return
+        if compiled is not None:
+            helper.set_status(self.view, '')
+            msg = 'Compiled %d steps.\n\nRun "Play next step" command to start.'
+            helper.message_dialog(msg % compiled)
+            return
+        helper.set_status(self.view, 'Compiling recording ' + '.' * (polls % 4 + 1))
+        sublime.set_timeout(lambda: self.wait_for_compile(processor, compiling, helper, polls + 1),
+                            self.POLL_INTERVAL)
+
+    def is_enabled(self, *args, **kwargs):
+        processor = ExecutionProcessor.read()
+        if not processor:
+            return False
+        return processor.has_more_steps() and not processor.is_playing()
+
+
 class LiveDemoResetCommand(sublime_plugin.TextCommand):
     def run(self, edit):
         helper = SublimeTextHelpers(edit)
@@ -62,17 +109,39 @@ class LiveDemoResetCommand(sublime_plugin.TextCommand):
 
 
 class LiveDemoNextStep(sublime_plugin.TextCommand):
+    POLL_INTERVAL = 100  # ms between checks if the step is prepared
+
     def run(self, edit):
         helper = SublimeTextHelpers(edit)
         processor = ExecutionProcessor.read()
         try:
-            processor.next_step()
+            processor.start_next_step()
         except Exception:
             helper.error_message('No next step defined.')
             processor.stop()
         else:
+            self.wait_for_step(processor, helper)
+
+    def wait_for_step(self, processor, helper, polls=0):
+        # The step is prepared in background, the editor stays responsive.
+        if ExecutionProcessor.read() is not processor:
+            # stopped in the meantime
+            return
+        try:
+            ready = processor.step_ready()
+        except Exception as e:
+            helper.set_status(self.view, '')
+            helper.error_message('Error preparing step %d.\n\n%r' % (processor.current_step + 1, e))
+            processor.stop()
+            return
+        if ready:
+            helper.set_status(self.view, '')
             processor.save()
             self.view.run_command("live_demo_play_sub")
+            return
+        message = 'Preparing step %d ' % (processor.current_step + 1) + '.' * (polls % 4 + 1)
+        helper.set_status(self.view, message)
+        sublime.set_timeout(lambda: self.wait_for_step(processor, helper, polls + 1), self.POLL_INTERVAL)
 
     def is_enabled(self, *args, **kwargs):
         processor = ExecutionProcessor.read()
@@ -81,6 +150,54 @@ class LiveDemoNextStep(sublime_plugin.TextCommand):
         return processor.has_more_steps()
 
 
+class LiveDemoJumpToStepCommand(sublime_plugin.TextCommand):
+    def run(self, edit, step=None):
+        helper = SublimeTextHelpers(edit)
+        processor = ExecutionProcessor.read()
+        if step is None:
+            self.ask_step(processor)
+            return
+        try:
+            processor.fast_forward(step - 1)
+        except ValueError as e:
+            helper.error_message(str(e))
+        else:
+            if step > processor.total_steps:
+                helper.message_dialog('All %d steps have been applied, recording is finished.' % processor.total_steps)
+            else:
+                helper.message_dialog('Run "Play next step" command to play step %d.' % step)
+
+    def ask_step(self, processor):
+        def on_done(text):
+            try:
+                step = int(text)
+            except ValueError:
+                return
+            self.view.run_command('live_demo_jump_to_step', {'step': step})
+
+        first_step = processor.next_step_index() + 1
+        caption = 'Jump to step (%d-%d):' % (first_step, processor.total_steps)
+        self.view.window().show_input_panel(caption, str(first_step), on_done, None, None)
+
+    def is_enabled(self, *args, **kwargs):
+        processor = ExecutionProcessor.read()
+        if not processor:
+            return False
+        return processor.has_more_steps() and not processor.is_playing()
+
+
+class LiveDemoApplyNextStepCommand(sublime_plugin.TextCommand):
+    def run(self, edit):
+        processor = ExecutionProcessor.read()
+        processor.fast_forward(processor.next_step_index() + 1)
+
+    def is_enabled(self, *args, **kwargs):
+        processor = ExecutionProcessor.read()
+        if not processor:
+            return False
+        return processor.has_more_steps() and not processor.is_playing()
+
+
 class LiveDemoStopCommand(sublime_plugin.TextCommand):
     def run(self, edit):
         ExecutionProcessor.read().stop()
@@ -93,24 +210,74 @@ class LiveDemoStopCommand(sublime_plugin.TextCommand):
 
 
 class LiveDemoPlaySubCommand(sublime_plugin.TextCommand):
+    FRAME_DURATION = 16  # instructions due within one frame are played in one edit
+
     def run(self, edit):
         self.helper = SublimeTextHelpers(edit)
         processor = ExecutionProcessor.read()
         if processor is None:
             return
         instruction = processor.next_instruction()
-        if instruction:
-            self.execute_instruction(instruction, processor.step_progress())
-        else:
+        if not instruction:
+            processor.save()
             self.helper.set_status(self.view, '')
+            return
 
-    def execute_instruction(self, instruction, progress):
         target_view = self.view
-        command, delay = instruction[:2]
-        randomness_factor = 2 * random.random()
-        delay = int(delay * randomness_factor)
+        # Instructions are due at times counted from the start of the step,
+        # each delay is waited before its instruction. Those due before the
+        # end of this frame are played now.
+        now = processor.timeline_now()
+        self.timed = processor.instructions.timed
+        self.pending_selection = 0
+        self.pending_text = []
+        while instruction:
+            target_view = self.execute_instruction(target_view, instruction)
+            following = processor.peek_instruction()
+            if not following:
+                break
+            processor.timeline_due += self.instruction_delay(following)
+            if processor.timeline_due - now >= self.FRAME_DURATION or instruction[0] in (ExecutionProcessor.OPEN,
+                                                                                          ExecutionProcessor.SAVE):
+                break
+            instruction = processor.next_instruction()
+        self.flush_pending(target_view)
+
+        total_chars = 20
+        full_chars = min(int(processor.step_progress() * total_chars), total_chars)
+        message = 'Step progress: |' + '#' * full_chars + '-' * (total_chars - full_chars) + '|'
+        self.helper.set_status(target_view, message)
+        frame_delay = max(0, int(processor.timeline_due - processor.timeline_now()))
+        sublime.set_timeout(lambda: target_view.run_command("live_demo_play_sub"), frame_delay)
+
+    def flush_pending(self, target_view):
+        # consecutive selections and typed characters are merged into single changes
+        if self.pending_selection:
+            self.helper.increase_selection(target_view, self.pending_selection)
+            self.pending_selection = 0
+        if self.pending_text:
+            self.helper.write(target_view, ''.join(self.pending_text))
+            self.pending_text = []
+
+    def instruction_delay(self, instruction):
+        delay = instruction[1]
+        if not self.timed:
+            delay = int(delay * 2 * random.random())
+        return delay
+
+    def execute_instruction(self, target_view, instruction):
+        command = instruction[0]
         args = instruction[2:]
 
+        if command == ExecutionProcessor.SELECT:
+            self.pending_selection += 1
+            return target_view
+        if command == ExecutionProcessor.INSERT:
+            character, = args
+            self.pending_text.append(character)
+            return target_view
+        self.flush_pending(target_view)
+
         if command == ExecutionProcessor.OPEN:
             filename, = args
             target_view = self.helper.open_file_tab(filename)
@@ -120,107 +287,6 @@ class LiveDemoPlaySubCommand(sublime_plugin.TextCommand):
         elif command == ExecutionProcessor.SAVE:
             # Don't know why, but run directly saves file, but leaves "not saved" icon
             sublime.set_timeout(lambda: target_view.run_command("save"))
-        elif command == ExecutionProcessor.SELECT:
-            self.helper.increase_selection(target_view)
         elif command == ExecutionProcessor.DELETE:
             self.helper.erase_selection(target_view)
-        elif command == ExecutionProcessor.INSERT:
-            character, = args
-            self.helper.write(target_view, character)
-
-        total_chars = 20
-        full_chars = int(progress * total_chars)
-        message = 'Step progress: |' + '#' * full_chars + '-' * (total_chars - full_chars) + '|'
-        self.helper.set_status(target_view, message)
-        sublime.set_timeout(lambda: target_view.run_command("live_demo_play_sub"), delay)
-
-
-class ExecutionProcessor(StatefulProcessor):
-    __VERSION__ = 1
-    STATE_FILE_KEY = 'sublime-live-demo-execution'
-
-    OPEN = 1    # open tabe file with give path, args: delay, filename
-    MOVE = 2    # move cursor to position, args: delay, position
-    SAVE = 3    # save file, args: delay
-    SELECT = 4  # selects next character, args: delay
-    DELETE = 5  # delete next character, or selection, args: delay
-    INSERT = 6  # insert character, args: delay, character
-
-    DEFAULT_DELAY = 70
-
-    def __init__(self, filename):
-        recording = ldml.parse(filename)
-        self.filename = filename
-        self.recording = recording
-        self.current_step = None
-        self.instructions = None
-        self.changes = None
-        self.total_steps = len(recording.steps)
-        self.step_completed_instructions = None
-        self.step_total_instructions = None
-
-    def next_step(self, step=None):
-        if self.current_step is None:
-            self.current_step = 0
-        else:
-            self.current_step = self.current_step + 1
-        step = self.recording.steps[self.current_step]
-
-        filepath = os.path.join(ExecutionProcessor.get_base_dir(), step.filename)
-        basedir = os.path.dirname(filepath)
-        if not os.path.exists(basedir):
-            os.makedirs(basedir)
-
-        if step.clear:
-            with open(filepath, 'w'):
-                pass
-            init_text = ''
-        else:
-            with open(filepath, 'r') as f:
-                init_text = f.read()
-        self.instructions = deque([(self.OPEN, self.DEFAULT_DELAY, step.filename)])
-        self.instructions.extend(self.prepare_instructions(step, init_text))
-        self.step_completed_instructions = 0
-        self.step_total_instructions = len(self.instructions)
-
-    def prepare_instructions(self, step, init_text):
-        instructions = []
-        changes = step.process_changes(init_text)
-
-        for start, end, replacement in changes:
-            instructions.append((self.MOVE, self.DEFAULT_DELAY, start))
-            instructions.extend([(self.SELECT, self.DEFAULT_DELAY / 2)] * (end - start - 1))
-            # hold selection before removal
-            instructions.append((self.SELECT, self.DEFAULT_DELAY * 10))
-            instructions.append((self.DELETE, self.DEFAULT_DELAY))
-            if step.method == ldml.LDMLStep.PASTE:
-                instructions.append((self.INSERT, self.DEFAULT_DELAY, replacement))
-            else:
-                for c in replacement:
-                    instructions.append((self.INSERT, self.DEFAULT_DELAY, c))
-        instructions.append((self.SAVE, self.DEFAULT_DELAY))
-        return instructions
-
-    def next_instruction(self):
-        try:
-            return self.instructions.popleft()
-        except IndexError:
-            return
-        finally:
-            self.step_completed_instructions = self.step_completed_instructions + 1
-            self.save()
-
-    def step_progress(self):
-        return float(self.step_completed_instructions) / self.step_total_instructions
-
-    def has_more_steps(self):
-        if self.current_step is None:
-            return True
-        return self.current_step + 1 < len(self.recording.steps)
-
-    def reset(self):
-        self.current_step = None
-        self.save()
-
-    def stop(self):
-        self.delete()
+        return target_view
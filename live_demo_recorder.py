@@ -1,12 +1,149 @@
 import codecs
+import copy
 import os.path
 import shutil
 import tempfile
+import time
 
+import sublime
 import sublime_plugin
 
 from . import ldml
-from .helpers import SublimeTextHelpers, StatefulProcessor
+from .diff_match_patch import text_buffer
+from .engine import text_hash
+from .helpers import SublimeTextHelpers
+from .state import FileCache, StatefulProcessor
+
+
+# Patches of recorded changes, keyed by both file texts and diff settings,
+# as steps are often cancelled and recorded again with the same content.
+PATCHES_CACHE = FileCache('sublime-live-demo-patches', max_entries=32)
+
+
+# Edits being recorded, by path of the changed file.
+EDIT_CAPTURES = {}
+
+
+class EditCapture(object):
+    """Edits made to a file while its step is recorded.
+
+    Edits are found as they're made, by comparing a part of the view's text
+    around the cursors with the text before the change, and kept as (start,
+    end, replacement) tuples in coordinates of the text with the previous
+    edits made, along with the times they were made at. Edits outside of
+    the compared part are missed, so the captured text has to be checked
+    against the file when recording stops.
+    """
+    MAX_DELAY = 1000  # ms, longer pauses between edits are shortened to it
+
+    def __init__(self, text):
+        self.original = text
+        self.text = text_buffer(text)  # None once an edit couldn't be captured
+        self.edits = []
+        self.times = [time.monotonic()]
+
+    def update(self, size, start, window):
+        """Records the edit found in window, the part of the changed text
+        starting at start. size is the length of the changed text."""
+        if self.text is None:
+            return
+        old_end = start + len(window) - (size - len(self.text))
+        if old_end < start:
+            # more text inserted than compared
+            self.text = None
+            return
+        old = self.text[start:old_end]
+        prefix = ldml.dmp.diff_commonPrefix(old, window)
+        if prefix == len(old) == len(window):
+            return
+        suffix = min(ldml.dmp.diff_commonSuffix(old, window), min(len(old), len(window)) - prefix)
+        edit = (start + prefix, old_end - suffix, window[prefix:len(window) - suffix])
+        self.text.splice(*edit)
+        self.edits.append(edit)
+        self.times.append(time.monotonic())
+
+    def matches(self, text):
+        """Returns True if all edits leading to text were captured."""
+        return self.text is not None and self.text == text
+
+    def timing(self):
+        """Returns milliseconds between the edits, the first one counted
+        from the start of recording, so each delay is waited before its
+        edit when played."""
+        return [min(self.MAX_DELAY, int(round((time - previous) * 1000)))
+                for previous, time in zip(self.times, self.times[1:])]
+
+    def hunks(self):
+        """Coalesces edits into separate changed parts of the text.
+
+        Returns list of (start, end, new start, new end) tuples, parts of
+        the original text and what they became in the current one, in order.
+        """
+        hunks = []
+        for start, end, replacement in self.edits:
+            # Hunks touching the edit are merged with it, the ones after it shifted.
+            first = 0
+            shift = 0
+            while first < len(hunks) and hunks[first][3] < start:
+                shift += (hunks[first][3] - hunks[first][2]) - (hunks[first][1] - hunks[first][0])
+                first += 1
+            last = first
+            low, high = start, end
+            merged_shift = shift
+            while last < len(hunks) and hunks[last][2] <= end:
+                low = min(low, hunks[last][2])
+                high = max(high, hunks[last][3])
+                merged_shift += (hunks[last][3] - hunks[last][2]) - (hunks[last][1] - hunks[last][0])
+                last += 1
+            delta = len(replacement) - (end - start)
+            hunk = (low - shift, high - merged_shift, low, high + delta)
+            hunks[first:] = [hunk] + [(start1, end1, start2 + delta, end2 + delta)
+                                      for start1, end1, start2, end2 in hunks[last:]]
+        return hunks
+
+    def patches(self, dmp):
+        """Makes patches of the edits, diffing only the changed parts, in the
+        diff mode of dmp."""
+        diffs = []
+        position = 0
+        for start, end, new_start, new_end in self.hunks():
+            if start > position:
+                diffs.append((dmp.DIFF_EQUAL, self.original[position:start]))
+            diffs.extend(dmp.diff_main(self.original[start:end], self.text[new_start:new_end], True))
+            position = end
+        if position < len(self.original):
+            diffs.append((dmp.DIFF_EQUAL, self.original[position:]))
+        dmp.diff_cleanupMerge(diffs)
+        if len(diffs) > 2:
+            dmp.diff_cleanupSemantic(diffs)
+            dmp.diff_cleanupEfficiency(diffs)
+        return dmp.patch_make(self.original, diffs)
+
+
+def recording_dmp():
+    """Returns diff_match_patch set up as the settings say."""
+    s = sublime.load_settings("Live Demo.sublime-settings")
+    dmp = copy.copy(ldml.dmp)
+    dmp.Diff_Mode = s.get('diff_mode', 'line')
+    dmp.Diff_Algorithm = s.get('diff_algorithm', 'myers')
+    return dmp
+
+
+def make_patches(old_content, new_content, capture=None):
+    """Diffs a recorded change in the diff mode set in the settings, only
+    the changed parts if its edits were captured."""
+    dmp = recording_dmp()
+    key = PATCHES_CACHE.make_key(
+        text_hash(old_content), text_hash(new_content), dmp.Diff_Mode, dmp.Diff_Algorithm,
+        dmp.Diff_Timeout, dmp.Diff_EditCost, dmp.Patch_Margin, dmp.Match_MaxBits)
+    patches = PATCHES_CACHE.get(key)
+    if patches is None:
+        if capture is not None:
+            patches = capture.patches(dmp)
+        else:
+            patches = dmp.patch_make(old_content, new_content)
+        PATCHES_CACHE.put(key, patches)
+    return patches
 
 
 class LiveDemoStartRecordingStepCommand(sublime_plugin.TextCommand):
@@ -24,6 +161,7 @@ class LiveDemoStartRecordingStepCommand(sublime_plugin.TextCommand):
         processor = RecordingProcessor.read()
         relative_filename = os.path.relpath(filename, helper.get_base_dir())
         processor.start_recording(relative_filename, filename_base)
+        EDIT_CAPTURES[filename] = EditCapture(helper.view_content(self.view))
 
     def is_enabled(self, *args, **kwargs):
         processor = RecordingProcessor.read()
@@ -39,14 +177,20 @@ class LiveDemoStopRecordingStepCommand(sublime_plugin.TextCommand):
         helper = SublimeTextHelpers(edit)
         processor = RecordingProcessor.read()
 
+        recording_filepath = os.path.join(helper.get_base_dir(), processor.recording_file_name)
         with open(processor.recording_file_path_before_change) as f:
             old_content = f.read()
-        recording_filepath = os.path.join(helper.get_base_dir(), processor.recording_file_name)
         with codecs.open(recording_filepath, 'r', 'utf-8') as f:
             new_content = f.read()
-
-        diffs = ldml.dmp.patch_make(old_content, new_content)
-        import remote_pdb; rp = remote_pdb.set_trace(host='0.0.0.0', port=4444)
+        capture = EDIT_CAPTURES.get(recording_filepath)
+        timing = None
+        if capture is not None and capture.matches(new_content):
+            timing = capture.timing()
+        else:
+            # Edits weren't all captured (plugin was reloaded, or made away
+            # from the cursors), file copy is diffed.
+            capture = None
+        diffs = make_patches(old_content, new_content, capture)
         if not diffs:
             helper.error_message('No changes found in file.')
             return
@@ -54,15 +198,23 @@ class LiveDemoStopRecordingStepCommand(sublime_plugin.TextCommand):
         method = 'TYPE'  # ask method: PASTE/TYPE
         clear = False  # ask clear file if exists: file
 
-        processor.record_step(diffs, method, clear)
+        step = ldml.LDMLStep(processor.recording_file_name, diffs, method, clear, timing)
 
-        if processor.filename:
-            with open(processor.filename, 'w') as f:
-                f.write(processor.recording.dump())
-        else:
-            view = helper.get_view_by_id(processor.view_id)
-            helper.clear_and_write(view, processor.recording.dump())
+        try:
+            if processor.filename:
+                ldml.append_step(processor.filename, step)
+            else:
+                view = helper.get_view_by_id(processor.view_id)
+                tail = helper.view_tail(view, ldml.RECORDING_END_MAX_LENGTH)
+                replaced_length, text = ldml.append_step_text(tail, step)
+                helper.replace_tail(view, replaced_length, text)
+        except (ValueError, IOError, OSError) as e:
+            # recording goes on, so the step can be saved once the output file is fixed
+            helper.error_message('Error saving step to output file.\n\n%s' % e)
+            return
+        processor.record_step()
 
+        EDIT_CAPTURES.pop(recording_filepath, None)
         os.unlink(processor.recording_file_path_before_change)
         processor.stop_recording()
 
@@ -78,6 +230,8 @@ class LiveDemoStopRecordingStepCommand(sublime_plugin.TextCommand):
 class LiveDemoCancelRecordingStepCommand(sublime_plugin.TextCommand):
     def run(self, edit):
         processor = RecordingProcessor.read()
+        helper = SublimeTextHelpers(edit)
+        EDIT_CAPTURES.pop(os.path.join(helper.get_base_dir(), processor.recording_file_name), None)
         # TODO: copy_content recording.recording_file_path_before_change to recording.recording_file_path_before_change
         # TODO: unlink recording.recording_file_path_before_change
         os.unlink(processor.recording_file_path_before_change)
@@ -86,7 +240,7 @@ class LiveDemoCancelRecordingStepCommand(sublime_plugin.TextCommand):
             'Recording has been cancelled\n\n' 'All your changes since started '
             'has been rejected. You can use Sublime undo command if you need.'
         )
-        SublimeTextHelpers(edit).message_dialog(message)
+        helper.message_dialog(message)
 
     def is_enabled(self, *args, **kwargs):
         processor = RecordingProcessor.read()
@@ -95,6 +249,23 @@ class LiveDemoCancelRecordingStepCommand(sublime_plugin.TextCommand):
         return bool(processor.recording_file_name)
 
 
+class LiveDemoEditCaptureListener(sublime_plugin.EventListener):
+    WINDOW = 4096  # characters compared around the cursors
+
+    def on_modified(self, view):
+        capture = EDIT_CAPTURES.get(view.file_name())
+        if capture is None:
+            return
+        # Text is changed at the cursors, inserted text ends at them, so only
+        # text around them is compared (it's copied from the editor).
+        size = view.size()
+        inserted = max(0, size - len(capture.text)) if capture.text is not None else 0
+        selection = view.sel()
+        start = max(0, min(region.begin() for region in selection) - self.WINDOW - inserted)
+        end = min(size, max(region.end() for region in selection) + self.WINDOW)
+        capture.update(size, start, view.substr(sublime.Region(start, end)))
+
+
 class LiveDemoRecordToNewFileCommand(sublime_plugin.TextCommand):
     def run(self, edit):
         helper = SublimeTextHelpers(edit)
@@ -103,7 +274,7 @@ class LiveDemoRecordToNewFileCommand(sublime_plugin.TextCommand):
         processor = RecordingProcessor(view=new_view)
         # TODO: add event on_save to replace view_id to filename
         processor.save()
-        helper.clear_and_write(new_view, processor.recording.dump())
+        helper.clear_and_write(new_view, ldml.LDML().dump())
 
     def is_enabled(self, *args, **kwargs):
         return not bool(RecordingProcessor.read())
@@ -121,7 +292,7 @@ class LiveDemoRecordToOpenedFileCommand(sublime_plugin.TextCommand):
         else:
             processor.save()
             msg = 'Loaded %d steps.\n\nNew recorded steps will be added to this file.'
-            helper.message_dialog(msg % len(processor.recording.steps))
+            helper.message_dialog(msg % processor.total_steps)
 
     def is_enabled(self, *args, **kwargs):
         return not bool(RecordingProcessor.read())
@@ -144,19 +315,20 @@ class RecordingProcessor(StatefulProcessor):
     view_id = None
     recording_file_name = None
     recording_file_path_before_change = None
-    recording = None
+    total_steps = 0
 
     def __init__(self, filename=None, view=None):
         assert filename or view
         if view:
             self.view_id = view.id()
-            self.recording = ldml.LDML()
         else:
             self.filename = filename
-            self.recording = ldml.parse(filename)
+            # recorded steps are appended to the file, only their count is kept
+            self.total_steps = len(ldml.parse(filename).steps)
 
-    def record_step(self, diffs, method, clear):
-        self.recording.add_step(self.recording_file_name, diffs, method, clear)
+    def record_step(self):
+        """Counts a step once it's been added to the output file."""
+        self.total_steps += 1
 
     def start_recording(self, filename, filepath_before_change):
         self.recording_file_name = filename
@@ -0,0 +1,154 @@
+import hashlib
+import os
+import os.path
+import pickle
+import stat
+import tempfile
+import time
+
+
+class StatefulProcessor(object):
+    __VERSION__ = None
+    STATE_FILE_KEY = None
+    FLUSH_INTERVAL = 5  # seconds between state file writes done by flush()
+
+    # Live processors keyed by state file path (one per project base dir),
+    # so commands don't have to unpickle the state file on every call.
+    _sessions = {}
+    _flushed_at = 0
+
+    @classmethod
+    def get_base_dir(cls):
+        # imported here, so processors can be used without the editor
+        import sublime
+        return sublime.active_window().folders()[0]
+
+    @classmethod
+    def state_filepath(cls):
+        base_dir = cls.get_base_dir()
+        return os.path.join(tempfile.gettempdir(), cls.STATE_FILE_KEY) + hashlib.md5(base_dir.encode('utf-8')).hexdigest()
+
+    def save(self):
+        state_filepath = self.state_filepath()
+        self._sessions[state_filepath] = self
+        pickle.dump(self, open(state_filepath, "wb"))
+        self._flushed_at = time.time()
+
+    def flush(self):
+        if time.time() - self._flushed_at > self.FLUSH_INTERVAL:
+            self.save()
+
+    def delete(self):
+        self._sessions.pop(self.state_filepath(), None)
+        try:
+            os.unlink(self.state_filepath())
+        except:
+            pass
+
+    def validate(self):
+        return True
+
+    @classmethod
+    def read(cls):
+        state_filepath = cls.state_filepath()
+        obj = cls._sessions.get(state_filepath)
+        if obj is not None:
+            if obj.validate():
+                return obj
+            del cls._sessions[state_filepath]
+        try:
+            obj = pickle.load(open(state_filepath, "rb"))
+            if obj.__VERSION__ != cls.__VERSION__:
+                raise Exception('Version mismatch')
+            if obj.validate():
+                cls._sessions[state_filepath] = obj
+                return obj
+        except:
+            pass
+
+
+class FileCache(object):
+    """Content addressed LRU cache kept in the temp dir, one pickle per entry.
+
+    Entries are looked up by keys made with make_key, so cached values
+    survive plugin reloads and editor restarts. Lookups since the cache was
+    created are counted in hits and misses.
+
+    Temp dir is shared by all users, so the cache directory is per user and
+    entries are only read from it if nobody else could have written them.
+    """
+    def __init__(self, name, max_entries):
+        if hasattr(os, 'getuid'):
+            name = '%s-%d' % (name, os.getuid())
+        self.directory = os.path.join(tempfile.gettempdir(), name)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(*parts):
+        return hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+    def entry_filepath(self, key):
+        return os.path.join(self.directory, key)
+
+    def is_private(self):
+        """Creates the cache directory accessible only by the user, returns
+        False if it exists but isn't."""
+        try:
+            os.mkdir(self.directory, 0o700)
+        except OSError:
+            pass  # already exists
+        try:
+            info = os.lstat(self.directory)
+        except OSError:
+            return False
+        if not stat.S_ISDIR(info.st_mode):
+            return False
+        if not hasattr(os, 'getuid'):
+            # Windows, temp dir is in the user's profile
+            return True
+        return info.st_uid == os.getuid() and not info.st_mode & 0o077
+
+    def get(self, key):
+        if not self.is_private():
+            self.misses += 1
+            return
+        filepath = self.entry_filepath(key)
+        try:
+            with open(filepath, 'rb') as f:
+                value = pickle.load(f)
+            # modification time is used to track recently used entries
+            os.utime(filepath, None)
+        except:
+            self.misses += 1
+            return
+        self.hits += 1
+        return value
+
+    def stats(self):
+        return 'hits: %d, misses: %d' % (self.hits, self.misses)
+
+    def put(self, key, value):
+        if not self.is_private():
+            return
+        filepath = self.entry_filepath(key)
+        tmp_filepath = '%s.%d.tmp' % (filepath, os.getpid())
+        with open(tmp_filepath, 'wb') as f:
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filepath, filepath)
+        self.evict()
+
+    def evict(self):
+        entries = [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory) if not name.endswith('.tmp')
+        ]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=os.path.getmtime)
+        for filepath in entries[:len(entries) - self.max_entries]:
+            try:
+                os.unlink(filepath)
+            except:
+                pass